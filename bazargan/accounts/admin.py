@@ -3,12 +3,16 @@ from django.contrib.admin.options import ModelAdmin
 from django.contrib.auth.admin import UserAdmin
 from django.contrib.auth import get_user_model
 from django.contrib.sessions.models import Session
+from django.db.models import OuterRef, Subquery
 
-from .models import Profile
+from common.mixins import ExportCSVMixin
+from common.paginators import EstimatedCountPaginator
+
+from .models import Profile, UserSession
 
 User = get_user_model()
 
-class CustomUserAdmin(UserAdmin):
+class CustomUserAdmin(ExportCSVMixin, UserAdmin):
     """
     Custom admin panel for user management with add and change forms plus password
     """
@@ -16,7 +20,11 @@ class CustomUserAdmin(UserAdmin):
     model = User
     list_display = ("pk", "email", "is_superuser", "is_active", "is_verified")
     list_filter = ("is_superuser", "is_active", "is_verified")
-    searching_fields = ("email",)
+    # the unique index on email serves prefix searches
+    search_fields = ("email__startswith",)
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+    export_fields = ("id", "email", "type", "is_active", "is_verified", "is_staff", "is_superuser", "created_date", "last_login")
     ordering = ("email",)
 
     fieldsets = (
@@ -71,16 +79,60 @@ class CustomUserAdmin(UserAdmin):
 
 class CustomProfileAdmin(ModelAdmin):
     list_display = ("pk", "user", "first_name", "last_name", "phone_number")
-    searching_fields = ("user", "first_name", "last_name", "phone_number")
+    list_select_related = ("user",)
+    search_fields = ("user__email__startswith", "phone_number__startswith")
+    autocomplete_fields = ("user",)
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
 
 admin.site.register(Profile, CustomProfileAdmin)
 admin.site.register(User, CustomUserAdmin)
 
 
 class SessionAdmin(admin.ModelAdmin):
+    """
+    Sessions by expiry, paged over the `expire_date` index with an estimated
+    total. The payload is only decoded on a session's own page. A user id
+    or email as search term finds the user's sessions through
+    `UserSession`, anything else is a session key prefix.
+    """
+    list_display = ('session_key', 'user', 'expire_date')
+    ordering = ('-expire_date',)
+    fields = ('session_key', 'user', 'expire_date', '_session_data')
+    readonly_fields = fields
+    search_fields = ('session_key__startswith',)
+    search_help_text = 'User id, user email or the start of a session key'
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+
+    def get_queryset(self, request):
+        user_sessions = UserSession.objects.filter(session_key=OuterRef('session_key'))
+        queryset = super().get_queryset(request).annotate(
+            user_email=Subquery(user_sessions.values('user__email')[:1])
+        )
+        if request.resolver_match and request.resolver_match.url_name.endswith('_changelist'):
+            queryset = queryset.defer('session_data')
+        return queryset
+
+    def get_search_results(self, request, queryset, search_term):
+        search_term = search_term.strip()
+        if search_term.isdigit():
+            user_sessions = UserSession.objects.filter(user_id=search_term)
+        elif '@' in search_term:
+            user_sessions = UserSession.objects.filter(user__email=search_term)
+        else:
+            return super().get_search_results(request, queryset, search_term)
+        return queryset.filter(session_key__in=user_sessions.values('session_key')), False
+
+    def has_add_permission(self, request):
+        return False
+
+    @admin.display(description='user')
+    def user(self, obj):
+        return obj.user_email or '-'
+
+    @admin.display(description='session data')
     def _session_data(self, obj):
         return obj.get_decoded()
-    list_display = ('session_key', '_session_data', 'expire_date')
-    readonly_fields = ('_session_data',)
 
 admin.site.register(Session, SessionAdmin)
@@ -0,0 +1,44 @@
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.contrib.auth.backends import ModelBackend
+from django.core.cache import caches
+from django.db import transaction
+
+
+KEY_PREFIX = "auth-user:"
+
+
+def _cache():
+    return caches[settings.AUTH_USER_CACHE_ALIAS]
+
+
+def _key(user_id):
+    return f"{KEY_PREFIX}{user_id}"
+
+
+def forget_user(user_id):
+    """
+    Drop the cached user once the current transaction commits, so the
+    next request reads the committed row.
+    """
+    transaction.on_commit(lambda: _cache().delete(_key(user_id)))
+
+
+class CachedModelBackend(ModelBackend):
+    """
+    `ModelBackend` keeping the users it resolves for `request.user` in the
+    shared cache, profile included, so authenticated requests need no user
+    or profile query. Django still checks the session hash against the
+    cached password hash; saving a user or profile, which a password
+    change does, drops the cached copy (see `accounts.signals`).
+    """
+
+    def get_user(self, user_id):
+        cache = _cache()
+        user = cache.get(_key(user_id))
+        if user is None:
+            user = get_user_model()._default_manager.select_related("profile").filter(pk=user_id).first()
+            if user is None:
+                return None
+            cache.set(_key(user_id), user, settings.AUTH_USER_CACHE_TIMEOUT)
+        return user if self.user_can_authenticate(user) else None
@@ -129,9 +129,12 @@ class ActivationOtpEmail(BaseTemplateEmail):
     def get_context_data(self):
         context = super().get_context_data()
         otp = context.get("otp")
-        user = context.get("user")
-        context["uid"] = utils.encode_uid(user.pk)
-        context["token"] = activation_token_generator.make_token(user)
+        # only the user the email was meant for, never the request's: a
+        # pending sign-up has no user to link to yet, only the code
+        user = context["user"] = self.context.get("user")
+        if not self.context.get("pending") and user is not None:
+            context["uid"] = utils.encode_uid(user.pk)
+            context["token"] = activation_token_generator.make_token(user)
         context['code'] = otp['code']
         context['timeout'] = otp['instance'].timeout
         return context
@@ -9,6 +9,9 @@ from django.core.validators import RegexValidator
 from django.db import transaction
 
 from otp.models import AuthOTP, UserAuthOTP
+from otp.verification import verify_otp, consume_otp
+
+from .registration import verify_registration, complete_registration
 
 
 User = get_user_model()
@@ -22,15 +25,55 @@ class CheckActiveUserForm(forms.Form):
 
     def save(self):
         """
-        Make sure the email belongs to a user.
-        If not, create a new user.
+        The user the email belongs to, None for an email that has no user
+        yet. Users are only created once their OTP is verified, see
+        `accounts.registration`.
         """
         email = self.cleaned_data.get("email")
-        user, _ = User.objects.get_or_create(email=email)
-        return user
+        return User.objects.filter(email=email).first()
+
+
+class OTPVerificationMixin:
+    """
+    Verify the code in `otp_field` against the user's OTP for `otp_reason`
+    with a single query. `self.user` and `self.user_auth_otp` are set for
+    `save()`, which consumes the OTP.
+    """
+    otp_reason = None
+    otp_field = "otp"
+    otp_error = "otp_invalid"
+
+    def __init__(self, *args, **kwargs):
+        self.user = None
+        self.user_auth_otp = None
+        super().__init__(*args, **kwargs)
 
+    def clean(self):
+        email = self.cleaned_data.get("email")
+        code = self.cleaned_data.get(self.otp_field)
+        if email and code:
+            self.user_auth_otp = verify_otp(email, self.otp_reason, code)
+        if self.user_auth_otp is None:
+            raise ValidationError(
+                self.error_messages[self.otp_error],
+                code=self.otp_error,
+            )
+        self.user = self.user_auth_otp.user
+        return super().clean()
 
-class ReceiveOTPForPasswordResetForm(forms.Form):
+    def add_otp_error(self):
+        """
+        Report an OTP that a concurrent request used up between `clean()`
+        and `save()` the same way as a wrong one.
+        """
+        self.add_error(None, ValidationError(
+            self.error_messages[self.otp_error],
+            code=self.otp_error,
+        ))
+
+
+class ReceiveOTPForPasswordResetForm(OTPVerificationMixin, forms.Form):
+    otp_reason = UserAuthOTP.OTPReasons.FORGOT_PASSWORD
     error_messages = {
         'otp_invalid': _("OTP is invalid"),
     }
@@ -46,47 +89,15 @@ class ReceiveOTPForPasswordResetForm(forms.Form):
         )
     ])
 
-    def __init__(self, *args, **kwargs):
-        self.user = None
-        super().__init__(*args, **kwargs)
-
-    def clean(self):
-        verified = False
-        email = self.cleaned_data.get("email")
-        otp = self.cleaned_data.get("otp")
-        try:
-            user: User = User.objects.get(email=email)
-            self.user = user
-            user_auth_otp = UserAuthOTP.objects.get(
-                user=user, reason=UserAuthOTP.OTPReasons.FORGOT_PASSWORD
-            )
-            verified = AuthOTP.verify_otp(user_auth_otp.otp, int(otp))
-        except (User.DoesNotExist, UserAuthOTP.DoesNotExist):
-            raise ValidationError(
-                self.error_messages["otp_invalid"],
-                code="otp_invalid",
-            )
-
-        if not verified:
-            raise ValidationError(
-                self.error_messages["otp_invalid"],
-                code="otp_invalid",
-            )
-        return super().clean()
-
-    @transaction.atomic
     def save(self):
-        user_auth_otp = UserAuthOTP.create_otp_for_user(
-            self.user, UserAuthOTP.OTPReasons.FORGOT_PASSWORD_TOKEN
-        )
-        UserAuthOTP.objects.get(
-            user=self.user,
-            reason=UserAuthOTP.OTPReasons.FORGOT_PASSWORD,
-        ).delete()
-        return {"code": user_auth_otp["complete_otp"]["code"]}
+        otp = consume_otp(self.user_auth_otp, rotate_to=UserAuthOTP.OTPReasons.FORGOT_PASSWORD_TOKEN)
+        return {"code": otp["code"]}
 
 
-class PasswordResetCompleteForm(forms.Form):
+class PasswordResetCompleteForm(OTPVerificationMixin, forms.Form):
+    otp_reason = UserAuthOTP.OTPReasons.FORGOT_PASSWORD_TOKEN
+    otp_field = "code"
+    otp_error = "request_invalid"
     error_messages = {
         "password_mismatch": _("The two password fields didn’t match."),
         "request_invalid": _("Password reset request invalid"),
@@ -117,10 +128,6 @@ class PasswordResetCompleteForm(forms.Form):
         strip=False,
         help_text=_("Enter the same password as before, for verification."),
     )
-    
-    def __init__(self, *args, **kwargs):
-        self.user = None
-        super().__init__(*args, **kwargs)
 
     def clean_password2(self):
         password1 = self.cleaned_data.get("password1")
@@ -132,7 +139,6 @@ class PasswordResetCompleteForm(forms.Form):
             )
         return password2
 
-
     def _post_clean(self):
         super()._post_clean()
         # Validate the password after self.instance is updated with form data
@@ -144,45 +150,17 @@ class PasswordResetCompleteForm(forms.Form):
             except ValidationError as error:
                 self.add_error("password2", error)
 
-
-    def clean(self):
-        verified = False
-        email = self.cleaned_data.get("email")
-        code = self.cleaned_data.get("code")
-        try:
-            user: User = User.objects.get(email=email)
-            self.user = user
-            user_auth_otp = UserAuthOTP.objects.get(
-                user=user, reason=UserAuthOTP.OTPReasons.FORGOT_PASSWORD_TOKEN
-            )
-            verified = AuthOTP.verify_otp(user_auth_otp.otp, int(code))
-        except (User.DoesNotExist, UserAuthOTP.DoesNotExist) as e:
-            raise ValidationError(
-                self.error_messages["request_invalid"],
-                code="request_invalid",
-            )
-
-        if not verified:
-            raise ValidationError(
-                self.error_messages["request_invalid"],
-                code="request_invalid",
-            )
-
-        return super().clean()
-
     @transaction.atomic
     def save(self):
         user = self.user
         user.set_password(self.cleaned_data['password1'])
         user.save()
-        user_auth_otp = UserAuthOTP.objects.get(
-            user=user, reason=UserAuthOTP.OTPReasons.FORGOT_PASSWORD_TOKEN
-        )
-        user_auth_otp.delete()
+        consume_otp(self.user_auth_otp)
         return user
 
 
-class ReceiveOTPForActivationForm(forms.Form):
+class ReceiveOTPForActivationForm(OTPVerificationMixin, forms.Form):
+    otp_reason = UserAuthOTP.OTPReasons.ACTIVATE_USER
     error_messages = {
         'otp_invalid': _("OTP is invalid"),
     }
@@ -199,52 +177,34 @@ class ReceiveOTPForActivationForm(forms.Form):
         max_length=254,
     )
 
-    def __init__(self, *args, **kwargs):
-        self.user = None
-        super().__init__(*args, **kwargs)
-
     def clean(self):
-        verified = False
+        # an email without a user may have a pending sign-up instead
         email = self.cleaned_data.get("email")
-        otp = self.cleaned_data.get("otp")
-        try:
-            user: User = User.objects.get(email=email)
-            self.user = user
-            user_auth_otp = UserAuthOTP.objects.get(
-                user=user, reason=UserAuthOTP.OTPReasons.ACTIVATE_USER
-            )
-            verified = AuthOTP.verify_otp(user_auth_otp.otp, int(otp))
-        except (User.DoesNotExist, UserAuthOTP.DoesNotExist):
-            raise ValidationError(
-                self.error_messages["otp_invalid"],
-                code="otp_invalid",
-            )
-
-        if not verified:
-            raise ValidationError(
-                self.error_messages["otp_invalid"],
-                code="otp_invalid",
-            )
+        code = self.cleaned_data.get(self.otp_field)
+        self.pending = bool(email and code) and verify_registration(email, code)
+        if self.pending:
+            return self.cleaned_data
         return super().clean()
 
     @transaction.atomic
     def save(self):
+        if self.pending:
+            user = complete_registration(self.cleaned_data["email"])
+            otp = UserAuthOTP.create_otp_for_user(user, UserAuthOTP.OTPReasons.ACTIVE_USER_PASSWORD)
+            return {"code": otp["complete_otp"]["code"]}
+
         # mark the user as verified
         user = self.user
         user.mark_as_verified()
 
-        user_auth_otp = UserAuthOTP.create_otp_for_user(
-            user, UserAuthOTP.OTPReasons.ACTIVE_USER_PASSWORD
-        )
-        UserAuthOTP.objects.get(
-            user=user,
-            reason=UserAuthOTP.OTPReasons.ACTIVATE_USER,
-        ).delete()
-
-        return {"code": user_auth_otp["complete_otp"]["code"]}
+        otp = consume_otp(self.user_auth_otp, rotate_to=UserAuthOTP.OTPReasons.ACTIVE_USER_PASSWORD)
+        return {"code": otp["code"]}
 
 
-class ActivationCompleteForm(forms.Form):
+class ActivationCompleteForm(OTPVerificationMixin, forms.Form):
+    otp_reason = UserAuthOTP.OTPReasons.ACTIVE_USER_PASSWORD
+    otp_field = "code"
+    otp_error = "request_invalid"
     error_messages = {
         "password_mismatch": _("The two password fields didn’t match."),
         "request_invalid": _("Password reset request invalid"),
@@ -276,10 +236,6 @@ class ActivationCompleteForm(forms.Form):
         help_text=_("Enter the same password as before, for verification."),
     )
 
-    def __init__(self, *args, **kwargs):
-        self.user = None
-        super().__init__(*args, **kwargs)
-
     def clean_password2(self):
         password1 = self.cleaned_data.get("password1")
         password2 = self.cleaned_data.get("password2")
@@ -301,40 +257,12 @@ class ActivationCompleteForm(forms.Form):
             except ValidationError as error:
                 self.add_error("password2", error)
 
-    def clean(self):
-        verified = False
-        email = self.cleaned_data.get("email")
-        code = self.cleaned_data.get("code")
-        try:
-            user: User = User.objects.get(email=email)
-            self.user = user
-            user_auth_otp = UserAuthOTP.objects.get(
-                user=user, reason=UserAuthOTP.OTPReasons.ACTIVE_USER_PASSWORD
-            )
-            verified = AuthOTP.verify_otp(user_auth_otp.otp, int(code))
-        except (User.DoesNotExist, UserAuthOTP.DoesNotExist) as e:
-            raise ValidationError(
-                self.error_messages["request_invalid"],
-                code="request_invalid",
-            )
-
-        if not verified:
-            raise ValidationError(
-                self.error_messages["request_invalid"],
-                code="request_invalid",
-            )
-
-        return super().clean()
-
     @transaction.atomic
     def save(self):
         user = self.user
         user.set_password(self.cleaned_data['password1'])
         user.save()
-        user_auth_otp = UserAuthOTP.objects.get(
-            user=user, reason=UserAuthOTP.OTPReasons.ACTIVE_USER_PASSWORD
-        )
-        user_auth_otp.delete()
+        consume_otp(self.user_auth_otp)
         return user
 
 
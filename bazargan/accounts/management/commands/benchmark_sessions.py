@@ -0,0 +1,109 @@
+import statistics
+import time
+import uuid
+from collections import defaultdict
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test import Client, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from ...models import User
+from ...sessions import SESSION_ENGINES
+from ...tokens import activation_token_generator
+from ...utils import encode_uid
+
+
+WRITES = ('INSERT', 'UPDATE', 'DELETE')
+PASSWORD = 'benchmark-Passw0rd'
+
+
+class Command(BaseCommand):
+    help = ('Measure the latency and database writes per request of the login and activation '
+            'flows with every session engine. Creates and deletes its own users, run it '
+            'against a staging database.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--engines', nargs='+', choices=sorted(SESSION_ENGINES), default=list(SESSION_ENGINES))
+        parser.add_argument('--iterations', type=int, default=20,
+                            help='Times each flow is run per engine')
+        parser.add_argument('--fast-hasher', action='store_true',
+                            help='Hash passwords with MD5 so hashing does not hide the session cost')
+
+    def handle(self, *args, **options):
+        overrides = {
+            'ALLOWED_HOSTS': [*settings.ALLOWED_HOSTS, 'testserver'],
+            'RATELIMIT_ENABLED': False,
+            'EMAIL_BACKEND': 'django.core.mail.backends.locmem.EmailBackend',
+        }
+        if options['fast_hasher']:
+            overrides['PASSWORD_HASHERS'] = ['django.contrib.auth.hashers.MD5PasswordHasher']
+
+        self.stdout.write(
+            f"{'engine':<16}{'step':<24}{'median':>10}{'p95':>10}{'writes':>8}{'session':>9}"
+        )
+        with override_settings(**overrides):
+            for engine in options['engines']:
+                with override_settings(SESSION_ENGINE=SESSION_ENGINES[engine]):
+                    self.measure(engine, options['iterations'])
+
+    def measure(self, engine, iterations):
+        # step name: [(seconds, writes, session writes), ...]
+        samples = defaultdict(list)
+        email = f'benchmark-{uuid.uuid4().hex}@example.com'
+        user = User.objects.create_user(email=email, password=PASSWORD, is_verified=True)
+        users = [user]
+        try:
+            for _ in range(iterations):
+                self.login_flow(Client(), email, samples)
+            for _ in range(iterations):
+                new_user = User.objects.create_user(f'benchmark-{uuid.uuid4().hex}@example.com', None)
+                users.append(new_user)
+                self.activation_flow(Client(), new_user, samples)
+        finally:
+            User.objects.filter(pk__in=[user.pk for user in users]).delete()
+
+        for step, results in samples.items():
+            latencies = sorted(seconds * 1000 for seconds, _, _ in results)
+            p95 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))]
+            writes = statistics.mean(count for _, count, _ in results)
+            session_writes = statistics.mean(count for _, _, count in results)
+            self.stdout.write(
+                f'{engine:<16}{step:<24}{statistics.median(latencies):>8.1f}ms{p95:>8.1f}ms'
+                f'{writes:>8.1f}{session_writes:>9.1f}'
+            )
+
+    def login_flow(self, client, email, samples):
+        login_url = reverse('accounts:login')
+        self.request(samples, 'login form', client.get, login_url)
+        self.request(samples, 'login', client.post, login_url, {'username': email, 'password': PASSWORD})
+        self.request(samples, 'page, logged in', client.get, reverse('website:index'))
+        self.request(samples, 'logout', client.post, reverse('accounts:logout'))
+
+    def activation_flow(self, client, user, samples):
+        uidb64 = encode_uid(user.pk)
+        token = activation_token_generator.make_token(user)
+        self.request(samples, 'activation link', client.get,
+                     reverse('accounts:activation_confirm', kwargs={'uidb64': uidb64, 'token': token}))
+        form_url = reverse('accounts:activation_confirm', kwargs={
+            'uidb64': uidb64, 'token': 'activation-set-password',
+        })
+        self.request(samples, 'activation form', client.get, form_url)
+        self.request(samples, 'activation password', client.post, form_url, {
+            'new_password1': PASSWORD, 'new_password2': PASSWORD,
+        })
+        # a session a flow left behind would skew the next one
+        client.logout()
+
+    def request(self, samples, step, method, *args):
+        with CaptureQueriesContext(connection) as queries:
+            started = time.perf_counter()
+            response = method(*args)
+            elapsed = time.perf_counter() - started
+        if response.status_code >= 400:
+            self.stderr.write(f'{step} answered {response.status_code}')
+        writes = [query['sql'] for query in queries if query['sql'].lstrip().upper().startswith(WRITES)]
+        session_writes = [sql for sql in writes if 'django_session' in sql]
+        samples[step].append((elapsed, len(writes), len(session_writes)))
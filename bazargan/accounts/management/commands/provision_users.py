@@ -0,0 +1,43 @@
+from pathlib import Path
+
+from django.core.management.base import BaseCommand, CommandError
+
+from common.bulk import READERS, open_text
+
+from ...provisioning import UserProvisioner
+
+
+class Command(BaseCommand):
+    help = 'Create users with their profiles in bulk from a CSV or JSON file'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path')
+        parser.add_argument('--format', choices=sorted(READERS),
+                            help='Defaults to the file extension')
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument('--hash-workers', type=int, default=None,
+                            help='Processes hashing plain text passwords, defaults to the CPU count')
+
+    def handle(self, *args, **options):
+        path = Path(options['path'])
+        file_format = options['format'] or path.suffix.lstrip('.').lower()
+        if file_format not in READERS:
+            raise CommandError(f'Unknown format {file_format!r}, use --format')
+
+        rows = created = errors = 0
+        elapsed = 0
+        with path.open('rb') as f, UserProvisioner(options['batch_size'], options['hash_workers']) as provisioner:
+            for result in provisioner.run(READERS[file_format](open_text(f))):
+                rows += result.rows
+                created += result.created
+                errors += len(result.errors)
+                elapsed += result.elapsed
+                self.stdout.write(
+                    f'batch {result.number}: {result.rows} rows, {result.created} created, '
+                    f'{len(result.errors)} skipped ({result.rate:.0f} rows/s)'
+                )
+                for record, message in result.errors:
+                    self.stderr.write(f'  row {record}: {message}')
+
+        self.stdout.write(self.style.SUCCESS(
+            f'{rows} rows in {elapsed:.1f}s: {created} users created, {errors} skipped'))
@@ -0,0 +1,78 @@
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.contrib.sessions.models import Session
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from common.retention import delete_in_batches
+from otp.models import AuthOTP
+
+from ...models import User, UserSession
+from ...sessions import sessions_in_db
+
+
+class Command(BaseCommand):
+    help = ('Delete expired sessions and accounts that were never activated, in small batches '
+            'so the tables stay small without long locks')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=settings.RETENTION_BATCH_SIZE)
+        parser.add_argument('--pause', type=float, default=settings.RETENTION_PAUSE,
+                            help='Seconds to wait between batches')
+        parser.add_argument('--time-budget', type=int, default=settings.RETENTION_TIME_BUDGET,
+                            help='Seconds after which no new batch is started')
+        parser.add_argument('--unverified-days', type=int, default=settings.RETENTION_UNVERIFIED_USER_DAYS,
+                            help='Age at which an account that was never activated is deleted')
+
+    def handle(self, *args, **options):
+        started = time.monotonic()
+        self.options = options
+        self.deadline = started + options['time_budget']
+        now = timezone.now()
+
+        if sessions_in_db():
+            self.run('expired sessions', Session.objects.filter(expire_date__lt=now))
+            self.run('logins of gone sessions', UserSession.objects.all(), delete=self.delete_gone_user_sessions)
+        self.never_activated = User.objects.filter(
+            is_verified=False,
+            is_staff=False,
+            is_superuser=False,
+            last_login__isnull=True,
+            created_date__lt=now - timedelta(days=options['unverified_days']),
+            # products and wishlists protect their user
+            products__isnull=True,
+            wishlists__isnull=True,
+        )
+        self.run('accounts never activated', self.never_activated, delete=self.delete_users)
+
+        self.stdout.write(self.style.SUCCESS(f'Done in {time.monotonic() - started:.1f}s'))
+
+    def run(self, name, queryset, delete=None):
+        result = delete_in_batches(
+            queryset,
+            delete=delete,
+            batch_size=self.options['batch_size'],
+            pause=self.options['pause'],
+            deadline=self.deadline,
+        )
+        message = f'{name}: {result.deleted} rows deleted in {result.batches} batches'
+        if not result.finished:
+            message += ', out of time, the next run continues'
+        self.stdout.write(message)
+
+    @staticmethod
+    def delete_gone_user_sessions(session_keys):
+        existing = Session.objects.filter(session_key__in=session_keys).values_list('session_key', flat=True)
+        return UserSession.objects.filter(session_key__in=session_keys).exclude(session_key__in=existing).delete()[0]
+
+    def delete_users(self, pks):
+        # the batch was read before its transaction: lock the users, then
+        # check them again, one may have been activated or got a product
+        # or a wishlist since
+        list(User.objects.select_for_update().filter(pk__in=pks).values_list('pk', flat=True))
+        pks = list(self.never_activated.filter(pk__in=pks).values_list('pk', flat=True))
+        # deleting a user deletes its OTP links but not the OTPs themselves
+        deleted = AuthOTP.objects.filter(userauthotp__user_id__in=pks).delete()[0]
+        return deleted + User.objects.filter(pk__in=pks).delete()[0]
@@ -0,0 +1,19 @@
+# Generated by Django 4.2.30 on 2026-10-18 23:33
+
+import accounts.validators
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='profile',
+            name='phone_number',
+            field=models.CharField(db_index=True, max_length=12, validators=[accounts.validators.validate_iranian_phone_number]),
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 4.2.30 on 2026-10-18 23:46
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0003_usersession'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='user',
+            index=models.Index(condition=models.Q(('is_verified', False)), fields=['id'], name='accounts_user_unverified'),
+        ),
+    ]
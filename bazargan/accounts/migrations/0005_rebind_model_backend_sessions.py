@@ -0,0 +1,20 @@
+from django.db import migrations
+
+
+def rebind_sessions(apps, schema_editor):
+    # ModelBackend was replaced by CachedModelBackend, sessions that still
+    # name it would be logged out
+    from accounts.sessions import rebind_sessions
+    rebind_sessions('django.contrib.auth.backends.ModelBackend', 'accounts.backends.CachedModelBackend')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0004_user_unverified_index'),
+        ('sessions', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.RunPython(rebind_sessions, migrations.RunPython.noop),
+    ]
@@ -35,6 +35,12 @@ class User(AbstractBaseUser, PermissionsMixin):
 
     objects = UserManager()
 
+    class Meta:
+        indexes = [
+            # the retention command walks the users that never activated
+            models.Index(fields=["id"], condition=models.Q(is_verified=False), name="accounts_user_unverified"),
+        ]
+
     def __str__(self):
         return self.email
 
@@ -64,7 +70,7 @@ class Profile(models.Model):
     )
     first_name = models.CharField(max_length=250)
     last_name = models.CharField(max_length=250)
-    phone_number = models.CharField(max_length=12, validators=[validate_iranian_phone_number])
+    phone_number = models.CharField(max_length=12, validators=[validate_iranian_phone_number], db_index=True)
     image = models.ImageField(upload_to='profile/', default='profile/default.jpg')
     # description = models.TextField()
 
@@ -73,3 +79,19 @@ class Profile(models.Model):
 
     def __str__(self):
         return self.user.email
+
+
+class UserSession(models.Model):
+    """
+    Which user a session belongs to, recorded at login so the admin can
+    find a user's sessions without decoding every session. Not a foreign
+    key to the session, expired sessions are deleted in bulk.
+    """
+
+    session_key = models.CharField(max_length=40, primary_key=True)
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name="sessions")
+
+    created_date = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return self.session_key
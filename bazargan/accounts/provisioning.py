@@ -0,0 +1,164 @@
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import django
+from django.contrib.auth.hashers import make_password, identify_hasher
+from django.core.exceptions import ValidationError
+from django.core.validators import validate_email
+from django.db import connections, transaction
+
+from common.bulk import BatchResult, batched
+
+from .models import User, Profile, UserType
+from .validators import validate_iranian_phone_number
+
+
+PROFILE_FIELDS = ("first_name", "last_name", "phone_number")
+
+
+def _init_worker():
+    django.setup()
+    connections.close_all()
+
+
+class UserProvisioner:
+    """
+    Create users together with their profiles in batches, for moving
+    customers over from another platform.
+
+    Rows are dicts with `email` and either `password` (hashed here, in a
+    process pool when `hash_workers` > 1) or `password_hash` (an encoded
+    django hash, stored as is). Rows without either get an unusable
+    password. `first_name`, `last_name`, `phone_number`, `type` and
+    `is_verified` are optional.
+
+    Email uniqueness is left to the database: users are inserted with
+    `ignore_conflicts`, an email that already exists is counted as skipped
+    and keeps its account untouched. Profiles are written in bulk too,
+    since the `post_save` receiver creating them doesn't run for bulk
+    inserts.
+    """
+
+    def __init__(self, batch_size=1000, hash_workers=None):
+        self.batch_size = batch_size
+        self.hash_workers = hash_workers if hash_workers is not None else os.cpu_count()
+        self._executor = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        if self._executor is not None:
+            self._executor.shutdown()
+            self._executor = None
+
+    def hash_passwords(self, passwords):
+        if self.hash_workers > 1 and len(passwords) > 1:
+            if self._executor is None:
+                self._executor = ProcessPoolExecutor(max_workers=self.hash_workers, initializer=_init_worker)
+            chunksize = max(1, len(passwords) // (self.hash_workers * 4))
+            return list(self._executor.map(make_password, passwords, chunksize=chunksize))
+        return [make_password(password) for password in passwords]
+
+    def run(self, rows):
+        for number, (first, batch) in enumerate(batched(rows, self.batch_size), start=1):
+            yield self.provision_batch(number, list(enumerate(batch, start=first)))
+
+    def clean_row(self, row):
+        email = User.objects.normalize_email(str(row.get("email") or "").strip())
+        if not email:
+            raise ValidationError("email is required")
+        validate_email(email)
+
+        password_hash = row.get("password_hash") or None
+        if password_hash:
+            try:
+                identify_hasher(password_hash)
+            except ValueError:
+                raise ValidationError("password_hash is not a known django password hash")
+
+        user_type = row.get("type") or UserType.customer.value
+        if str(user_type).lower() in UserType.__members__:
+            user_type = UserType[str(user_type).lower()].value
+        if str(user_type) not in {str(value) for value in UserType.values}:
+            raise ValidationError(f"unknown type {user_type!r}")
+
+        profile = {name: str(row.get(name) or "").strip() for name in PROFILE_FIELDS}
+        if profile["phone_number"]:
+            validate_iranian_phone_number(profile["phone_number"])
+
+        return {
+            "email": email,
+            "password": row.get("password") or None,
+            "password_hash": password_hash,
+            "type": int(user_type),
+            "is_verified": str(row.get("is_verified", "")).lower() in ("1", "true", "yes"),
+            "profile": profile,
+        }
+
+    def provision_batch(self, number, batch):
+        started = time.perf_counter()
+        result = BatchResult(number=number, rows=len(batch))
+
+        cleaned = {}
+        for record, row in batch:
+            try:
+                values = self.clean_row(row)
+            except ValidationError as e:
+                result.errors.append((record, "; ".join(e.messages)))
+                continue
+            if values["email"] in cleaned:
+                result.errors.append((record, f"duplicate of row {cleaned[values['email']][0]}"))
+                continue
+            cleaned[values["email"]] = (record, values)
+
+        # not worth hashing a password for an account that is kept anyway;
+        # a concurrent insert is still caught by the unique index
+        existing = set(User.objects.filter(email__in=cleaned).values_list("email", flat=True))
+        for email in existing:
+            record, _ = cleaned.pop(email)
+            result.errors.append((record, "a user with this email already exists"))
+
+        # hashing dominates the run time, do it all at once for the batch
+        to_hash = [values for _, values in cleaned.values() if not values["password_hash"]]
+        for values, password_hash in zip(to_hash, self.hash_passwords([values["password"] for values in to_hash])):
+            values["password_hash"] = password_hash
+
+        if cleaned:
+            with transaction.atomic():
+                self.write(cleaned, result)
+
+        result.elapsed = time.perf_counter() - started
+        return result
+
+    def write(self, cleaned, result):
+        User.objects.bulk_create(
+            [
+                User(
+                    email=email,
+                    password=values["password_hash"],
+                    type=values["type"],
+                    is_verified=values["is_verified"],
+                )
+                for email, (_, values) in cleaned.items()
+            ],
+            ignore_conflicts=True,
+        )
+        # one query for the ids of the new rows: a user without a profile
+        # was just inserted (or lost its profile, which is repaired here)
+        user_ids = dict(
+            User.objects.filter(email__in=cleaned, profile__isnull=True).values_list("email", "id")
+        )
+        Profile.objects.bulk_create(
+            [
+                Profile(pk=user_id, user_id=user_id, **cleaned[email][1]["profile"])
+                for email, user_id in user_ids.items()
+            ],
+            ignore_conflicts=True,
+        )
+        result.created = len(user_ids)
+        result.updated = 0
+        for email, (record, _) in cleaned.items():
+            if email not in user_ids:
+                result.errors.append((record, "a user with this email already exists"))
@@ -0,0 +1,64 @@
+import hashlib
+
+from django.conf import settings
+from django.contrib.auth.hashers import make_password
+from django.core.cache import caches
+from django.core.exceptions import ValidationError
+from django.db import transaction
+
+from otp.models import AuthOTP, CompleteOTPType
+
+from .models import User
+
+
+# Sign-ups of unknown emails are held in the shared cache until their OTP
+# is verified, so probing emails writes no `User`, `Profile` or OTP rows.
+# An unverified sign-up simply expires with its OTP.
+KEY_PREFIX = "pending-registration:"
+
+
+def _cache():
+    return caches[settings.PENDING_REGISTRATION_CACHE_ALIAS]
+
+
+def _key(email):
+    return KEY_PREFIX + hashlib.md5(email.encode()).hexdigest()
+
+
+def start_registration(email: str) -> CompleteOTPType:
+    """
+    Hold a sign-up for `email` and return its OTP, only the signed part
+    is stored. Starting again replaces the OTP.
+    """
+    otp = AuthOTP.generate_otp(commit=False)
+    instance = otp["instance"]
+    _cache().set(
+        _key(email),
+        {"uuid": str(instance.uuid), "code": instance.code},
+        timeout=instance.timeout.total_seconds(),
+    )
+    return otp
+
+
+def verify_registration(email: str, code) -> bool:
+    pending = _cache().get(_key(email))
+    if pending is None:
+        return False
+    return AuthOTP.verify_otp(AuthOTP(uuid=pending["uuid"], code=pending["code"]), int(code))
+
+
+@transaction.atomic
+def complete_registration(email: str) -> User:
+    """
+    Create the verified user of a sign-up whose OTP was verified. The
+    sign-up is used up, a second completion raises.
+    """
+    if not _cache().delete(_key(email)):
+        raise ValidationError("OTP is invalid", code="otp_invalid")
+    # the password is set with the next OTP
+    user, created = User.objects.get_or_create(
+        email=email, defaults={"is_verified": True, "password": make_password(None)}
+    )
+    if not created:
+        user.mark_as_verified()
+    return user
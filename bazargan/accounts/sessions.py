@@ -0,0 +1,55 @@
+from importlib import import_module
+
+from django.conf import settings
+from django.contrib.auth import BACKEND_SESSION_KEY
+from django.contrib.sessions.models import Session
+from django.core.cache import caches
+from django.utils import timezone
+
+
+# the SESSION_BACKEND setting names one of these, see core.settings
+SESSION_ENGINES = {
+    name: f'django.contrib.sessions.backends.{name}'
+    for name in ('db', 'cached_db', 'signed_cookies')
+}
+
+# session engines whose sessions are rows of `django_session`
+DB_SESSION_ENGINES = (SESSION_ENGINES['db'], SESSION_ENGINES['cached_db'])
+
+
+def sessions_in_db():
+    """
+    Whether sessions are rows of `django_session`. Signed cookie sessions
+    live in the client and their key is the signed data itself, so there
+    is nothing to record, list or expire on the server.
+    """
+    return settings.SESSION_ENGINE in DB_SESSION_ENGINES
+
+
+def rebind_sessions(old_backend, new_backend, batch_size=500):
+    """
+    Point the logins made through `old_backend` at `new_backend`, so an
+    authentication backend can be dropped without logging everyone out.
+    Only the session data changes, not its expiry. Returns the number of
+    sessions rewritten.
+    """
+    if not sessions_in_db():
+        return 0
+    store_class = import_module(settings.SESSION_ENGINE).SessionStore
+    rebound = 0
+    sessions = (
+        Session.objects.filter(expire_date__gt=timezone.now())
+        .order_by("pk").values_list("session_key", "session_data")
+    )
+    for session_key, session_data in sessions.iterator(chunk_size=batch_size):
+        store = store_class(session_key)
+        data = store.decode(session_data)
+        if data.get(BACKEND_SESSION_KEY) != old_backend:
+            continue
+        data[BACKEND_SESSION_KEY] = new_backend
+        Session.objects.filter(pk=session_key).update(session_data=store.encode(data))
+        if hasattr(store, "cache_key"):
+            # cached_db, the next request reads the rewritten row
+            caches[settings.SESSION_CACHE_ALIAS].delete(store.cache_key)
+        rebound += 1
+    return rebound
@@ -1,7 +1,10 @@
-from django.db.models.signals import post_save
+from django.contrib.auth.signals import user_logged_in, user_logged_out
+from django.db.models.signals import post_save, post_delete
 from django.dispatch import receiver
 
-from .models import User, Profile
+from .backends import forget_user
+from .models import User, Profile, UserSession
+from .sessions import sessions_in_db
 
 
 @receiver(post_save, sender=User)
@@ -12,3 +15,32 @@ def save_profile(sender, instance, created, **kwargs):
     """
     if created:
         Profile.objects.create(user=instance, pk=instance.pk)
+
+
+@receiver(user_logged_in)
+def record_user_session(sender, request, user, **kwargs):
+    # the key of a signed cookie session is its data, there is no row
+    session_key = request.session.session_key
+    if session_key and sessions_in_db():
+        UserSession.objects.update_or_create(session_key=session_key, defaults={"user": user})
+
+
+@receiver(user_logged_out)
+def forget_user_session(sender, request, user, **kwargs):
+    session_key = request.session.session_key
+    if session_key and sessions_in_db():
+        UserSession.objects.filter(session_key=session_key).delete()
+    if user is not None:
+        forget_user(user.pk)
+
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def forget_cached_user(sender, instance, **kwargs):
+    forget_user(instance.pk)
+
+
+@receiver(post_save, sender=Profile)
+@receiver(post_delete, sender=Profile)
+def forget_cached_profile(sender, instance, **kwargs):
+    forget_user(instance.user_id)
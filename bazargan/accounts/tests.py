@@ -1,3 +1,529 @@
-from django.test import TestCase
+import json
+import os
+import tempfile
+from datetime import timedelta
+from io import StringIO
+from unittest import mock
 
-# Create your tests here.
+from django.contrib.auth import BACKEND_SESSION_KEY, authenticate, get_user
+from django.contrib.auth.hashers import MD5PasswordHasher, make_password
+from django.contrib.sessions.models import Session
+from django.core import mail
+from django.core.management import call_command
+from django.test import Client, RequestFactory, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from common.testing import TestCase
+from otp.models import AuthOTP, UserAuthOTP
+from otp.verification import verify_otp
+from shop.models import Product, WishlistProduct
+
+from . import backends, registration
+from .views import INTERNAL_ACTIVATION_TOKEN_COOKIE
+from .management.commands import retention
+from .models import User, Profile, UserType, UserSession
+from .provisioning import UserProvisioner
+from .sessions import SESSION_ENGINES, rebind_sessions, sessions_in_db
+from .tokens import activation_token_generator
+from .utils import encode_uid
+
+
+class AccountsTestCase(TestCase):
+    password = 'Passw0rd!'
+    new_password = 'N3w-Passw0rd!'
+
+    def create_user(self, email='user@example.com', **fields):
+        fields.setdefault('is_verified', True)
+        return User.objects.create_user(email, self.password, **fields)
+
+    def ajax_post(self, name, data):
+        return self.client.post(reverse(name), data, HTTP_X_REQUESTED_WITH='XMLHttpRequest')
+
+
+class UserProvisioningTests(AccountsTestCase):
+    def provision(self, rows, batch_size=100):
+        with UserProvisioner(batch_size=batch_size, hash_workers=1) as provisioner:
+            return list(provisioner.run(iter(rows)))
+
+    def test_users_are_created_with_their_profiles(self):
+        results = self.provision([
+            {'email': 'a@example.com', 'password': 'secret-a', 'first_name': 'Ali', 'phone_number': '09123456789'},
+            {'email': 'b@example.com', 'password_hash': make_password('secret-b'), 'type': 'admin',
+             'is_verified': 'yes'},
+            {'email': 'c@example.com'},
+        ])
+        self.assertEqual((results[0].created, results[0].errors), (3, []))
+
+        a = User.objects.get(email='a@example.com')
+        self.assertTrue(a.check_password('secret-a'))
+        self.assertEqual((a.profile.first_name, a.profile.phone_number), ('Ali', '09123456789'))
+        b = User.objects.get(email='b@example.com')
+        self.assertTrue(b.check_password('secret-b'))
+        self.assertEqual((b.type, b.is_verified), (UserType.admin.value, True))
+        self.assertFalse(User.objects.get(email='c@example.com').has_usable_password())
+        self.assertEqual(Profile.objects.count(), 3)
+
+    def test_duplicate_emails_are_skipped(self):
+        existing = self.create_user('taken@example.com')
+        results = self.provision([
+            {'email': 'taken@example.com', 'password': 'other'},
+            {'email': 'new@example.com'},
+            {'email': 'NEW@example.com'.lower()},
+        ])
+        self.assertEqual(results[0].created, 1)
+        self.assertEqual(sorted(record for record, _ in results[0].errors), [1, 3])
+        existing.refresh_from_db()
+        self.assertTrue(existing.check_password(self.password))
+
+    def test_invalid_rows_are_reported(self):
+        results = self.provision([
+            {'email': 'not-an-email'},
+            {'email': 'a@example.com', 'password_hash': 'plain'},
+            {'email': 'b@example.com', 'phone_number': '12345'},
+            {'email': 'c@example.com', 'type': 'root'},
+            {'email': 'd@example.com'},
+        ], batch_size=2)
+        self.assertEqual([result.created for result in results], [0, 0, 1])
+        self.assertEqual(sum(len(result.errors) for result in results), 4)
+        self.assertEqual(list(User.objects.values_list('email', flat=True)), ['d@example.com'])
+
+    def test_command_reads_json(self):
+        with tempfile.NamedTemporaryFile('w', suffix='.json', delete=False) as f:
+            json.dump([{'email': 'json@example.com', 'first_name': 'Sara'}], f)
+        self.addCleanup(os.remove, f.name)
+        out = StringIO()
+        call_command('provision_users', f.name, hash_workers=1, stdout=out)
+        self.assertIn('1 users created, 0 skipped', out.getvalue())
+        self.assertEqual(Profile.objects.get(user__email='json@example.com').first_name, 'Sara')
+
+
+class UserSessionTests(AccountsTestCase):
+    def test_login_records_the_session_and_logout_forgets_it(self):
+        user = self.create_user()
+        self.client.post(reverse('accounts:login'), {'username': user.email, 'password': self.password})
+        session_key = self.client.session.session_key
+        self.assertEqual(UserSession.objects.get().pk, session_key)
+        self.assertEqual(UserSession.objects.get().user, user)
+
+        self.client.post(reverse('accounts:logout'))
+        self.assertFalse(UserSession.objects.exists())
+
+
+class SessionAdminTests(AccountsTestCase):
+    def setUp(self):
+        super().setUp()
+        self.user = self.create_user()
+        # logged in on a client of its own, logging the admin in flushes the session
+        client = Client()
+        client.login(username=self.user.email, password=self.password)
+        self.session_key = client.session.session_key
+        self.admin = User.objects.create_superuser('admin@example.com', self.password)
+        self.client.force_login(self.admin)
+        self.url = reverse('admin:sessions_session_changelist')
+
+    def search(self, term):
+        response = self.client.get(self.url, {'q': term})
+        self.assertEqual(response.status_code, 200)
+        return {session.session_key for session in response.context['cl'].result_list}
+
+    def test_sessions_are_found_by_user(self):
+        self.assertEqual(self.search(self.user.email), {self.session_key})
+        self.assertEqual(self.search(str(self.user.pk)), {self.session_key})
+        self.assertEqual(self.search('nobody@example.com'), set())
+
+    def test_other_terms_are_session_key_prefixes(self):
+        self.assertEqual(self.search(self.session_key[:8]), {self.session_key})
+
+    def test_changelist_shows_the_user_without_decoding(self):
+        response = self.client.get(self.url)
+        sessions = {session.session_key: session for session in response.context['cl'].result_list}
+        self.assertEqual(sessions[self.session_key].user_email, self.user.email)
+        self.assertIn('session_data', sessions[self.session_key].get_deferred_fields())
+
+    def test_change_page_decodes_the_session(self):
+        response = self.client.get(reverse('admin:sessions_session_change', args=[self.session_key]))
+        self.assertContains(response, '_auth_user_id')
+
+
+def verify_then_use_up(email, reason, code):
+    """`verify_otp` with a concurrent request consuming the OTP right after."""
+    user_auth_otp = verify_otp(email, reason, code)
+    if user_auth_otp is not None:
+        AuthOTP.objects.filter(pk=user_auth_otp.otp_id).delete()
+    return user_auth_otp
+
+
+class PasswordResetOtpTests(AccountsTestCase):
+    def setUp(self):
+        super().setUp()
+        self.user = self.create_user()
+        self.code = UserAuthOTP.create_otp_for_user(
+            self.user, UserAuthOTP.OTPReasons.FORGOT_PASSWORD)['complete_otp']['code']
+
+    def verify(self):
+        return self.ajax_post('accounts:password_reset_otp_verify', {'email': self.user.email, 'otp': self.code})
+
+    def complete(self, code):
+        return self.ajax_post('accounts:password_reset_otp_complete', {
+            'email': self.user.email, 'code': code,
+            'password1': self.new_password, 'password2': self.new_password,
+        })
+
+    def test_reset_with_the_otp(self):
+        response = self.verify()
+        self.assertEqual(response.status_code, 200)
+        response = self.complete(response.json()['data']['code'])
+        self.assertEqual(response.status_code, 200)
+        self.user.refresh_from_db()
+        self.assertTrue(self.user.check_password(self.new_password))
+        self.assertFalse(UserAuthOTP.objects.exists())
+
+    def test_reusing_an_otp_is_a_bad_request(self):
+        token = self.verify().json()['data']['code']
+        response = self.verify()
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json()['data']['errors']['__all__'], ['OTP is invalid'])
+
+        self.assertEqual(self.complete(token).status_code, 200)
+        self.assertEqual(self.complete(token).status_code, 400)
+
+    def test_otp_used_up_after_it_was_verified_is_a_bad_request(self):
+        with mock.patch('accounts.forms.verify_otp', verify_then_use_up):
+            response = self.verify()
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json()['data']['errors']['__all__'], ['OTP is invalid'])
+
+    def test_password_is_kept_when_the_token_was_used_up_meanwhile(self):
+        token = self.verify().json()['data']['code']
+        with mock.patch('accounts.forms.verify_otp', verify_then_use_up):
+            response = self.complete(token)
+        self.assertEqual(response.status_code, 400)
+        self.user.refresh_from_db()
+        self.assertTrue(self.user.check_password(self.password))
+
+    def test_expired_otp_is_a_bad_request(self):
+        AuthOTP.objects.update(expires_at=timezone.now() - timedelta(seconds=1))
+        self.assertEqual(self.verify().status_code, 400)
+
+
+@override_settings(RATELIMIT_ENABLED=True, RATELIMITS={'login': {'ip': (30, 60), 'email': (2, 60)}})
+class LoginRateLimitTests(AccountsTestCase):
+    def login(self, email, ajax=True):
+        headers = {'HTTP_X_REQUESTED_WITH': 'XMLHttpRequest'} if ajax else {}
+        return self.client.post(reverse('accounts:login'), {'username': email, 'password': 'wrong'}, **headers)
+
+    def test_too_many_attempts_for_an_email_get_a_429(self):
+        for _ in range(2):
+            self.assertEqual(self.login('user@example.com').status_code, 400)
+        response = self.login('user@example.com')
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(response['Retry-After'], '30')
+        self.assertEqual(response.json()['status'], 'error')
+
+        self.assertEqual(self.login('other@example.com').status_code, 400)
+        response = self.login('user@example.com', ajax=False)
+        self.assertEqual(response.status_code, 429)
+        self.assertIn('Retry-After', response)
+
+    def test_pages_are_not_throttled(self):
+        for _ in range(3):
+            self.login('user@example.com')
+        self.assertEqual(self.client.get(reverse('accounts:login')).status_code, 200)
+
+
+def verify_then_complete(email, code):
+    """`verify_registration` with a concurrent request completing the sign-up right after."""
+    verified = registration.verify_registration(email, code)
+    if verified:
+        registration.complete_registration(email)
+    return verified
+
+
+class RegistrationTests(AccountsTestCase):
+    email = 'new@example.com'
+
+    def start(self, email=None):
+        response = self.ajax_post('accounts:check_active_user', {'email': email or self.email})
+        self.assertEqual(response.status_code, 200)
+        return mail.outbox[-1]
+
+    def sent_code(self, message):
+        return next(word for word in message.body.split() if word.isdigit() and len(word) == AuthOTP.OTP_LENGTH)
+
+    def verify(self, code):
+        return self.ajax_post('accounts:activation_otp_verify', {'email': self.email, 'otp': code})
+
+    def test_unknown_email_writes_nothing_until_verified(self):
+        message = self.start()
+        self.assertEqual(message.to, [self.email])
+        self.assertNotIn('activate/', message.alternatives[0][0])
+        self.assertFalse(User.objects.exists())
+        self.assertFalse(AuthOTP.objects.exists())
+
+        response = self.verify(self.sent_code(message))
+        self.assertEqual(response.status_code, 200)
+        user = User.objects.get(email=self.email)
+        self.assertTrue(user.is_verified)
+        self.assertFalse(user.has_usable_password())
+
+        response = self.ajax_post('accounts:activation_otp_complete', {
+            'email': self.email, 'code': response.json()['data']['code'],
+            'password1': self.new_password, 'password2': self.new_password,
+        })
+        self.assertEqual(response.status_code, 200)
+        user.refresh_from_db()
+        self.assertTrue(user.check_password(self.new_password))
+
+    def test_wrong_code_creates_no_user(self):
+        code = self.sent_code(self.start())
+        wrong = '1' * AuthOTP.OTP_LENGTH if code != '1' * AuthOTP.OTP_LENGTH else '2' * AuthOTP.OTP_LENGTH
+        self.assertEqual(self.verify(wrong).status_code, 400)
+        self.assertFalse(User.objects.exists())
+
+    def test_sign_up_is_completed_once(self):
+        code = self.sent_code(self.start())
+        self.assertEqual(self.verify(code).status_code, 200)
+        self.assertEqual(self.verify(code).status_code, 400)
+        self.assertEqual(User.objects.count(), 1)
+
+    def test_sign_up_completed_after_it_was_verified_is_a_bad_request(self):
+        code = self.sent_code(self.start())
+        with mock.patch('accounts.forms.verify_registration', verify_then_complete):
+            response = self.verify(code)
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json()['data']['errors']['__all__'], ['OTP is invalid'])
+
+    def test_logged_in_visitor_gets_no_link_for_an_unknown_email(self):
+        visitor = self.create_user('visitor@example.com')
+        self.client.force_login(visitor)
+        message = self.start()
+        self.assertNotIn(encode_uid(visitor.pk), message.body)
+        self.assertNotIn('activate/', message.body)
+        self.assertNotIn('activate/', message.alternatives[0][0])
+
+    def test_unverified_user_gets_a_link_of_their_own(self):
+        user = self.create_user(self.email, is_verified=False)
+        message = self.start()
+        self.assertIn(f'activate/{encode_uid(user.pk)}/', message.alternatives[0][0])
+
+
+class RetentionTests(AccountsTestCase):
+    def create_stale_user(self, email, **fields):
+        user = self.create_user(email, is_verified=False, **fields)
+        User.objects.filter(pk=user.pk).update(created_date=timezone.now() - timedelta(days=30))
+        return user
+
+    def retention(self, **options):
+        out = StringIO()
+        call_command('retention', pause=0, stdout=out, **options)
+        return out.getvalue()
+
+    def test_accounts_never_activated_are_deleted_in_batches(self):
+        stale = [self.create_stale_user(f'stale-{i}@example.com') for i in range(5)]
+        UserAuthOTP.create_otp_for_user(stale[0], UserAuthOTP.OTPReasons.ACTIVATE_USER)
+        kept = [
+            self.create_user('verified@example.com'),
+            self.create_user('recent@example.com', is_verified=False),
+            self.create_stale_user('staff@example.com', is_staff=True),
+        ]
+        seller = self.create_stale_user('seller@example.com')
+        Product.objects.create(user=seller, title='p', slug='p', description='p')
+        wisher = self.create_stale_user('wisher@example.com')
+        WishlistProduct.objects.create(user=wisher, product=Product.objects.get())
+
+        output = self.retention(batch_size=2)
+        # the users with their profiles, the OTP and its link
+        self.assertIn('accounts never activated: 12 rows deleted in 3 batches', output)
+        self.assertEqual(set(User.objects.all()), {*kept, seller, wisher})
+        self.assertFalse(AuthOTP.objects.exists())
+
+    def test_batch_is_checked_again_in_its_transaction(self):
+        user = self.create_stale_user('stale@example.com')
+        activated = self.create_stale_user('activated@example.com')
+        command = retention.Command()
+        command.never_activated = User.objects.filter(is_verified=False, products__isnull=True)
+        # both changed after the batch was read
+        Product.objects.create(user=user, title='p', slug='p', description='p')
+        User.objects.filter(pk=activated.pk).update(is_verified=True)
+        self.assertEqual(command.delete_users([user.pk, activated.pk]), 0)
+        self.assertEqual(User.objects.filter(pk__in=[user.pk, activated.pk]).count(), 2)
+
+    def test_expired_sessions_and_their_logins_are_deleted(self):
+        user = self.create_user()
+        self.client.login(username=user.email, password=self.password)
+        live = self.client.session.session_key
+        other = Client()
+        other.login(username=user.email, password=self.password)
+        Session.objects.filter(pk=other.session.session_key).update(
+            expire_date=timezone.now() - timedelta(seconds=1))
+
+        output = self.retention()
+        self.assertIn('expired sessions: 1 rows deleted in 1 batches', output)
+        self.assertIn('logins of gone sessions: 1 rows deleted in 1 batches', output)
+        self.assertEqual(list(Session.objects.values_list('pk', flat=True)), [live])
+        self.assertEqual(list(UserSession.objects.values_list('pk', flat=True)), [live])
+
+    def test_time_budget_stops_the_run(self):
+        for i in range(3):
+            self.create_stale_user(f'stale-{i}@example.com')
+        output = self.retention(time_budget=0)
+        self.assertIn('out of time, the next run continues', output)
+        self.assertEqual(User.objects.count(), 3)
+
+
+class CachedUserTests(AccountsTestCase):
+    def setUp(self):
+        super().setUp()
+        self.user = self.create_user()
+        self.client.login(username=self.user.email, password=self.password)
+        self.url = reverse('website:index')
+
+    def cached(self):
+        return backends._cache().get(backends._key(self.user.pk))
+
+    def test_request_user_comes_from_the_cache(self):
+        self.client.get(self.url)
+        self.assertEqual(self.cached(), self.user)
+        request = RequestFactory().get(self.url)
+        request.session = self.client.session
+        # the session itself is read before
+        request.session.items()
+        with self.assertNumQueries(0):
+            self.assertEqual(get_user(request), self.user)
+
+    def test_password_change_drops_the_cached_user_and_its_sessions(self):
+        self.client.get(self.url)
+        self.user.set_password(self.new_password)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user.save()
+        self.assertIsNone(self.cached())
+        response = self.client.get(self.url)
+        self.assertFalse(response.wsgi_request.user.is_authenticated)
+
+    def test_profile_change_drops_the_cached_user(self):
+        self.client.get(self.url)
+        profile = self.user.profile
+        profile.first_name = 'Sara'
+        with self.captureOnCommitCallbacks(execute=True):
+            profile.save()
+        self.assertIsNone(self.cached())
+        response = self.client.get(self.url)
+        self.assertEqual(response.wsgi_request.user.profile.first_name, 'Sara')
+
+    def test_failed_login_checks_the_password_once(self):
+        with mock.patch.object(MD5PasswordHasher, 'verify', autospec=True,
+                               side_effect=MD5PasswordHasher.verify) as verify:
+            self.assertIsNone(authenticate(username=self.user.email, password='wrong'))
+        self.assertEqual(verify.call_count, 1)
+
+    def bind_to_model_backend(self):
+        session = self.client.session
+        session[BACKEND_SESSION_KEY] = 'django.contrib.auth.backends.ModelBackend'
+        session.save()
+        self.assertFalse(self.client.get(self.url).wsgi_request.user.is_authenticated)
+        return Session.objects.get(pk=session.session_key)
+
+    def rebind(self):
+        return rebind_sessions('django.contrib.auth.backends.ModelBackend', 'accounts.backends.CachedModelBackend')
+
+    def test_sessions_of_the_replaced_backend_are_rebound(self):
+        session = self.bind_to_model_backend()
+        self.assertEqual(self.rebind(), 1)
+        self.assertEqual(Session.objects.get(pk=session.pk).expire_date, session.expire_date)
+        self.assertEqual(self.client.get(self.url).wsgi_request.user, self.user)
+        self.assertEqual(self.rebind(), 0)
+
+    @override_settings(SESSION_ENGINE=SESSION_ENGINES['cached_db'])
+    def test_cached_sessions_are_rebound(self):
+        self.client.login(username=self.user.email, password=self.password)
+        self.bind_to_model_backend()
+        self.assertEqual(self.rebind(), 1)
+        self.assertEqual(self.client.get(self.url).wsgi_request.user, self.user)
+
+
+class ActivationLinkTests(AccountsTestCase):
+    def setUp(self):
+        super().setUp()
+        self.user = self.create_user(is_verified=False)
+        self.uidb64 = encode_uid(self.user.pk)
+        self.form_url = reverse('accounts:activation_confirm', kwargs={
+            'uidb64': self.uidb64, 'token': 'activation-set-password',
+        })
+
+    def follow_link(self, token=None):
+        token = token or activation_token_generator.make_token(self.user)
+        return self.client.get(reverse('accounts:activation_confirm', kwargs={'uidb64': self.uidb64, 'token': token}))
+
+    def test_link_moves_the_token_to_a_cookie_of_the_form(self):
+        response = self.follow_link()
+        self.assertRedirects(response, self.form_url, fetch_redirect_response=False)
+        cookie = response.cookies[INTERNAL_ACTIVATION_TOKEN_COOKIE]
+        self.assertEqual(cookie['path'], self.form_url)
+        self.assertTrue(cookie['httponly'])
+        self.assertFalse(Session.objects.exists())
+
+        response = self.client.get(self.form_url)
+        self.assertTrue(response.context['validlink'])
+        self.assertFalse(Session.objects.exists())
+
+    def test_form_activates_the_user_and_drops_the_cookie(self):
+        self.follow_link()
+        response = self.client.post(self.form_url, {
+            'new_password1': self.new_password, 'new_password2': self.new_password,
+        })
+        self.assertRedirects(response, reverse('accounts:login'), fetch_redirect_response=False)
+        self.assertEqual(response.cookies[INTERNAL_ACTIVATION_TOKEN_COOKIE].value, '')
+        self.user.refresh_from_db()
+        self.assertTrue(self.user.is_verified)
+        self.assertTrue(self.user.check_password(self.new_password))
+
+        # the token is spent with the new password
+        self.assertFalse(self.client.get(self.form_url).context['validlink'])
+
+    def test_form_needs_the_cookie(self):
+        self.assertFalse(self.client.get(self.form_url).context['validlink'])
+        self.client.cookies[INTERNAL_ACTIVATION_TOKEN_COOKIE] = activation_token_generator.make_token(self.user)
+        self.assertFalse(self.client.get(self.form_url).context['validlink'])
+
+    def test_bad_token_is_an_invalid_link(self):
+        response = self.follow_link('1-bad')
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(response.context['validlink'])
+
+
+class SessionEngineTests(AccountsTestCase):
+    def login(self):
+        user = self.create_user()
+        self.client.post(reverse('accounts:login'), {'username': user.email, 'password': self.password})
+        response = self.client.get(reverse('website:index'))
+        self.assertEqual(response.wsgi_request.user, user)
+
+    def test_sessions_in_db(self):
+        for engine, in_db in (('db', True), ('cached_db', True), ('signed_cookies', False)):
+            with self.subTest(engine), override_settings(SESSION_ENGINE=SESSION_ENGINES[engine]):
+                self.assertIs(sessions_in_db(), in_db)
+
+    @override_settings(SESSION_ENGINE=SESSION_ENGINES['cached_db'])
+    def test_cached_db_sessions_are_recorded(self):
+        self.login()
+        self.assertEqual(Session.objects.count(), 1)
+        self.assertEqual(UserSession.objects.count(), 1)
+
+    @override_settings(SESSION_ENGINE=SESSION_ENGINES['signed_cookies'])
+    def test_signed_cookie_sessions_leave_no_rows(self):
+        self.login()
+        self.client.post(reverse('accounts:logout'))
+        self.assertFalse(Session.objects.exists())
+        self.assertFalse(UserSession.objects.exists())
+        output = StringIO()
+        call_command('retention', pause=0, stdout=output)
+        self.assertNotIn('sessions', output.getvalue())
+
+    def test_benchmark_cleans_up_after_itself(self):
+        output = StringIO()
+        call_command('benchmark_sessions', engines=['db', 'signed_cookies'], iterations=1, fast_hasher=True,
+                     stdout=output, stderr=output)
+        self.assertIn('signed_cookies', output.getvalue())
+        self.assertNotIn('answered', output.getvalue())
+        self.assertFalse(User.objects.exists())
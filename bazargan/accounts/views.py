@@ -1,3 +1,4 @@
+from django.conf import settings
 from django.contrib.auth import views as auth_views, login
 from django.urls import reverse_lazy
 from django.views.decorators.debug import sensitive_post_parameters
@@ -12,10 +13,11 @@ from django.contrib.messages.views import SuccessMessageMixin
 from django.utils.translation import gettext_lazy as _
 from django.contrib.auth.forms import SetPasswordForm
 
-from common.mixins import AjaxRequestMixin
+from common.mixins import AjaxRequestMixin, RateLimitMixin
 from otp.models import UserAuthOTP
 
 from .email import PasswordResetOtpEmail, ActivationOtpEmail
+from .registration import start_registration
 from .forms import AuthenticationForm, PasswordResetForm, CheckActiveUserForm, \
     ReceiveOTPForPasswordResetForm, PasswordResetCompleteForm, ReceiveOTPForActivationForm, \
     ActivationCompleteForm
@@ -24,29 +26,43 @@ from .tokens import activation_token_generator
 
 User = get_user_model()
 
+# users logged in without `authenticate()`, after an OTP or activation link
+LOGIN_BACKEND = 'accounts.backends.CachedModelBackend'
 
-class CheckActiveUserView(AjaxRequestMixin, BaseFormView):
+
+def send_activation_otp(request, email, user):
+    """
+    Email an activation OTP, for an email without a user as a pending
+    sign-up that creates the user once the OTP is verified.
+    """
+    if user is None:
+        otp = start_registration(email)
+    else:
+        otp = UserAuthOTP.create_otp_for_user(
+            user, UserAuthOTP.OTPReasons.ACTIVATE_USER
+        )['complete_otp']
+    ActivationOtpEmail(request, {"otp": otp, "user": user, "pending": user is None}).send([email])
+    return otp
+
+
+class CheckActiveUserView(RateLimitMixin, AjaxRequestMixin, BaseFormView):
+    ratelimit = 'check-user'
     form_class = CheckActiveUserForm
     def form_valid(self, form):
         user = form.save()
 
-        if not user.is_user_verified:
-            # Generate OTP valid for 5 minutes (default in AuthOTP)
-            user_auth_otp = UserAuthOTP.create_otp_for_user(
-                user, UserAuthOTP.OTPReasons.ACTIVATE_USER
-            )
-            # Send OTP to user's registered email
-            ActivationOtpEmail(
-                self.request,
-                {"otp": user_auth_otp['complete_otp'], "user": user}
-            ).send([user.email])
+        if user is None or not user.is_user_verified:
+            email = form.cleaned_data['email']
+            # Generate OTP valid for 2 minutes (default in AuthOTP) and
+            # send it to the email
+            otp = send_activation_otp(self.request, email, user)
 
             return self.ajax_success_response(data={
                 'action': 'get-token',
                 'new_user': True,
-                'email': user.email,
-                'user_id': user.id,
-                'timer': user_auth_otp['complete_otp']['instance'].TIMEOUT
+                'email': email,
+                'user_id': user.id if user else None,
+                'timer': otp['instance'].TIMEOUT
             })
         else:
             return self.ajax_response(data={
@@ -59,7 +75,7 @@ class CheckActiveUserView(AjaxRequestMixin, BaseFormView):
         return super().form_invalid(form)
 
 
-INTERNAL_ACTIVATION_SESSION_TOKEN = '_activation_token'
+INTERNAL_ACTIVATION_TOKEN_COOKIE = 'activation_token'
 
 
 class ActivationLinkConfirmView(SuccessMessageMixin, FormView):
@@ -70,6 +86,8 @@ class ActivationLinkConfirmView(SuccessMessageMixin, FormView):
     post_activate_login = False
     success_url = reverse_lazy("accounts:login")
     activation_url_token = "activation-set-password"
+    # how long the set password form may stay open
+    token_cookie_max_age = 60 * 60
     success_message = _('you registered successfully. please login!')
     template_name = 'accounts/activation_confirm.html'
     form_class = SetPasswordForm
@@ -88,23 +106,39 @@ class ActivationLinkConfirmView(SuccessMessageMixin, FormView):
         if self.user is not None:
             token = kwargs["token"]
             if token == self.activation_url_token:
-                session_token = self.request.session.get(INTERNAL_ACTIVATION_SESSION_TOKEN)
+                cookie_token = self.request.get_signed_cookie(
+                    INTERNAL_ACTIVATION_TOKEN_COOKIE,
+                    default=None,
+                    salt=INTERNAL_ACTIVATION_TOKEN_COOKIE,
+                    max_age=self.token_cookie_max_age,
+                )
                 if not self.user.is_user_verified and \
-                        self.token_generator.check_token(self.user, session_token):
+                        self.token_generator.check_token(self.user, cookie_token):
                     self.validlink = True
                     return super().dispatch(*args, **kwargs)
             else:
                 if self.token_generator.check_token(self.user, token):
-                    # Store the token in the session and redirect to the
+                    # Store the token in a cookie and redirect to the
                     # activation form at a URL without the token. That
                     # avoids the possibility of leaking the token in the
-                    # HTTP Referer header.
-
-                    self.request.session[INTERNAL_ACTIVATION_SESSION_TOKEN] = token
+                    # HTTP Referer header. A signed cookie scoped to the
+                    # form rather than the session, so following the link
+                    # writes no session row.
                     redirect_url = self.request.path.replace(
                         token, self.activation_url_token
                     )
-                    return HttpResponseRedirect(redirect_url)
+                    response = HttpResponseRedirect(redirect_url)
+                    response.set_signed_cookie(
+                        INTERNAL_ACTIVATION_TOKEN_COOKIE,
+                        token,
+                        salt=INTERNAL_ACTIVATION_TOKEN_COOKIE,
+                        max_age=self.token_cookie_max_age,
+                        path=redirect_url,
+                        secure=settings.SESSION_COOKIE_SECURE,
+                        httponly=True,
+                        samesite="Lax",
+                    )
+                    return response
 
         # Display the "Password reset unsuccessful" page.
         return self.render_to_response(self.get_context_data())
@@ -137,10 +171,13 @@ class ActivationLinkConfirmView(SuccessMessageMixin, FormView):
         if not self.user.is_user_verified:
             user.mark_as_verified()
 
-        del self.request.session[INTERNAL_ACTIVATION_SESSION_TOKEN]
         if self.post_activate_login:
-            login(self.request, user)
-        return super().form_valid(form)
+            login(self.request, user, backend=LOGIN_BACKEND)
+        response = super().form_valid(form)
+        response.delete_cookie(
+            INTERNAL_ACTIVATION_TOKEN_COOKIE, path=self.request.path, samesite="Lax"
+        )
+        return response
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
@@ -148,7 +185,9 @@ class ActivationLinkConfirmView(SuccessMessageMixin, FormView):
         return context
 
 
-class LoginView(SuccessMessageMixin, AjaxRequestMixin, auth_views.LoginView):
+class LoginView(RateLimitMixin, SuccessMessageMixin, AjaxRequestMixin, auth_views.LoginView):
+    ratelimit = 'login'
+    ratelimit_email_field = 'username'
     form_class = AuthenticationForm
     template_name = "accounts/login.html"
     redirect_authenticated_user = True
@@ -174,7 +213,7 @@ class LogoutView(SuccessMessageMixin, auth_views.LogoutView):
     success_message = _('logged out successfully!')
 
 
-class PasswordResetOtpView(SuccessMessageMixin, AjaxRequestMixin, BaseFormView):
+class PasswordResetOtpView(RateLimitMixin, SuccessMessageMixin, AjaxRequestMixin, BaseFormView):
     """
     Handles password reset functionality by sending a one-time password (OTP) via email.
 
@@ -184,6 +223,7 @@ class PasswordResetOtpView(SuccessMessageMixin, AjaxRequestMixin, BaseFormView):
         3. Sends the OTP to user's registered email
         4. Handles both regular and AJAX responses
     """
+    ratelimit = 'otp-send'
     form_class = PasswordResetForm
     success_message = _('otp sent successfully!')
 
@@ -215,11 +255,16 @@ class PasswordResetOtpView(SuccessMessageMixin, AjaxRequestMixin, BaseFormView):
         return super().form_invalid(form)
 
 
-class ReceiveOTPForPasswordReset(AjaxRequestMixin, BaseFormView):
+class ReceiveOTPForPasswordReset(RateLimitMixin, AjaxRequestMixin, BaseFormView):
+    ratelimit = 'otp-verify'
     form_class = ReceiveOTPForPasswordResetForm
 
     def form_valid(self, form):
-        code = form.save()
+        try:
+            code = form.save()
+        except ValidationError:
+            form.add_otp_error()
+            return self.form_invalid(form)
         return self.ajax_success_response(data=code)
 
     def form_invalid(self, form):
@@ -228,12 +273,17 @@ class ReceiveOTPForPasswordReset(AjaxRequestMixin, BaseFormView):
         return super().form_invalid(form)
 
 
-class PasswordResetOtpCompleteView(AjaxRequestMixin, BaseFormView):
+class PasswordResetOtpCompleteView(RateLimitMixin, AjaxRequestMixin, BaseFormView):
+    ratelimit = 'otp-verify'
     form_class = PasswordResetCompleteForm
 
     def form_valid(self, form):
-        user = form.save()
-        login(self.request, user)
+        try:
+            user = form.save()
+        except ValidationError:
+            form.add_otp_error()
+            return self.form_invalid(form)
+        login(self.request, user, backend=LOGIN_BACKEND)
         return self.ajax_success_response(data={
             'email': user.email,
             'user_id': user.id,
@@ -245,28 +295,21 @@ class PasswordResetOtpCompleteView(AjaxRequestMixin, BaseFormView):
         return super().form_invalid(form)
 
 
-class ActivationOtpView(AjaxRequestMixin, BaseFormView):
-    form_class = PasswordResetForm
+class ActivationOtpView(RateLimitMixin, AjaxRequestMixin, BaseFormView):
+    ratelimit = 'otp-send'
+    form_class = CheckActiveUserForm
     success_message = _('activation otp successfully sent.')
 
     def form_valid(self, form):
-        # Extract user from validated form data
-        user = form.user
-        # Generate OTP valid for 5 minutes (default in AuthOTP)
-        user_auth_otp = UserAuthOTP.create_otp_for_user(
-            user, UserAuthOTP.OTPReasons.ACTIVATE_USER
-        )
-        # Send OTP to user's registered email
-        ActivationOtpEmail(
-            self.request,
-            {"otp": user_auth_otp['complete_otp'], "user": user}
-        ).send([user.email])
+        # the user, or None for a pending sign-up
+        user = form.save()
+        otp = send_activation_otp(self.request, form.cleaned_data['email'], user)
 
         if self.is_ajax():
             return self.ajax_success_response(
                 message=self.success_message,
                 data={
-                    'timer': user_auth_otp['complete_otp']['instance'].TIMEOUT
+                    'timer': otp['instance'].TIMEOUT
                 }
             )
         return super().form_valid(form)
@@ -277,11 +320,16 @@ class ActivationOtpView(AjaxRequestMixin, BaseFormView):
         return super().form_invalid(form)
 
 
-class ReceiveOTPForActivationView(AjaxRequestMixin, BaseFormView):
+class ReceiveOTPForActivationView(RateLimitMixin, AjaxRequestMixin, BaseFormView):
+    ratelimit = 'otp-verify'
     form_class = ReceiveOTPForActivationForm
 
     def form_valid(self, form):
-        code = form.save()
+        try:
+            code = form.save()
+        except ValidationError:
+            form.add_otp_error()
+            return self.form_invalid(form)
         return self.ajax_success_response(data=code)
 
     def form_invalid(self, form):
@@ -290,12 +338,17 @@ class ReceiveOTPForActivationView(AjaxRequestMixin, BaseFormView):
         return super().form_invalid(form)
 
 
-class ActivationCompleteView(AjaxRequestMixin, BaseFormView):
+class ActivationCompleteView(RateLimitMixin, AjaxRequestMixin, BaseFormView):
+    ratelimit = 'otp-verify'
     form_class = ActivationCompleteForm
 
     def form_valid(self, form):
-        user = form.save()
-        login(self.request, user)
+        try:
+            user = form.save()
+        except ValidationError:
+            form.add_otp_error()
+            return self.form_invalid(form)
+        login(self.request, user, backend=LOGIN_BACKEND)
         return self.ajax_success_response(data={
             'email': user.email,
             'user_id': user.id,
@@ -0,0 +1,85 @@
+import csv
+import io
+import json
+from dataclasses import dataclass, field
+
+
+def iter_csv(file):
+    yield from csv.DictReader(file)
+
+
+def iter_json(file, chunk_size=64 * 1024):
+    """
+    Yield the objects of a JSON array (or JSON lines) one by one without
+    reading the whole file.
+    """
+    decoder = json.JSONDecoder()
+    buffer = ""
+    started = False
+    eof = False
+    while True:
+        buffer = buffer.lstrip()
+        if not started and buffer.startswith("["):
+            buffer = buffer[1:]
+            started = True
+            continue
+        buffer = buffer.lstrip(",").lstrip()
+        if buffer.startswith("]"):
+            return
+        if buffer:
+            try:
+                obj, end = decoder.raw_decode(buffer)
+            except json.JSONDecodeError:
+                if eof:
+                    raise
+            else:
+                yield obj
+                buffer = buffer[end:]
+                continue
+        if eof:
+            return
+        chunk = file.read(chunk_size)
+        eof = not chunk
+        buffer += chunk
+
+
+READERS = {
+    "csv": iter_csv,
+    "json": iter_json,
+    "jsonl": iter_json,
+}
+
+
+def open_text(file):
+    # uploaded and `open(..., "rb")` files are binary, `utf-8-sig` eats
+    # the BOM spreadsheet programs write
+    if isinstance(file, io.TextIOBase):
+        return file
+    return io.TextIOWrapper(file, encoding="utf-8-sig", newline="")
+
+
+@dataclass
+class BatchResult:
+    """What happened to one batch of a bulk import."""
+    number: int
+    rows: int = 0
+    created: int = 0
+    updated: int = 0
+    errors: list = field(default_factory=list)
+    elapsed: float = 0
+
+    @property
+    def rate(self):
+        return self.rows / self.elapsed if self.elapsed else 0
+
+
+def batched(rows, size):
+    """Yield (first row number, list of rows) for every `size` rows."""
+    batch = []
+    for number, row in enumerate(rows, start=1):
+        batch.append(row)
+        if len(batch) >= size:
+            yield number - len(batch) + 1, batch
+            batch = []
+    if batch:
+        yield number - len(batch) + 1, batch
@@ -0,0 +1,197 @@
+import threading
+import time
+
+from django.conf import settings
+from django.contrib.staticfiles.storage import staticfiles_storage
+from django.core.cache import cache, caches
+
+
+VERSION_KEY_PREFIX = "version:"
+
+
+def _version_key(namespace):
+    return f"{VERSION_KEY_PREFIX}{namespace}"
+
+
+def _initial_version():
+    # a stamp lost to eviction restarts from the clock, never from a value
+    # an older fragment may still be cached under.
+    return time.time_ns() // 1000
+
+
+def _version_cache():
+    return caches[settings.VERSION_CACHE_ALIAS]
+
+
+def get_versions(*namespaces):
+    """
+    Current version stamp of each namespace, fetched in one round trip.
+    Cache keys built from these stamps go stale as soon as a namespace is
+    bumped, in every worker, without deleting anything. The stamps are
+    read from the shared cache directly: a copy in the local tier of the
+    default cache would keep other workers on the old stamp.
+    """
+    version_cache = _version_cache()
+    keys = {_version_key(namespace): namespace for namespace in namespaces}
+    versions = version_cache.get_many(keys)
+    for key in keys.keys() - versions.keys():
+        version_cache.add(key, _initial_version(), timeout=None)
+        versions[key] = version_cache.get(key)
+    return [versions[_version_key(namespace)] for namespace in namespaces]
+
+
+def bump_version(namespace):
+    version_cache = _version_cache()
+    key = _version_key(namespace)
+    try:
+        return version_cache.incr(key)
+    except ValueError:
+        version = _initial_version()
+        version_cache.set(key, version, timeout=None)
+        return version
+
+
+def fragment_cache_version():
+    """
+    Version of the cached template fragments. Fragments embed fingerprinted
+    `{% static %}` URLs, so the hash of the staticfiles manifest is part of
+    it and a deploy with new static files starts from fresh fragments;
+    `FRAGMENT_CACHE_VERSION` is bumped by hand for template-only changes.
+    """
+    manifest_hash = getattr(staticfiles_storage, "manifest_hash", "")
+    return f"{settings.FRAGMENT_CACHE_VERSION}.{manifest_hash}"
+
+
+class SingleFlightStats:
+    """
+    Per-process hit/miss/stale/wait counters of `get_or_compute()`, added to
+    shared counters every `flush_interval` seconds so all workers show up in
+    `manage.py cache_stats`.
+
+    Like the lock, the shared counters rely on `add()` and `incr()` being
+    atomic, which they are with Redis or Memcached.
+    """
+    EVENTS = ("hit", "miss", "stale", "wait")
+    KEY_PREFIX = "single-flight-stats:"
+
+    def __init__(self, flush_interval=10):
+        self.flush_interval = flush_interval
+        self._counts = {}
+        self._lock = threading.Lock()
+        self._flushed_at = time.monotonic()
+
+    @classmethod
+    def _key(cls, name, event):
+        return f"{cls.KEY_PREFIX}{name}:{event}"
+
+    @classmethod
+    def _name_key(cls, name):
+        return f"{cls.KEY_PREFIX}name:{name}"
+
+    @classmethod
+    def _slot_key(cls, index):
+        return f"{cls.KEY_PREFIX}names:{index}"
+
+    @classmethod
+    def _slots_key(cls):
+        return f"{cls.KEY_PREFIX}names"
+
+    def record(self, name, event):
+        with self._lock:
+            self._counts[(name, event)] = self._counts.get((name, event), 0) + 1
+            due = time.monotonic() - self._flushed_at >= self.flush_interval
+        if due:
+            self.flush()
+
+    def _register(self, shared, name):
+        """
+        List a name for `collect()` the first time any worker flushes it.
+        Only the worker whose `add()` wins appends it, to a slot taken with
+        `incr()`, so no worker overwrites another's list.
+        """
+        if not shared.add(self._name_key(name), 1, timeout=None):
+            return
+        shared.add(self._slots_key(), 0, timeout=None)
+        index = shared.incr(self._slots_key())
+        shared.set(self._slot_key(index), name, timeout=None)
+
+    def flush(self):
+        with self._lock:
+            counts, self._counts = self._counts, {}
+            self._flushed_at = time.monotonic()
+        if not counts:
+            return
+        shared = caches[settings.SINGLE_FLIGHT_CACHE_ALIAS]
+        for name in {name for name, _ in counts}:
+            self._register(shared, name)
+        for (name, event), count in counts.items():
+            key = self._key(name, event)
+            if not shared.add(key, count, timeout=None):
+                shared.incr(key, count)
+
+    def collect(self):
+        """
+        The shared counters, `{name: {event: count}}`.
+        """
+        self.flush()
+        shared = caches[settings.SINGLE_FLIGHT_CACHE_ALIAS]
+        slots = [self._slot_key(index) for index in range(1, shared.get(self._slots_key(), 0) + 1)]
+        stats = {}
+        for name in sorted(set(shared.get_many(slots).values())):
+            keys = [self._key(name, event) for event in self.EVENTS]
+            values = shared.get_many(keys)
+            stats[name] = {event: values.get(key, 0) for event, key in zip(self.EVENTS, keys)}
+        return stats
+
+
+single_flight_stats = SingleFlightStats()
+
+
+def get_or_compute(key, compute, timeout, stale_timeout=60, lock_timeout=30, wait_timeout=5, name=None):
+    """
+    Return the cached value of `key`, computing it with `compute()` when it
+    is missing or older than `timeout` seconds, with only one worker at a
+    time doing the computation.
+
+    The value is kept `stale_timeout` seconds past its freshness. While one
+    worker holds the lock in the shared cache and recomputes, the others
+    keep serving that stale value; when there is none yet they wait up to
+    `wait_timeout` seconds for the result before computing it themselves.
+
+    The lock is an `add()` on `SINGLE_FLIGHT_CACHE_ALIAS`, which is only
+    atomic with Redis or Memcached. With the file based or local memory
+    caches it is best effort: two workers may occasionally both compute.
+    """
+    name = name or key
+    lock_key = f"{key}:lock"
+    entry = cache.get(key)
+    if entry is not None and entry["fresh_until"] > time.time():
+        single_flight_stats.record(name, "hit")
+        return entry["value"]
+
+    shared = caches[settings.SINGLE_FLIGHT_CACHE_ALIAS]
+    locked = shared.add(lock_key, 1, timeout=lock_timeout)
+    if not locked:
+        if entry is not None:
+            single_flight_stats.record(name, "stale")
+            return entry["value"]
+        single_flight_stats.record(name, "wait")
+        deadline = time.monotonic() + wait_timeout
+        while time.monotonic() < deadline:
+            time.sleep(0.05)
+            entry = cache.get(key)
+            if entry is not None:
+                return entry["value"]
+
+    single_flight_stats.record(name, "miss")
+    try:
+        value = compute()
+        cache.set(
+            key,
+            {"value": value, "fresh_until": time.time() + timeout},
+            timeout + stale_timeout,
+        )
+    finally:
+        if locked:
+            shared.delete(lock_key)
+    return value
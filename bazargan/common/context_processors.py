@@ -0,0 +1,26 @@
+from django.conf import settings
+
+from .cache import fragment_cache_version
+
+
+def shared_cache(request):
+    """
+    Pages rendered for the shared cache must not depend on the session:
+    the csrf token and the flash messages are blanked out here and fetched
+    by the page from `shop:session-state` instead.
+    """
+    if not getattr(request, "shared_cache_page", False):
+        return {"shared_cache_page": False}
+    return {
+        "shared_cache_page": True,
+        # the value `{% csrf_token %}` renders as nothing for
+        "csrf_token": "NOTPROVIDED",
+        "messages": [],
+    }
+
+
+def fragment_cache(request):
+    return {
+        "fragment_cache_timeout": settings.FRAGMENT_CACHE_TIMEOUT,
+        "fragment_cache_version": fragment_cache_version(),
+    }
@@ -0,0 +1,13 @@
+def shared_cacheable(view):
+    """
+    Mark a view (function or class based) as safe to be stored by a shared
+    cache when it is rendered for an anonymous visitor.
+    See `common.middleware.AnonymousSharedCacheMiddleware`.
+    """
+    view.shared_cacheable = True
+    return view
+
+
+def is_shared_cacheable(view_func):
+    view = getattr(view_func, "view_class", view_func)
+    return getattr(view, "shared_cacheable", False)
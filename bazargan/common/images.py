@@ -0,0 +1,175 @@
+import logging
+import os
+import posixpath
+from concurrent.futures import ProcessPoolExecutor
+from io import BytesIO
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from PIL import Image, ImageOps
+
+
+logger = logging.getLogger(__name__)
+
+DERIVATIVES_DIR = "derivatives"
+ORIENTATION_TAG = 0x0112
+
+# file extension and Pillow save arguments of each derivative format
+FORMATS = {
+    "webp": ("webp", {"format": "WEBP", "quality": 80, "method": 4}),
+    "jpeg": ("jpg", {"format": "JPEG", "quality": 82, "optimize": True, "progressive": True}),
+}
+
+_executor = None
+
+
+def derivatives_dir(name):
+    """
+    Derivatives live next to the original:
+    `product/img/shoe.jpg` -> `product/img/derivatives/shoe/`.
+    """
+    directory, filename = posixpath.split(name)
+    return posixpath.join(directory, DERIVATIVES_DIR, posixpath.splitext(filename)[0])
+
+
+def derivative_name(name, width, fmt):
+    return posixpath.join(derivatives_dir(name), f"{width}w.{FORMATS[fmt][0]}")
+
+
+def _cache_key(name):
+    return f"image-derivatives:{name}"
+
+
+def _is_fresh(storage, name, derivative):
+    try:
+        return storage.get_modified_time(derivative) >= storage.get_modified_time(name)
+    except (OSError, NotImplementedError):
+        return False
+
+
+def generate_derivatives(name, force=False, storage=None):
+    """
+    Write the configured widths of `name` in every format, skipping the
+    ones that are already newer than the source. Originals are never
+    upscaled. Returns the number of files written.
+    """
+    storage = storage or default_storage
+    if not name or not storage.exists(name):
+        return 0
+
+    with storage.open(name, "rb") as f:
+        # only the header is read until something has to be written
+        source = Image.open(f)
+        source_width, source_height = source.size
+        # EXIF orientations 5-8 are rotated by 90 degrees
+        if source.getexif().get(ORIENTATION_TAG, 1) > 4:
+            source_width = source_height
+        # widths above the original's collapse into one re-encoded copy
+        # at full size, so the srcset still reaches the sharpest version
+        widths = sorted({min(width, source_width) for width in settings.IMAGE_DERIVATIVE_WIDTHS})
+        pending = [
+            (width, fmt, derivative_name(name, width, fmt))
+            for width in widths
+            for fmt in FORMATS
+        ]
+        if not force:
+            pending = [
+                (width, fmt, derivative) for width, fmt, derivative in pending
+                if not (storage.exists(derivative) and _is_fresh(storage, name, derivative))
+            ]
+        if not pending:
+            return 0
+        source.load()
+    # phone photos carry their rotation in the EXIF data
+    source = ImageOps.exif_transpose(source)
+
+    resized = {}
+    for width, fmt, derivative in pending:
+        if width not in resized:
+            height = round(source.height * width / source.width)
+            resized[width] = source if width == source.width else source.resize((width, height), Image.LANCZOS)
+        image = resized[width]
+        if fmt == "jpeg" and image.mode != "RGB":
+            image = image.convert("RGB")
+        buffer = BytesIO()
+        image.save(buffer, **FORMATS[fmt][1])
+        if storage.exists(derivative):
+            storage.delete(derivative)
+        storage.save(derivative, ContentFile(buffer.getvalue()))
+
+    cache.delete(_cache_key(name))
+    return len(pending)
+
+
+def _generate_safely(name, force=False):
+    try:
+        return generate_derivatives(name, force=force)
+    except Exception:
+        logger.exception("Generating the derivatives of %s failed", name)
+        return 0
+
+
+def _get_executor():
+    global _executor
+    if _executor is None:
+        _executor = ProcessPoolExecutor(max_workers=settings.IMAGE_DERIVATIVE_WORKERS)
+    return _executor
+
+
+def generate_in_background(names, force=False):
+    """
+    Hand the images to the process pool, so neither the request nor the
+    web worker's GIL pays for the resizing.
+    """
+    names = sorted({name for name in names if name})
+    if not names:
+        return []
+    if not settings.IMAGE_DERIVATIVES_ASYNC:
+        return [_generate_safely(name, force) for name in names]
+    executor = _get_executor()
+    return [executor.submit(_generate_safely, name, force) for name in names]
+
+
+def generate_many(names, workers=None, force=False):
+    """
+    Generate the derivatives of many images in a dedicated process pool,
+    yields (name, files written).
+    """
+    names = sorted({name for name in names if name})
+    with ProcessPoolExecutor(max_workers=workers or settings.IMAGE_DERIVATIVE_WORKERS) as executor:
+        yield from zip(names, executor.map(_generate_safely, names, [force] * len(names), chunksize=4))
+
+
+def get_derivatives(name, storage=None):
+    """
+    The derivatives available for `name` as {format: [(width, url), ...]},
+    smallest first. The listing is cached until the image is regenerated.
+    """
+    if not name:
+        return {}
+    key = _cache_key(name)
+    derivatives = cache.get(key)
+    if derivatives is not None:
+        return derivatives
+
+    storage = storage or default_storage
+    extensions = {extension: fmt for fmt, (extension, _) in FORMATS.items()}
+    derivatives = {}
+    try:
+        _, files = storage.listdir(derivatives_dir(name))
+    except (OSError, NotImplementedError):
+        files = []
+    for filename in files:
+        stem, extension = os.path.splitext(filename)
+        fmt = extensions.get(extension.lstrip("."))
+        if fmt is None or not stem.endswith("w") or not stem[:-1].isdigit():
+            continue
+        derivatives.setdefault(fmt, []).append(
+            (int(stem[:-1]), storage.url(posixpath.join(derivatives_dir(name), filename)))
+        )
+    for widths in derivatives.values():
+        widths.sort()
+    cache.set(key, derivatives, settings.IMAGE_DERIVATIVES_CACHE_TIMEOUT)
+    return derivatives
@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand
+
+from ...cache import single_flight_stats
+
+
+class Command(BaseCommand):
+    help = 'Show hit/miss/stale/wait counts of the single-flight cached computations'
+
+    def handle(self, *args, **options):
+        stats = single_flight_stats.collect()
+        if not stats:
+            self.stdout.write('No single-flight computations recorded yet')
+            return
+
+        events = single_flight_stats.EVENTS
+        self.stdout.write(f"{'name':<40}" + ''.join(f'{event:>10}' for event in events))
+        for name, counts in stats.items():
+            self.stdout.write(f'{name:<40}' + ''.join(f'{counts[event]:>10}' for event in events))
@@ -0,0 +1,59 @@
+from collections import Counter
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from ...media import tracked_fields, delete_unreferenced
+from ...models import MediaFile
+
+
+class Command(BaseCommand):
+    help = 'Move reference counted uploads into the content addressed storage and rebuild their counts'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true',
+                            help='Only report what would be moved')
+
+    def handle(self, *args, **options):
+        dry_run = options['dry_run']
+        moved = {}
+        saved_bytes = 0
+
+        for model, field_name in tracked_fields:
+            field = model._meta.get_field(field_name)
+            storage = field.storage
+            names = model._base_manager.exclude(**{field_name: ''}).values_list(field_name, flat=True).distinct()
+            for name in names.iterator():
+                if name == field.get_default() or storage.is_content_name(name) or not storage.exists(name):
+                    continue
+                if dry_run:
+                    self.stdout.write(f'{name} would be moved')
+                    continue
+                with storage.open(name, 'rb') as f:
+                    is_duplicate = storage.exists(storage.content_name(name, f))
+                    new_name = storage.save(name, f)
+                moved[name] = storage
+                saved_bytes += storage.size(name) - (0 if is_duplicate else storage.size(new_name))
+                model._base_manager.filter(**{field_name: name}).update(**{field_name: new_name})
+
+        if dry_run:
+            return
+
+        with transaction.atomic():
+            references = Counter()
+            for model, field_name in tracked_fields:
+                field = model._meta.get_field(field_name)
+                for name in model._base_manager.values_list(field_name, flat=True).iterator():
+                    if name and name != field.get_default():
+                        references[name] += 1
+            MediaFile.objects.all().delete()
+            MediaFile.objects.bulk_create(
+                [MediaFile(name=name, references=count) for name, count in references.items()],
+                batch_size=1000,
+            )
+            for name, storage in moved.items():
+                transaction.on_commit(lambda name=name, storage=storage: delete_unreferenced(name, storage))
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Moved {len(moved)} files, {len(references)} unique files are referenced, '
+            f'{saved_bytes / 1024 / 1024:.1f} MB freed'))
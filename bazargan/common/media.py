@@ -0,0 +1,92 @@
+import logging
+import posixpath
+from functools import partial
+
+from django.db import transaction
+from django.db.models import F
+from django.db.models.signals import pre_save, post_save, post_delete
+
+from .images import derivatives_dir
+from .models import MediaFile
+
+
+logger = logging.getLogger(__name__)
+
+# (model, field name) pairs whose files are reference counted
+tracked_fields = []
+
+
+def _is_tracked_name(field, name):
+    # the field default is a shipped file, not an upload
+    return bool(name) and name != field.get_default()
+
+
+def retain(name, count=1):
+    updated = MediaFile.objects.filter(name=name).update(references=F("references") + count)
+    if not updated:
+        _, created = MediaFile.objects.get_or_create(name=name, defaults={"references": count})
+        if not created:
+            MediaFile.objects.filter(name=name).update(references=F("references") + count)
+
+
+def release(name, storage, count=1):
+    """
+    Drop references to `name`, the file and its image derivatives are
+    deleted once the transaction commits if nothing refers to it anymore.
+    """
+    MediaFile.objects.filter(name=name).update(references=F("references") - count)
+    deleted, _ = MediaFile.objects.filter(name=name, references__lte=0).delete()
+    if deleted:
+        transaction.on_commit(partial(delete_unreferenced, name, storage))
+
+
+def delete_unreferenced(name, storage):
+    # an identical upload may have claimed the file again in the meantime
+    if MediaFile.objects.filter(name=name).exists():
+        return
+    try:
+        storage.delete(name)
+        directory = derivatives_dir(name)
+        if storage.exists(directory):
+            _, files = storage.listdir(directory)
+            for filename in files:
+                storage.delete(posixpath.join(directory, filename))
+    except OSError:
+        logger.exception("Deleting the unreferenced file %s failed", name)
+
+
+def track_references(model, field_name):
+    """
+    Keep the reference counts of `model.field_name` files up to date as
+    rows are saved and deleted. `QuerySet.update()` bypasses this, use
+    `manage.py dedupe_media` to rebuild the counts after bulk changes.
+    """
+    field = model._meta.get_field(field_name)
+    old_attr = f"_previous_{field_name}_name"
+    tracked_fields.append((model, field_name))
+
+    def remember_previous(sender, instance, raw=False, **kwargs):
+        previous = None
+        if not raw and instance.pk is not None and not instance._state.adding:
+            previous = sender._base_manager.filter(pk=instance.pk).values_list(field_name, flat=True).first()
+        setattr(instance, old_attr, previous)
+
+    def update_references(sender, instance, raw=False, **kwargs):
+        previous = getattr(instance, old_attr, None)
+        current = getattr(instance, field_name).name
+        if raw or previous == current:
+            return
+        if _is_tracked_name(field, current):
+            retain(current)
+        if _is_tracked_name(field, previous):
+            release(previous, field.storage)
+
+    def release_deleted(sender, instance, **kwargs):
+        name = getattr(instance, field_name).name
+        if _is_tracked_name(field, name):
+            release(name, field.storage)
+
+    uid = f"track_references:{model._meta.label}.{field_name}"
+    pre_save.connect(remember_previous, sender=model, weak=False, dispatch_uid=uid)
+    post_save.connect(update_references, sender=model, weak=False, dispatch_uid=uid)
+    post_delete.connect(release_deleted, sender=model, weak=False, dispatch_uid=uid)
@@ -1,5 +1,18 @@
-from django.http import JsonResponse
+import mimetypes
+import os
+
+from django.http import JsonResponse, FileResponse, HttpResponseNotModified
 from django.conf import settings
+from django.contrib.staticfiles.storage import staticfiles_storage
+from django.core.exceptions import MiddlewareNotUsed, SuspiciousFileOperation
+from django.utils._os import safe_join
+from django.utils.cache import patch_cache_control, patch_vary_headers, cc_delim_re
+from django.utils.functional import cached_property
+from django.utils.http import http_date
+from django.views.static import was_modified_since
+
+from .decorators import is_shared_cacheable
+from .surrogate import get_surrogate_keys
 
 class AjaxExceptionMiddleware:
     def __init__(self, get_response):
@@ -22,3 +35,134 @@ class AjaxExceptionMiddleware:
                     'type': exception.__class__.__name__
                 }
             return JsonResponse(response_data, status=500)
+
+
+class SurrogateKeyMiddleware:
+    """
+    Write the surrogate keys collected while handling the request into the
+    response header the caching reverse proxy purges by.
+    """
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        response = self.get_response(request)
+        keys = get_surrogate_keys(request)
+        if keys and request.method in ("GET", "HEAD") and response.status_code in (200, 304):
+            response.headers[settings.SURROGATE_KEY_HEADER] = " ".join(sorted(keys))
+            if settings.SURROGATE_CONTROL_MAX_AGE:
+                response.headers.setdefault(
+                    "Surrogate-Control", f"max-age={settings.SURROGATE_CONTROL_MAX_AGE}"
+                )
+        return response
+
+
+class AnonymousSharedCacheMiddleware:
+    """
+    Let a shared cache store catalog pages rendered for anonymous visitors.
+
+    Views marked with `shared_cacheable` are rendered without any session
+    state for anonymous users (see `common.context_processors.shared_cache`),
+    so the `Vary: Cookie` added by the session middleware is dropped and the
+    response is marked public. The proxy is expected to pass requests with
+    a session cookie through to django.
+    """
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        response = self.get_response(request)
+        if (
+            getattr(request, "shared_cache_page", False)
+            and response.status_code in (200, 304)
+            and not response.cookies
+        ):
+            if response.has_header("Vary"):
+                vary = [
+                    header for header in cc_delim_re.split(response.headers["Vary"])
+                    if header.lower() != "cookie"
+                ]
+                if vary:
+                    response.headers["Vary"] = ", ".join(vary)
+                else:
+                    del response.headers["Vary"]
+            patch_cache_control(response, public=True, max_age=settings.SHARED_CACHE_MAX_AGE)
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        request.shared_cache_page = (
+            settings.SHARED_CACHE_ANONYMOUS_PAGES
+            and request.method in ("GET", "HEAD")
+            and is_shared_cacheable(view_func)
+            and not request.user.is_authenticated
+        )
+
+
+class StaticFilesMiddleware:
+    """
+    Serve the collected static files when there is no front proxy doing it.
+
+    The `.br` / `.gz` variants written by
+    `common.storage.CompressedManifestStaticFilesStorage` are picked by the
+    request's Accept-Encoding. Fingerprinted names never change content and
+    are cached for a year, anything else for `STATIC_SERVE_MAX_AGE`.
+    """
+    ENCODINGS = (("br", ".br"), ("gzip", ".gz"))
+    IMMUTABLE_MAX_AGE = 365 * 24 * 60 * 60
+
+    def __init__(self, get_response):
+        if not settings.STATIC_SERVE:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.prefix = settings.STATIC_URL
+
+    def __call__(self, request):
+        if request.method in ("GET", "HEAD") and request.path_info.startswith(self.prefix):
+            response = self.serve(request, request.path_info[len(self.prefix):])
+            if response is not None:
+                return response
+        return self.get_response(request)
+
+    @cached_property
+    def fingerprinted_names(self):
+        return set(getattr(staticfiles_storage, "hashed_files", {}).values())
+
+    def serve(self, request, name):
+        try:
+            path = safe_join(settings.STATIC_ROOT, name)
+        except SuspiciousFileOperation:
+            return None
+        if not os.path.isfile(path):
+            return None
+
+        encoding = None
+        accepted = self.accepted_encodings(request)
+        for candidate, suffix in self.ENCODINGS:
+            if candidate in accepted and os.path.isfile(path + suffix):
+                encoding, path = candidate, path + suffix
+                break
+
+        mtime = os.stat(path).st_mtime
+        if not was_modified_since(request.META.get("HTTP_IF_MODIFIED_SINCE"), mtime):
+            response = HttpResponseNotModified()
+        else:
+            content_type = mimetypes.guess_type(name)[0] or "application/octet-stream"
+            response = FileResponse(open(path, "rb"), content_type=content_type)
+            if encoding:
+                response.headers["Content-Encoding"] = encoding
+        response.headers["Last-Modified"] = http_date(mtime)
+        patch_vary_headers(response, ("Accept-Encoding",))
+        if name in self.fingerprinted_names:
+            patch_cache_control(response, public=True, max_age=self.IMMUTABLE_MAX_AGE, immutable=True)
+        else:
+            patch_cache_control(response, public=True, max_age=settings.STATIC_SERVE_MAX_AGE)
+        return response
+
+    @staticmethod
+    def accepted_encodings(request):
+        accepted = set()
+        for part in request.headers.get("Accept-Encoding", "").split(","):
+            coding, _, params = part.partition(";")
+            if params.replace(" ", "") not in ("q=0", "q=0.0", "q=0.00", "q=0.000"):
+                accepted.add(coding.strip().lower())
+        return accepted
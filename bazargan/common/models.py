@@ -10,3 +10,16 @@ class TrackObjectStateMixin(models.Model):
 
     class Meta:
         abstract = True
+
+
+class MediaFile(models.Model):
+    """
+    Reference count of a file in the content addressed storage, a file is
+    deleted when the last model row pointing at it goes away.
+    See `common.media`.
+    """
+    name = models.CharField(max_length=255, unique=True)
+    references = models.PositiveIntegerField(default=0)
+
+    def __str__(self):
+        return self.name
@@ -0,0 +1,92 @@
+import hashlib
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.cache.backends.redis import RedisCache
+
+
+KEY_PREFIX = "ratelimit:"
+
+# the buckets of one request are checked and taken from atomically, in
+# the same round trip
+_REDIS_SCRIPT = """
+local now = tonumber(ARGV[1])
+local retry = 0
+local tats = {}
+for i = 1, #KEYS do
+    local interval = tonumber(ARGV[i * 2])
+    local period = tonumber(ARGV[i * 2 + 1])
+    local tat = math.max(tonumber(redis.call('GET', KEYS[i]) or '0') or 0, now) + interval
+    tats[i] = tat
+    retry = math.max(retry, tat - now - period)
+end
+if retry > 0 then
+    return retry
+end
+for i = 1, #KEYS do
+    redis.call('SET', KEYS[i], tats[i], 'PX', tats[i] - now)
+end
+return 0
+"""
+
+
+def _key(name, kind, value):
+    digest = hashlib.md5(str(value).encode()).hexdigest()
+    return f"{KEY_PREFIX}{name}:{kind}:{digest}"
+
+
+def hit(name, identities):
+    """
+    Take a token from every bucket of the `RATELIMITS[name]` limits that
+    `identities` ({"ip": ..., "email": ...}) selects. Returns 0 when the
+    request is allowed, otherwise the seconds until it would be; a denied
+    request takes no tokens.
+
+    A bucket holds `requests` tokens and refills one every
+    `seconds / requests`. It is stored as the single timestamp at which it
+    will be full again (GCRA), so the decision takes no counters or
+    locks: one Lua call with Redis, a `get_many()` and `set_many()` with
+    other cache backends (not atomic, good enough for a local setup).
+    """
+    limits = settings.RATELIMITS.get(name, {})
+    buckets = [
+        (_key(name, kind, value), *limits[kind])
+        for kind, value in identities.items()
+        if value and kind in limits
+    ]
+    if not settings.RATELIMIT_ENABLED or not buckets:
+        return 0
+
+    cache = caches[settings.RATELIMIT_CACHE_ALIAS]
+    # integer milliseconds, the redis backend stores ints unpickled
+    now = time.time_ns() // 1_000_000
+    buckets = [(key, seconds * 1000 // requests, seconds * 1000) for key, requests, seconds in buckets]
+    if isinstance(cache, RedisCache):
+        retry = _hit_redis(cache, buckets, now)
+    else:
+        retry = _hit(cache, buckets, now)
+    return retry / 1000
+
+
+def _hit_redis(cache, buckets, now):
+    keys = [cache.make_and_validate_key(key) for key, _, _ in buckets]
+    args = [now]
+    for _, interval, period in buckets:
+        args += [interval, period]
+    client = cache._cache.get_client(keys[0], write=True)
+    return int(client.eval(_REDIS_SCRIPT, len(keys), *keys, *args))
+
+
+def _hit(cache, buckets, now):
+    tats = cache.get_many([key for key, _, _ in buckets])
+    new_tats = {}
+    retry = 0
+    for key, interval, period in buckets:
+        tat = max(tats.get(key, 0), now) + interval
+        new_tats[key] = tat
+        retry = max(retry, tat - now - period)
+    if retry > 0:
+        return retry
+    cache.set_many(new_tats, timeout=max(period for _, _, period in buckets) / 1000)
+    return 0
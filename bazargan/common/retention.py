@@ -0,0 +1,54 @@
+import logging
+import time
+from dataclasses import dataclass
+
+from django.db import transaction
+
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class RetentionResult:
+    deleted: int = 0
+    batches: int = 0
+    # False when the time budget ran out first, the next run continues
+    finished: bool = True
+
+
+def delete_in_batches(queryset, delete=None, batch_size=500, pause=0.0, deadline=None):
+    """
+    Delete the rows of `queryset` a batch at a time, walking the primary
+    key (`pk > last`) so every batch is an index range read. Each batch
+    is deleted in its own short transaction with a `pause` after it, so
+    other writers never wait long for the locks. Stops early once
+    `time.monotonic()` passes `deadline`.
+
+    `delete(pks)` deletes a batch and returns the rows deleted, by default
+    the batch's rows are deleted with their cascades.
+    """
+    model = queryset.model
+    if delete is None:
+        def delete(pks):
+            return model._base_manager.filter(pk__in=pks).delete()[0]
+
+    result = RetentionResult()
+    queryset = queryset.order_by("pk")
+    last = None
+    while True:
+        if deadline is not None and time.monotonic() >= deadline:
+            result.finished = False
+            break
+        batch = queryset if last is None else queryset.filter(pk__gt=last)
+        pks = list(batch.values_list("pk", flat=True)[:batch_size])
+        if not pks:
+            break
+        with transaction.atomic():
+            result.deleted += delete(pks)
+        result.batches += 1
+        last = pks[-1]
+        logger.info("%s: %d rows deleted in %d batches", model._meta.label, result.deleted, result.batches)
+        if len(pks) < batch_size:
+            break
+        time.sleep(pause)
+    return result
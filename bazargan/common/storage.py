@@ -0,0 +1,154 @@
+import gzip
+import hashlib
+import logging
+import os
+import posixpath
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.contrib.staticfiles.storage import ManifestStaticFilesStorage
+from django.core.files import File
+from django.core.files.storage import FileSystemStorage, storages
+from django.core.files.utils import validate_file_name
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+
+logger = logging.getLogger(__name__)
+
+
+def _gzip(data):
+    # mtime=0 keeps the output identical between runs
+    return gzip.compress(data, compresslevel=9, mtime=0)
+
+
+def _brotli(data):
+    return brotli.compress(data)
+
+
+def get_encoders():
+    """
+    Content encodings written next to the static files, best first. Brotli
+    is optional and only used when the `brotli` package is installed.
+    """
+    encoders = []
+    if brotli is not None:
+        encoders.append(("br", ".br", _brotli))
+    encoders.append(("gzip", ".gz", _gzip))
+    return encoders
+
+
+class CompressedManifestStaticFilesStorage(ManifestStaticFilesStorage):
+    """
+    Manifest storage that also writes `.br` and `.gz` variants of the
+    fingerprinted, compressible files during `collectstatic`.
+
+    A fingerprinted name changes with the content, so a variant that
+    already exists is up to date and is skipped on the next run.
+    """
+
+    def url_converter(self, name, hashed_files, template=None):
+        converter = super().url_converter(name, hashed_files, template)
+
+        def converter_or_keep(matchobj):
+            # the vendored stylesheets reference images that aren't shipped,
+            # those references are left as they are instead of failing
+            try:
+                return converter(matchobj)
+            except ValueError as e:
+                logger.warning("%s: %s", name, e)
+                return matchobj.group(0)
+
+        return converter_or_keep
+
+    def post_process(self, paths, dry_run=False, **options):
+        hashed_names = set()
+        for name, hashed_name, processed in super().post_process(paths, dry_run, **options):
+            if hashed_name and not isinstance(processed, Exception):
+                hashed_names.add(hashed_name)
+            yield name, hashed_name, processed
+
+        if dry_run:
+            return
+        names = [name for name in sorted(hashed_names) if self.is_compressible(name)]
+        with ThreadPoolExecutor(max_workers=settings.STATIC_COMPRESS_WORKERS) as executor:
+            written = sum(executor.map(self.compress, names))
+        logger.info("Wrote %d compressed static variants for %d files", written, len(names))
+
+    def is_compressible(self, name):
+        return os.path.splitext(name)[1].lower() in settings.STATIC_COMPRESS_EXTENSIONS
+
+    def compress(self, name):
+        path = self.path(name)
+        pending = [
+            (suffix, encode) for _, suffix, encode in get_encoders()
+            if not os.path.exists(path + suffix)
+        ]
+        if not pending:
+            return 0
+        with open(path, "rb") as f:
+            data = f.read()
+
+        for suffix, encode in pending:
+            with open(path + suffix + ".tmp", "wb") as f:
+                f.write(encode(data))
+            os.replace(path + suffix + ".tmp", path + suffix)
+        return len(pending)
+
+
+class ContentAddressedStorage(FileSystemStorage):
+    """
+    Stores files under the SHA-256 of their content, in the directory of the
+    requested name: `product/img/shoe.jpg` -> `product/img/3f/3fa4…9c.jpg`.
+
+    Saving a file whose content is already stored writes nothing and returns
+    the existing name, so identical uploads share one file. Since a file may
+    be shared, models release it through `common.media` instead of deleting.
+    """
+
+    def save(self, name, content, max_length=None):
+        if name is None:
+            name = content.name
+        if not hasattr(content, "chunks"):
+            content = File(content, name)
+        name = self.content_name(name, content)
+        validate_file_name(name, allow_relative_path=True)
+        if not self.exists(name):
+            self._save_atomically(name, content)
+        return name
+
+    def content_name(self, name, content):
+        hasher = hashlib.sha256()
+        if hasattr(content, "seek"):
+            content.seek(0)
+        for chunk in content.chunks():
+            hasher.update(chunk)
+        if hasattr(content, "seek"):
+            content.seek(0)
+        digest = hasher.hexdigest()
+        directory, filename = posixpath.split(name.replace("\\", "/"))
+        extension = posixpath.splitext(filename)[1].lower()
+        return posixpath.join(directory, digest[:2], digest + extension)
+
+    def is_content_name(self, name):
+        directory, filename = posixpath.split(name)
+        digest = posixpath.splitext(filename)[0]
+        return (
+            len(digest) == 64
+            and posixpath.basename(directory) == digest[:2]
+            and all(char in "0123456789abcdef" for char in digest)
+        )
+
+    def _save_atomically(self, name, content):
+        # two workers saving the same content race for the same name, the
+        # loser just replaces the file with identical bytes
+        temporary = self._save(f"{name}.{uuid.uuid4().hex}.tmp", content)
+        os.replace(self.path(temporary), self.path(name))
+
+
+def get_content_addressed_storage():
+    return storages["content_addressed"]
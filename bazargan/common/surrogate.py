@@ -0,0 +1,17 @@
+SURROGATE_KEYS_ATTR = "_surrogate_keys"
+
+
+def add_surrogate_keys(request, *keys):
+    """
+    Tag the response of the current request with the given surrogate keys.
+    Views and template tags call this for every object they render so the
+    reverse proxy can later purge exactly the pages showing that object.
+    """
+    if request is None:
+        return
+    request_keys = request.__dict__.setdefault(SURROGATE_KEYS_ATTR, set())
+    request_keys.update(str(key) for key in keys)
+
+
+def get_surrogate_keys(request):
+    return getattr(request, SURROGATE_KEYS_ATTR, set())
@@ -0,0 +1,43 @@
+from django import template
+from django.forms.utils import flatatt
+from django.utils.html import format_html
+
+from ..images import get_derivatives
+
+register = template.Library()
+
+
+def _srcset(derivatives):
+    return ", ".join(f"{url} {width}w" for width, url in derivatives)
+
+
+@register.simple_tag
+def responsive_image(image, sizes="100vw", **attrs):
+    """
+    Render an `<img>` for an ImageField with `srcset`s over its derivatives,
+    WebP first with the JPEG ones as fallback, so the browser downloads the
+    smallest file that fills the slot:
+
+        {% responsive_image product.image sizes="160px" class="avatar-img" alt=product.title %}
+
+    Images without derivatives (yet) render with their original file only.
+    """
+    if not image:
+        return ""
+    attrs = {"src": image.url, **attrs}
+    derivatives = get_derivatives(image.name)
+    if not derivatives:
+        return format_html("<img{}>", flatatt(attrs))
+
+    if "jpeg" in derivatives:
+        attrs.update(srcset=_srcset(derivatives["jpeg"]), sizes=sizes)
+    img = format_html("<img{}>", flatatt(attrs))
+    if "webp" not in derivatives:
+        return img
+    # `display: contents` keeps the wrapper out of the layout
+    return format_html(
+        '<picture style="display: contents"><source type="image/webp" srcset="{}" sizes="{}">{}</picture>',
+        _srcset(derivatives["webp"]),
+        sizes,
+        img,
+    )
@@ -0,0 +1,57 @@
+import shutil
+import tempfile
+
+from django.conf import settings
+from django.core.cache import caches
+from django.test import TestCase as BaseTestCase, override_settings
+
+
+# both cache aliases in process memory, the default one keeps its L1 tier
+TEST_CACHES = {
+    'default': {
+        'BACKEND': 'common.cache_backends.TwoTierCache',
+        'LOCATION': 'shared',
+        'OPTIONS': {'L1_MAX_ENTRIES': 100, 'L1_TIMEOUT': 5},
+    },
+    'shared': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'tests',
+    },
+}
+
+
+@override_settings(
+    CACHES=TEST_CACHES,
+    STORAGES={
+        **settings.STORAGES,
+        'staticfiles': {'BACKEND': 'django.contrib.staticfiles.storage.StaticFilesStorage'},
+    },
+    PASSWORD_HASHERS=['django.contrib.auth.hashers.MD5PasswordHasher'],
+    IMAGE_DERIVATIVES_ASYNC=False,
+    RATELIMIT_ENABLED=False,
+    SURROGATE_PURGE_BACKEND='shop.purge.LocMemPurger',
+)
+class TestCase(BaseTestCase):
+    """
+    A TestCase independent of the local environment: empty in-memory
+    caches, uploads in a temporary MEDIA_ROOT, unfingerprinted static
+    files, no rate limits and a fast password hasher.
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls._media_root = tempfile.mkdtemp()
+        cls._media_settings = override_settings(MEDIA_ROOT=cls._media_root)
+        cls._media_settings.enable()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls._media_settings.disable()
+        shutil.rmtree(cls._media_root, ignore_errors=True)
+        super().tearDownClass()
+
+    def setUp(self):
+        super().setUp()
+        for alias in settings.CACHES:
+            caches[alias].clear()
@@ -1,3 +1,250 @@
-from django.test import TestCase
+import gzip
+import os
+import shutil
+import tempfile
+from io import BytesIO
+from unittest import mock, skipIf
 
-# Create your tests here.
+from django.contrib.staticfiles.storage import staticfiles_storage
+from django.core.cache import cache, caches
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db.models.fields.files import ImageFieldFile
+from django.template import Context, Template
+from PIL import Image
+from django.test import override_settings
+
+from . import images, ratelimit, storage
+from .models import MediaFile
+from .paginators import EstimatedCountPaginator
+from .cache import fragment_cache_version, get_versions, bump_version, get_or_compute, SingleFlightStats
+from .testing import TestCase
+
+
+class FragmentCacheVersionTests(TestCase):
+    @override_settings(FRAGMENT_CACHE_VERSION='3')
+    def test_version_follows_the_static_manifest(self):
+        with mock.patch.object(staticfiles_storage, 'manifest_hash', 'before', create=True):
+            before = fragment_cache_version()
+        with mock.patch.object(staticfiles_storage, 'manifest_hash', 'after', create=True):
+            after = fragment_cache_version()
+        self.assertTrue(before.startswith('3.'))
+        self.assertNotEqual(before, after)
+
+    def test_version_without_a_manifest(self):
+        with override_settings(FRAGMENT_CACHE_VERSION='3'):
+            self.assertEqual(fragment_cache_version(), '3.')
+
+
+class TwoTierCacheTests(TestCase):
+    def test_reads_are_served_from_process_memory(self):
+        cache.set('key', 'value')
+        # changed behind the local tier's back, as by another worker
+        caches['shared'].set('key', 'changed')
+        self.assertEqual(cache.get('key'), 'value')
+        self.assertEqual(cache.get_many(['key']), {'key': 'value'})
+
+    def test_writes_go_to_both_tiers(self):
+        cache.set_many({'a': 1, 'b': 2})
+        self.assertEqual(caches['shared'].get_many(['a', 'b']), {'a': 1, 'b': 2})
+        cache.delete('a')
+        self.assertIsNone(cache.get('a'))
+        self.assertIsNone(caches['shared'].get('a'))
+
+    def test_incr_drops_the_local_copy(self):
+        cache.set('counter', 1)
+        self.assertEqual(cache.get('counter'), 1)
+        cache.incr('counter')
+        self.assertEqual(cache.get('counter'), 2)
+
+    def test_local_copy_expires(self):
+        cache.set('key', 'value')
+        caches['shared'].set('key', 'changed')
+        with mock.patch('common.cache_backends.time.monotonic', return_value=10 ** 9):
+            self.assertEqual(cache.get('key'), 'changed')
+
+
+class VersionTests(TestCase):
+    def test_bump_changes_the_version(self):
+        before, = get_versions('namespace')
+        bump_version('namespace')
+        self.assertEqual(get_versions('namespace'), [before + 1])
+
+    def test_bump_by_another_worker_is_seen_at_once(self):
+        before, = get_versions('namespace')
+        caches['shared'].incr('version:namespace')
+        self.assertEqual(get_versions('namespace'), [before + 1])
+
+
+class SingleFlightTests(TestCase):
+    def test_value_is_computed_once(self):
+        compute = mock.Mock(return_value='value')
+        self.assertEqual(get_or_compute('key', compute, timeout=60), 'value')
+        self.assertEqual(get_or_compute('key', compute, timeout=60), 'value')
+        compute.assert_called_once()
+
+    def test_stale_value_is_served_while_another_worker_recomputes(self):
+        get_or_compute('key', lambda: 'old', timeout=0)
+        caches['shared'].add('key:lock', 1)
+        self.assertEqual(get_or_compute('key', lambda: 'new', timeout=60), 'old')
+        caches['shared'].delete('key:lock')
+        self.assertEqual(get_or_compute('key', lambda: 'new', timeout=60), 'new')
+
+    def test_stats_of_all_workers_are_collected(self):
+        first, second = SingleFlightStats(), SingleFlightStats()
+        first.record('grid', 'hit')
+        first.record('grid', 'miss')
+        second.record('grid', 'hit')
+        second.record('strip', 'wait')
+        first.flush()
+        stats = second.collect()
+        self.assertEqual(stats['grid'], {'hit': 2, 'miss': 1, 'stale': 0, 'wait': 0})
+        self.assertEqual(stats['strip'], {'hit': 0, 'miss': 0, 'stale': 0, 'wait': 1})
+
+
+class CompressedStaticFilesTests(TestCase):
+    def setUp(self):
+        super().setUp()
+        self.root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.root)
+        self.storage = storage.CompressedManifestStaticFilesStorage(location=self.root)
+        with open(os.path.join(self.root, 'site.css'), 'w') as f:
+            f.write('body { color: red; }' * 50)
+
+    def test_compressible_files_get_variants(self):
+        self.assertEqual(self.storage.compress('site.css'), len(storage.get_encoders()))
+        with gzip.open(os.path.join(self.root, 'site.css.gz'), 'rt') as f:
+            self.assertEqual(f.read(), 'body { color: red; }' * 50)
+        # existing variants are up to date
+        self.assertEqual(self.storage.compress('site.css'), 0)
+
+    @skipIf(storage.brotli is None, 'brotli is not installed')
+    def test_brotli_variant(self):
+        self.storage.compress('site.css')
+        with open(os.path.join(self.root, 'site.css.br'), 'rb') as f:
+            self.assertEqual(storage.brotli.decompress(f.read()).decode(), 'body { color: red; }' * 50)
+
+    def test_only_text_formats_are_compressed(self):
+        self.assertTrue(self.storage.is_compressible('app.JS'))
+        self.assertFalse(self.storage.is_compressible('logo.png'))
+
+
+class StaticFilesMiddlewareTests(TestCase):
+    def setUp(self):
+        super().setUp()
+        root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, root)
+        with open(os.path.join(root, 'site.css'), 'w') as f:
+            f.write('plain')
+        with open(os.path.join(root, 'site.css.gz'), 'w') as f:
+            f.write('gzipped')
+        settings_override = self.settings(STATIC_SERVE=True, STATIC_ROOT=root, STATIC_SERVE_MAX_AGE=60)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+    def get(self, **headers):
+        response = self.client.get('/static/site.css', **headers)
+        return response, b''.join(response.streaming_content) if response.status_code == 200 else b''
+
+    def test_precompressed_variant_is_picked_by_accept_encoding(self):
+        response, content = self.get(HTTP_ACCEPT_ENCODING='br;q=0, gzip')
+        self.assertEqual(content, b'gzipped')
+        self.assertEqual(response.headers['Content-Encoding'], 'gzip')
+        self.assertIn('Accept-Encoding', response.headers['Vary'])
+        self.assertIn('max-age=60', response.headers['Cache-Control'])
+
+    def test_plain_file_without_accept_encoding(self):
+        response, content = self.get()
+        self.assertEqual(content, b'plain')
+        self.assertNotIn('Content-Encoding', response.headers)
+
+    def test_not_modified(self):
+        response, _ = self.get()
+        response, _ = self.get(HTTP_IF_MODIFIED_SINCE=response.headers['Last-Modified'])
+        self.assertEqual(response.status_code, 304)
+
+
+class ImageDerivativeTests(TestCase):
+    def setUp(self):
+        super().setUp()
+        buffer = BytesIO()
+        Image.new('RGB', (500, 300), 'red').save(buffer, format='PNG')
+        self.name = default_storage.save('product/img/shoe.png', ContentFile(buffer.getvalue()))
+
+    @override_settings(IMAGE_DERIVATIVE_WIDTHS=(160, 320, 640, 960))
+    def test_widths_are_written_once_without_upscaling(self):
+        self.assertEqual(images.generate_derivatives(self.name), 6)
+        self.assertEqual(images.generate_derivatives(self.name), 0)
+        derivatives = images.get_derivatives(self.name)
+        self.assertEqual([width for width, _ in derivatives['jpeg']], [160, 320, 500])
+        self.assertEqual([width for width, _ in derivatives['webp']], [160, 320, 500])
+        with default_storage.open(images.derivative_name(self.name, 160, 'jpeg')) as f:
+            self.assertEqual(Image.open(f).size, (160, 96))
+
+    @override_settings(IMAGE_DERIVATIVE_WIDTHS=(160,))
+    def test_responsive_image_lists_the_derivatives(self):
+        template = Template('{% load image_tags %}{% responsive_image image sizes="50vw" alt="shoe" %}')
+        image = ImageFieldFile(None, mock.Mock(storage=default_storage), self.name)
+        html = template.render(Context({'image': image}))
+        self.assertNotIn('srcset', html)
+
+        images.generate_derivatives(self.name)
+        html = template.render(Context({'image': image}))
+        self.assertIn('<source type="image/webp" srcset="/media/product/img/derivatives/shoe/160w.webp 160w"', html)
+        self.assertIn('srcset="/media/product/img/derivatives/shoe/160w.jpg 160w"', html)
+        self.assertIn('sizes="50vw"', html)
+
+
+class EstimatedCountPaginatorTests(TestCase):
+    def paginator(self, queryset):
+        return EstimatedCountPaginator(queryset.order_by('pk'), 10)
+
+    @override_settings(ADMIN_ESTIMATED_COUNT_THRESHOLD=1000)
+    def test_unfiltered_big_table_takes_the_estimate(self):
+        with mock.patch.object(EstimatedCountPaginator, 'estimate', return_value=5000) as estimate:
+            self.assertEqual(self.paginator(MediaFile.objects.all()).count, 5000)
+        estimate.assert_called_once_with(MediaFile, 'default')
+
+    @override_settings(ADMIN_ESTIMATED_COUNT_THRESHOLD=1000)
+    def test_small_tables_and_filtered_listings_are_counted(self):
+        with mock.patch.object(EstimatedCountPaginator, 'estimate', return_value=500):
+            self.assertEqual(self.paginator(MediaFile.objects.all()).count, 0)
+        with mock.patch.object(EstimatedCountPaginator, 'estimate', return_value=5000) as estimate:
+            self.assertEqual(self.paginator(MediaFile.objects.filter(references__gt=0)).count, 0)
+        estimate.assert_not_called()
+
+    def test_no_estimate_outside_postgresql(self):
+        self.assertIsNone(EstimatedCountPaginator.estimate(MediaFile, 'default'))
+
+
+@override_settings(RATELIMIT_ENABLED=True, RATELIMITS={'test': {'ip': (2, 60), 'email': (3, 60)}})
+class RateLimitTests(TestCase):
+    def test_bucket_empties_and_refills(self):
+        identities = {'ip': '10.0.0.1'}
+        with mock.patch('time.time_ns', return_value=1_000 * 10 ** 9):
+            self.assertEqual(ratelimit.hit('test', identities), 0)
+            self.assertEqual(ratelimit.hit('test', identities), 0)
+            self.assertEqual(ratelimit.hit('test', identities), 30)
+        # a token comes back every 30 seconds
+        with mock.patch('time.time_ns', return_value=1_030 * 10 ** 9):
+            self.assertEqual(ratelimit.hit('test', identities), 0)
+
+    def test_identities_have_buckets_of_their_own(self):
+        for _ in range(2):
+            ratelimit.hit('test', {'ip': '10.0.0.1'})
+        self.assertGreater(ratelimit.hit('test', {'ip': '10.0.0.1'}), 0)
+        self.assertEqual(ratelimit.hit('test', {'ip': '10.0.0.2'}), 0)
+
+    def test_denied_request_takes_no_tokens(self):
+        for _ in range(2):
+            ratelimit.hit('test', {'ip': '10.0.0.1', 'email': 'a@example.com'})
+        ratelimit.hit('test', {'ip': '10.0.0.1', 'email': 'a@example.com'})
+        # the email bucket still has its third token
+        self.assertEqual(ratelimit.hit('test', {'ip': '10.0.0.2', 'email': 'a@example.com'}), 0)
+
+    def test_unknown_names_and_disabled_limits_are_not_throttled(self):
+        for _ in range(5):
+            self.assertEqual(ratelimit.hit('other', {'ip': '10.0.0.1'}), 0)
+        with override_settings(RATELIMIT_ENABLED=False):
+            for _ in range(5):
+                self.assertEqual(ratelimit.hit('test', {'ip': '10.0.0.1'}), 0)
@@ -10,8 +10,9 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.2/ref/settings/
 """
 
+import tempfile
 from pathlib import Path
-from decouple import config
+from decouple import config, Choices
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
@@ -37,6 +38,7 @@ INSTALLED_APPS = [
     'django.contrib.sessions',
     'django.contrib.messages',
     'django.contrib.staticfiles',
+    'common',
     'website',
     'accounts',
     'otp',
@@ -45,13 +47,16 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
+    'common.middleware.StaticFilesMiddleware',
+    'common.middleware.AnonymousSharedCacheMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
-    'common.middleware.AjaxExceptionMiddleware'
+    'common.middleware.AjaxExceptionMiddleware',
+    'common.middleware.SurrogateKeyMiddleware',
 ]
 
 ROOT_URLCONF = 'core.urls'
@@ -66,6 +71,8 @@ TEMPLATES = [
                 'django.template.context_processors.request',
                 'django.contrib.auth.context_processors.auth',
                 'django.contrib.messages.context_processors.messages',
+                'common.context_processors.shared_cache',
+                'common.context_processors.fragment_cache',
             ],
         },
     },
@@ -89,6 +96,60 @@ DATABASES = {
 }
 
 
+# Cache
+# the default cache keeps hot keys in process memory (L1) in front of the
+# shared cache (L2). use e.g. django.core.cache.backends.redis.RedisCache
+# with redis://redis:6379 as the shared cache in production.
+
+CACHES = {
+    'default': {
+        'BACKEND': 'common.cache_backends.TwoTierCache',
+        'LOCATION': 'shared',
+        'TIMEOUT': config('CACHE_TIMEOUT', cast=int, default=300),
+        'OPTIONS': {
+            'L1_MAX_ENTRIES': config('CACHE_L1_MAX_ENTRIES', cast=int, default=1000),
+            'L1_TIMEOUT': config('CACHE_L1_TIMEOUT', cast=int, default=5),
+        },
+    },
+    'shared': {
+        'BACKEND': config('SHARED_CACHE_BACKEND', default='django.core.cache.backends.filebased.FileBasedCache'),
+        'LOCATION': config('SHARED_CACHE_LOCATION', default=str(Path(tempfile.gettempdir()) / 'bazargan-cache')),
+        'TIMEOUT': config('CACHE_TIMEOUT', cast=int, default=300),
+    },
+}
+
+# locks and counters of common.cache.get_or_compute, must not be process local.
+# Only a redis or memcached shared cache makes them atomic, with the file
+# based default two workers may occasionally compute the same value.
+SINGLE_FLIGHT_CACHE_ALIAS = 'shared'
+# version stamps of common.cache.get_versions, a process local copy would
+# keep serving fragments of the old version
+VERSION_CACHE_ALIAS = 'shared'
+
+# `manage.py retention`: rows per delete, seconds between deletes, seconds a
+# run may take, and how old an account that never activated gets
+RETENTION_BATCH_SIZE = config('RETENTION_BATCH_SIZE', cast=int, default=500)
+RETENTION_PAUSE = config('RETENTION_PAUSE', cast=float, default=0.05)
+RETENTION_TIME_BUDGET = config('RETENTION_TIME_BUDGET', cast=int, default=600)
+RETENTION_UNVERIFIED_USER_DAYS = config('RETENTION_UNVERIFIED_USER_DAYS', cast=int, default=7)
+
+# sign-ups waiting for their OTP, see accounts.registration
+PENDING_REGISTRATION_CACHE_ALIAS = 'shared'
+
+# token buckets of common.mixins.RateLimitMixin, (requests, seconds) per
+# client IP and per email. Atomic with a redis shared cache.
+RATELIMIT_ENABLED = config('RATELIMIT_ENABLED', cast=bool, default=True)
+RATELIMIT_CACHE_ALIAS = 'shared'
+# behind a proxy, the header it puts the client address in, e.g. HTTP_X_REAL_IP
+RATELIMIT_IP_META = config('RATELIMIT_IP_META', default='REMOTE_ADDR')
+RATELIMITS = {
+    'check-user': {'ip': (30, 60), 'email': (5, 600)},
+    'login': {'ip': (30, 60), 'email': (10, 300)},
+    'otp-send': {'ip': (10, 600), 'email': (3, 600)},
+    'otp-verify': {'ip': (30, 600), 'email': (10, 600)},
+}
+
+
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
 
@@ -133,6 +194,44 @@ STATICFILES_DIRS = [
     BASE_DIR / 'static',
 ]
 
+STORAGES = {
+    'default': {
+        'BACKEND': 'django.core.files.storage.FileSystemStorage',
+    },
+    # product uploads, deduplicated by content, see common.media
+    'content_addressed': {
+        'BACKEND': 'common.storage.ContentAddressedStorage',
+    },
+    # fingerprinted names plus brotli/gzip variants, written by collectstatic
+    'staticfiles': {
+        'BACKEND': config('STATICFILES_BACKEND', default='common.storage.CompressedManifestStaticFilesStorage'),
+    },
+}
+STATIC_COMPRESS_EXTENSIONS = (
+    '.css', '.js', '.map', '.json', '.svg', '.txt', '.xml', '.html', '.ttf', '.otf', '.eot', '.ico',
+)
+STATIC_COMPRESS_WORKERS = config('STATIC_COMPRESS_WORKERS', cast=int, default=4)
+# serve STATIC_ROOT from django when there is no front proxy
+STATIC_SERVE = config('STATIC_SERVE', cast=bool, default=False)
+STATIC_SERVE_MAX_AGE = config('STATIC_SERVE_MAX_AGE', cast=int, default=60 * 60)
+
+# resized copies of uploaded images, see common.images
+IMAGE_DERIVATIVE_WIDTHS = (160, 320, 640, 960)
+IMAGE_DERIVATIVE_WORKERS = config('IMAGE_DERIVATIVE_WORKERS', cast=int, default=2)
+# generate in a process pool after the upload's transaction commits, or inline
+IMAGE_DERIVATIVES_ASYNC = config('IMAGE_DERIVATIVES_ASYNC', cast=bool, default=True)
+IMAGE_DERIVATIVES_CACHE_TIMEOUT = config('IMAGE_DERIVATIVES_CACHE_TIMEOUT', cast=int, default=60 * 60)
+
+# changelists of tables above this many rows show an estimated total
+ADMIN_ESTIMATED_COUNT_THRESHOLD = config('ADMIN_ESTIMATED_COUNT_THRESHOLD', cast=int, default=100_000)
+# rows per transaction of the product bulk actions
+BULK_ACTION_CHUNK_SIZE = config('BULK_ACTION_CHUNK_SIZE', cast=int, default=1000)
+# products per transaction of `refresh_summaries`, and how far back each
+# refresh looks before the previous one started, for transactions that
+# committed late
+CATALOG_SUMMARY_CHUNK_SIZE = config('CATALOG_SUMMARY_CHUNK_SIZE', cast=int, default=1000)
+CATALOG_SUMMARY_OVERLAP = config('CATALOG_SUMMARY_OVERLAP', cast=int, default=300)
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.2/ref/settings/#default-auto-field
 
@@ -140,6 +239,29 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
 AUTH_USER_MODEL = 'accounts.User'
 
+# request.user comes from the cache, see accounts.backends. The only
+# backend, a second one would check every failed password again. Sessions
+# of the ModelBackend it replaced are moved over by a migration.
+AUTHENTICATION_BACKENDS = ['accounts.backends.CachedModelBackend']
+# shared, a local copy would outlive a password change in other workers
+AUTH_USER_CACHE_ALIAS = 'shared'
+AUTH_USER_CACHE_TIMEOUT = config('AUTH_USER_CACHE_TIMEOUT', cast=int, default=300)
+
+# sessions, see accounts.sessions and `manage.py benchmark_sessions`:
+# - db: a django_session row, read by every request using it, written on change
+# - cached_db: read from the shared cache, still written through to the row
+# - signed_cookies: no server side state and no writes, the data is signed
+#   but readable by the client and a session cannot be revoked alone (a
+#   password change still logs it out). Not listed in the session admin.
+SESSION_BACKEND = config('SESSION_BACKEND', default='db', cast=Choices(['db', 'cached_db', 'signed_cookies']))
+SESSION_ENGINE = f'django.contrib.sessions.backends.{SESSION_BACKEND}'
+# shared, so every worker sees a login or logout at once
+SESSION_CACHE_ALIAS = 'shared'
+SESSION_COOKIE_AGE = config('SESSION_COOKIE_AGE', cast=int, default=2 * 7 * 24 * 60 * 60)
+SESSION_COOKIE_SECURE = config('SESSION_COOKIE_SECURE', cast=bool, default=False)
+# flash messages ride in a cookie, only ones too big for it go to the session
+MESSAGE_STORAGE = 'django.contrib.messages.storage.fallback.FallbackStorage'
+
 LOGIN_REDIRECT_URL = '/'
 LOGOUT_REDIRECT_URL = '/'
 
@@ -154,3 +276,27 @@ EMAIL_HOST_PASSWORD = config("EMAIL_HOST_PASSWORD", default="")
 
 PASSWORD_RESET_TIMEOUT=24 * 60 * 60
 ACTIVATION_ACCOUNT_TIMEOUT=24 * 60 * 60
+
+# surrogate keys for purging the caching reverse proxy
+SURROGATE_KEY_HEADER = config("SURROGATE_KEY_HEADER", default="Surrogate-Key")
+SURROGATE_CONTROL_MAX_AGE = config("SURROGATE_CONTROL_MAX_AGE", cast=int, default=0)
+SURROGATE_PURGE_BACKEND = config("SURROGATE_PURGE_BACKEND", default="shop.purge.DummyPurger")
+SURROGATE_PURGE_URL = config("SURROGATE_PURGE_URL", default="")
+SURROGATE_PURGE_METHOD = config("SURROGATE_PURGE_METHOD", default="PURGE")
+SURROGATE_PURGE_TIMEOUT = config("SURROGATE_PURGE_TIMEOUT", cast=int, default=5)
+SURROGATE_PURGE_BATCH_SIZE = config("SURROGATE_PURGE_BATCH_SIZE", cast=int, default=256)
+
+# render anonymous catalog pages without per-session state (csrf token,
+# flash messages) so a shared cache can store them. the proxy must pass
+# requests carrying the session cookie through to django.
+SHARED_CACHE_ANONYMOUS_PAGES = config("SHARED_CACHE_ANONYMOUS_PAGES", cast=bool, default=False)
+SHARED_CACHE_MAX_AGE = config("SHARED_CACHE_MAX_AGE", cast=int, default=60)
+
+# cached template fragments (layout blocks and product strips). new static
+# files change their version by themselves (see
+# common.cache.fragment_cache_version), bump this on deploys that only
+# change the cached templates.
+FRAGMENT_CACHE_TIMEOUT = config("FRAGMENT_CACHE_TIMEOUT", cast=int, default=60 * 60)
+FRAGMENT_CACHE_VERSION = config("FRAGMENT_CACHE_VERSION", default="1")
+# cached catalog queries (grid pages and counts, category list)
+CATALOG_CACHE_TIMEOUT = config("CATALOG_CACHE_TIMEOUT", cast=int, default=5 * 60)
@@ -0,0 +1,42 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from common.retention import delete_in_batches
+
+from ...models import AuthOTP, UserAuthOTP
+
+
+class Command(BaseCommand):
+    help = ('Delete expired OTPs a small chunk at a time, walking them by primary key '
+            'with one short transaction per chunk')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=500,
+                            help='OTPs deleted per transaction')
+        parser.add_argument('--pause', type=float, default=0.1,
+                            help='Seconds to wait between chunks')
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        now = timezone.now()
+
+        def delete(pks):
+            # an OTP reissued since the chunk was read is a fresh one
+            # again, lock the chunk and check its expiry once more
+            pks = list(
+                AuthOTP.objects.select_for_update().filter(pk__in=pks, expires_at__lt=now)
+                .values_list('pk', flat=True)
+            )
+            deleted = UserAuthOTP.objects.filter(otp_id__in=pks).delete()[0]
+            return deleted + AuthOTP.objects.filter(pk__in=pks).delete()[0]
+
+        result = delete_in_batches(
+            AuthOTP.objects.filter(expires_at__lt=now),
+            delete=delete,
+            batch_size=options['chunk_size'],
+            pause=options['pause'],
+        )
+        self.stdout.write(self.style.SUCCESS(
+            f'Deleted {result.deleted} expired OTPs and links in {time.perf_counter() - started:.1f}s'))
@@ -0,0 +1,28 @@
+from django.db import migrations, models
+from django.db.models import F
+
+
+def fill_expires_at(apps, schema_editor):
+    AuthOTP = apps.get_model('otp', 'AuthOTP')
+    AuthOTP.objects.update(expires_at=F('created') + F('timeout'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('otp', '0002_alter_authotp_timeout_alter_userauthotp_reason'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='authotp',
+            name='expires_at',
+            field=models.DateTimeField(null=True),
+        ),
+        migrations.RunPython(fill_expires_at, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='authotp',
+            name='expires_at',
+            field=models.DateTimeField(db_index=True),
+        ),
+    ]
@@ -5,7 +5,7 @@ from typing import Any, Dict, Optional, TypedDict, Union
 
 from django.core import signing
 from django.core.mail import EmailMultiAlternatives
-from django.db import models
+from django.db import models, transaction
 from django.utils import timezone
 from django.contrib.auth import get_user_model
 
@@ -39,12 +39,19 @@ class AuthOTP(TrackObjectStateMixin):
     # we use a duration field to store the number of seconds
     # the OTP expires from the time of creation, `created`.
     timeout = models.DurationField(default=timezone.timedelta(seconds=TIMEOUT))
+    # `created + timeout`, stored so expired OTPs can be found with an index
+    expires_at = models.DateTimeField(db_index=True)
 
     def __str__(self):
         return f"AuthOTP instance at time: {self.created}"
 
+    def save(self, *args, **kwargs):
+        if self.expires_at is None:
+            self.expires_at = timezone.now() + self.timeout
+        super().save(*args, **kwargs)
+
     @classmethod
-    def generate_otp(cls, **extra_fields) -> CompleteOTPType:
+    def generate_otp(cls, commit=True, **extra_fields) -> CompleteOTPType:
         """
         The idea behind the generation of an otp or anything secret is simple.
         First, we generate a random code: the otp itself.
@@ -71,7 +78,8 @@ class AuthOTP(TrackObjectStateMixin):
         # adds the original code generated to the output. Of course we
         # don't want that to be available in plain sight :D
         otp.code = signed_code[cls.OTP_LENGTH:]
-        otp.save()
+        if commit:
+            otp.save()
         # this is the only point you can ever access the actual OTP code
         # If the output is not saved in a variable, it is gone forever
         # and ever. and ever. and ever.
@@ -100,7 +108,7 @@ class AuthOTP(TrackObjectStateMixin):
     def has_expired(self) -> bool:
         # we keep this for jobs to have an API accessible to clear
         # expired otps.
-        return self.created + self.timeout < timezone.now()
+        return self.expires_at < timezone.now()
 
 
 class UserAuthOTP(models.Model):
@@ -163,15 +171,50 @@ class UserAuthOTP(models.Model):
         the generated code. Again, the generated code will only be
         available here. If it isn't stored in a variable, it is
         lost forever.
+
+        A new OTP for a reason the user already has one for overwrites
+        the old `AuthOTP` row in a single UPDATE, otherwise the OTP is
+        inserted and linked with an upsert on (user, reason).
         """
-        otp = AuthOTP.generate_otp()
-        try:
-            # if a `UserAuthOTP` instance already exists for the reason,
-            # we reuse it.
-            user_auth_otp = cls.objects.get(user=user, reason=reason)
-        except cls.DoesNotExist:
-            # if not, we create one for the reason
-            user_auth_otp = UserAuthOTP(user=user, reason=reason)
-        user_auth_otp.otp = otp["instance"]
-        user_auth_otp.save()
-        return {"user_auth_otp": user_auth_otp, "complete_otp": otp}
\ No newline at end of file
+        otp = AuthOTP.generate_otp(commit=False)
+        instance = otp["instance"]
+        now = timezone.now()
+        instance.created = instance.last_updated = now
+        instance.expires_at = now + instance.timeout
+
+        with transaction.atomic():
+            reused = AuthOTP.objects.filter(
+                userauthotp__user=user, userauthotp__reason=reason
+            ).update(
+                uuid=instance.uuid,
+                code=instance.code,
+                timeout=instance.timeout,
+                created=instance.created,
+                last_updated=instance.last_updated,
+                expires_at=instance.expires_at,
+            )
+            if not reused:
+                instance.save()
+                # a concurrent first OTP for the same reason loses its
+                # link here, its row expires and is purged
+                cls.objects.bulk_create(
+                    [UserAuthOTP(user=user, reason=reason, otp=instance)],
+                    update_conflicts=True,
+                    unique_fields=["user", "reason"],
+                    update_fields=["otp"],
+                )
+            # neither the UPDATE nor the upsert hands back primary keys,
+            # the rows as written are read back
+            user_auth_otp = cls.objects.select_related("otp").get(user=user, reason=reason)
+        otp["instance"] = user_auth_otp.otp
+        return {"user_auth_otp": user_auth_otp, "complete_otp": otp}
+
+    @classmethod
+    def delete_otp_for_user(cls, user: User, reason: OTPReasons) -> None:
+        """
+        Delete the user's OTP for the reason along with its link, deleting
+        only the link would leave the `AuthOTP` row behind.
+        """
+        AuthOTP.objects.filter(
+            userauthotp__user=user, userauthotp__reason=reason
+        ).delete()
@@ -1,3 +1,120 @@
-from django.test import TestCase
+from datetime import timedelta
+from io import StringIO
+from unittest import mock
 
-# Create your tests here.
+from django.contrib.auth import get_user_model
+from django.core.exceptions import ValidationError
+from django.core.management import call_command
+from django.utils import timezone
+
+from common.retention import delete_in_batches
+from common.testing import TestCase
+
+from .models import AuthOTP, UserAuthOTP
+from .verification import verify_otp, consume_otp
+
+
+User = get_user_model()
+REASON = UserAuthOTP.OTPReasons.ACTIVATE_USER
+
+
+class OTPTestCase(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('otp@example.com', 'Passw0rd!')
+
+    def issue(self, reason=REASON):
+        return UserAuthOTP.create_otp_for_user(self.user, reason)
+
+    def expire(self):
+        AuthOTP.objects.update(expires_at=timezone.now() - timedelta(seconds=1))
+
+
+class CreateOTPTests(OTPTestCase):
+    def test_first_otp_is_inserted_and_linked(self):
+        otp = self.issue()
+        self.assertIsNotNone(otp['user_auth_otp'].pk)
+        self.assertEqual(otp['user_auth_otp'].otp, otp['complete_otp']['instance'])
+        self.assertEqual(AuthOTP.objects.get().expires_at, otp['complete_otp']['instance'].expires_at)
+
+    def test_reissue_overwrites_the_otp_and_returns_saved_rows(self):
+        first = self.issue()
+        second = self.issue()
+        self.assertEqual(AuthOTP.objects.count(), 1)
+        self.assertEqual(UserAuthOTP.objects.count(), 1)
+        self.assertEqual(second['user_auth_otp'].pk, first['user_auth_otp'].pk)
+        instance = second['complete_otp']['instance']
+        self.assertEqual(instance.pk, first['complete_otp']['instance'].pk)
+        self.assertEqual(AuthOTP.objects.get().uuid, instance.uuid)
+
+        self.assertIsNotNone(verify_otp(self.user.email, REASON, second['complete_otp']['code']))
+
+    def test_reasons_are_kept_apart(self):
+        self.issue()
+        self.issue(UserAuthOTP.OTPReasons.FORGOT_PASSWORD)
+        self.assertEqual(AuthOTP.objects.count(), 2)
+        UserAuthOTP.delete_otp_for_user(self.user, REASON)
+        self.assertEqual(list(UserAuthOTP.objects.values_list('reason', flat=True)),
+                         [UserAuthOTP.OTPReasons.FORGOT_PASSWORD])
+        self.assertEqual(AuthOTP.objects.count(), 1)
+
+
+class VerifyOTPTests(OTPTestCase):
+    def setUp(self):
+        super().setUp()
+        self.code = self.issue()['complete_otp']['code']
+
+    def test_right_code_is_accepted(self):
+        user_auth_otp = verify_otp(self.user.email, REASON, self.code)
+        self.assertEqual(user_auth_otp.user, self.user)
+
+    def test_wrong_code_email_or_reason_is_rejected(self):
+        wrong = self.code + 1 if self.code < 999998 else self.code - 1
+        self.assertIsNone(verify_otp(self.user.email, REASON, wrong))
+        self.assertIsNone(verify_otp('other@example.com', REASON, self.code))
+        self.assertIsNone(verify_otp(self.user.email, UserAuthOTP.OTPReasons.FORGOT_PASSWORD, self.code))
+
+    def test_expired_otp_is_rejected(self):
+        self.expire()
+        self.assertIsNone(verify_otp(self.user.email, REASON, self.code))
+
+    def test_otp_is_consumed_once(self):
+        user_auth_otp = verify_otp(self.user.email, REASON, self.code)
+        again = verify_otp(self.user.email, REASON, self.code)
+        consume_otp(user_auth_otp)
+        self.assertFalse(AuthOTP.objects.exists())
+        with self.assertRaises(ValidationError):
+            consume_otp(again)
+
+    def test_consume_rotates_to_the_next_reason(self):
+        user_auth_otp = verify_otp(self.user.email, REASON, self.code)
+        otp = consume_otp(user_auth_otp, rotate_to=UserAuthOTP.OTPReasons.ACTIVE_USER_PASSWORD)
+        self.assertIsNotNone(verify_otp(self.user.email, UserAuthOTP.OTPReasons.ACTIVE_USER_PASSWORD, otp['code']))
+        self.assertIsNone(verify_otp(self.user.email, REASON, self.code))
+
+
+class PurgeOTPsTests(OTPTestCase):
+    def test_only_expired_otps_are_deleted(self):
+        self.issue()
+        self.expire()
+        self.issue(UserAuthOTP.OTPReasons.FORGOT_PASSWORD)
+        out = StringIO()
+        call_command('purge_otps', chunk_size=1, pause=0, stdout=out)
+        self.assertIn('Deleted 2 expired OTPs and links', out.getvalue())
+        self.assertEqual(list(UserAuthOTP.objects.values_list('reason', flat=True)),
+                         [UserAuthOTP.OTPReasons.FORGOT_PASSWORD])
+
+    def test_otp_reissued_after_the_chunk_was_read_is_kept(self):
+        self.issue()
+        self.expire()
+
+        def reissue_first(queryset, delete, **kwargs):
+            def delete_after_reissue(pks):
+                self.reissued = self.issue()
+                return delete(pks)
+            return delete_in_batches(queryset, delete=delete_after_reissue, **kwargs)
+
+        with mock.patch('otp.management.commands.purge_otps.delete_in_batches', reissue_first):
+            call_command('purge_otps', pause=0, stdout=StringIO())
+        self.assertEqual(AuthOTP.objects.count(), 1)
+        self.assertIsNotNone(verify_otp(self.user.email, REASON, self.reissued['complete_otp']['code']))
@@ -0,0 +1,46 @@
+from typing import Optional
+
+from django.core.exceptions import ValidationError
+from django.db import transaction
+
+from .models import AuthOTP, UserAuthOTP, CompleteOTPType
+
+
+def verify_otp(email: str, reason: UserAuthOTP.OTPReasons, code) -> Optional[UserAuthOTP]:
+    """
+    Check `code` against the OTP the user with `email` has for `reason`.
+    The link, the user and the OTP come in one joined query. Returns the
+    link with `user` and `otp` loaded, or None if there is no such OTP or
+    the code is wrong or expired.
+    """
+    user_auth_otp = (
+        UserAuthOTP.objects.select_related("user", "otp")
+        .filter(user__email=email, reason=reason)
+        .first()
+    )
+    if user_auth_otp is None or user_auth_otp.otp.has_expired():
+        return None
+    if not AuthOTP.verify_otp(user_auth_otp.otp, int(code)):
+        return None
+    return user_auth_otp
+
+
+@transaction.atomic
+def consume_otp(
+        user_auth_otp: UserAuthOTP, rotate_to: Optional[UserAuthOTP.OTPReasons] = None
+) -> Optional[CompleteOTPType]:
+    """
+    Use up an OTP returned by `verify_otp`, and issue the user's next OTP
+    for `rotate_to` in the same transaction. The delete only matches the
+    OTP as it was verified, so it can be used once: if another request
+    used or reissued it meanwhile, nothing is deleted and this raises.
+    """
+    otp = user_auth_otp.otp
+    deleted, _ = UserAuthOTP.objects.filter(pk=user_auth_otp.pk, otp__uuid=otp.uuid).delete()
+    if not deleted:
+        raise ValidationError("OTP is invalid", code="otp_invalid")
+    AuthOTP.objects.filter(pk=otp.pk).delete()
+
+    if rotate_to is None:
+        return None
+    return UserAuthOTP.create_otp_for_user(user_auth_otp.user, rotate_to)["complete_otp"]
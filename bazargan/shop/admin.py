@@ -1,19 +1,194 @@
-from django.contrib import admin
+from django.contrib import admin, messages
+from django.contrib.admin.helpers import ACTION_CHECKBOX_NAME
+from django.core.exceptions import PermissionDenied
+from django.shortcuts import redirect
+from django.template.response import TemplateResponse
+from django.urls import path
 
-from .models import Product, ProductImage, ProductCategory, WishlistProduct
+from common.bulk import READERS, open_text
+from common.mixins import ExportCSVMixin
+from common.paginators import EstimatedCountPaginator
+
+from . import maintenance, summaries
+from .forms import ProductImportForm, DiscountForm, StockAdjustmentForm, CategoriesForm
+from .importers import ProductImporter
+from .models import Product, ProductImage, ProductCategory, WishlistProduct, ProductStatusType, CatalogSummary
+
+# errors shown after an admin import, the rest are only counted
+IMPORT_ERRORS_SHOWN = 20
 
 @admin.register(Product)
-class ProductAdmin(admin.ModelAdmin):
+class ProductAdmin(ExportCSVMixin, admin.ModelAdmin):
     list_display = ('id', 'title', 'stock', 'status', 'price', 'discount_percent', 'created_date')
+    export_fields = ('id', 'slug', 'title', 'stock', 'status', 'price', 'discount_percent', 'created_date', 'updated_date')
+    # prefix lookups on indexed columns, `icontains` scans the whole table
+    search_fields = ('slug__startswith', 'title__startswith')
+    autocomplete_fields = ('user', 'category')
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+    change_list_template = 'admin/shop/product/change_list.html'
+    actions = (
+        'publish', 'unpublish', 'set_discount', 'clear_discount',
+        'adjust_stock', 'add_categories', 'remove_categories',
+    )
+
+    def get_urls(self):
+        info = self.model._meta.app_label, self.model._meta.model_name
+        return [
+            path('import/', self.admin_site.admin_view(self.import_view), name='%s_%s_import' % info),
+        ] + super().get_urls()
+
+    def import_view(self, request):
+        if not (self.has_add_permission(request) and self.has_change_permission(request)):
+            raise PermissionDenied
+
+        form = ProductImportForm(request.POST or None, request.FILES or None)
+        if form.is_valid():
+            importer = ProductImporter(request.user, batch_size=form.cleaned_data['batch_size'])
+            reader = READERS[form.cleaned_data['format']]
+            created = updated = 0
+            errors = []
+            # the upload is read batch by batch, never as a whole
+            for result in importer.run(reader(open_text(form.cleaned_data['file']))):
+                created += result.created
+                updated += result.updated
+                errors.extend(result.errors)
+
+            self.message_user(request, f'{created} products created, {updated} updated.', messages.SUCCESS)
+            for record, message in errors[:IMPORT_ERRORS_SHOWN]:
+                self.message_user(request, f'Row {record}: {message}', messages.WARNING)
+            if len(errors) > IMPORT_ERRORS_SHOWN:
+                self.message_user(request, f'{len(errors) - IMPORT_ERRORS_SHOWN} more rows were skipped.', messages.WARNING)
+            return redirect('admin:%s_%s_changelist' % (self.model._meta.app_label, self.model._meta.model_name))
+
+        context = {
+            **self.admin_site.each_context(request),
+            'opts': self.model._meta,
+            'form': form,
+            'title': 'Import products',
+        }
+        return TemplateResponse(request, 'admin/shop/product/import.html', context)
+
+    # bulk actions: set-based updates in chunks, see shop.maintenance
+
+    def run_maintenance(self, request, title, operation):
+        result = operation()
+        self.message_user(
+            request,
+            f'{title}: {result.rows} products updated in {result.chunks} transactions ({result.elapsed:.1f}s).',
+            messages.SUCCESS,
+        )
+
+    def maintenance_form(self, request, queryset, title, form_class, operation, **form_kwargs):
+        """
+        Ask for the action's parameters on an intermediate page, then run
+        `operation(queryset, **cleaned_data)`.
+        """
+        form = form_class(request.POST if 'apply' in request.POST else None, **form_kwargs)
+        if form.is_valid():
+            self.run_maintenance(request, title, lambda: operation(queryset, **form.cleaned_data))
+            return None
+
+        select_across = request.POST.get('select_across', '0')
+        context = {
+            **self.admin_site.each_context(request),
+            'opts': self.model._meta,
+            'title': title,
+            'form': form,
+            'media': self.media + form.media,
+            'action': request.POST['action'],
+            'select_across': select_across,
+            # with "select all" the changelist filters in the URL pick the rows
+            'selected': [] if select_across == '1' else request.POST.getlist(ACTION_CHECKBOX_NAME),
+            'count': queryset.count(),
+        }
+        return TemplateResponse(request, 'admin/shop/product/bulk_action.html', context)
+
+    @admin.action(description='Publish selected products', permissions=['change'])
+    def publish(self, request, queryset):
+        self.run_maintenance(request, 'Publish', lambda: maintenance.update_products(
+            queryset, status=ProductStatusType.publish.value))
+
+    @admin.action(description='Unpublish selected products (draft)', permissions=['change'])
+    def unpublish(self, request, queryset):
+        self.run_maintenance(request, 'Unpublish', lambda: maintenance.update_products(
+            queryset, status=ProductStatusType.draft.value))
+
+    @admin.action(description='Set discount of selected products', permissions=['change'])
+    def set_discount(self, request, queryset):
+        return self.maintenance_form(request, queryset, 'Set discount', DiscountForm, maintenance.update_products)
+
+    @admin.action(description='Clear discount of selected products', permissions=['change'])
+    def clear_discount(self, request, queryset):
+        self.run_maintenance(request, 'Clear discount', lambda: maintenance.update_products(
+            queryset, discount_percent=0))
+
+    @admin.action(description='Adjust stock of selected products', permissions=['change'])
+    def adjust_stock(self, request, queryset):
+        return self.maintenance_form(request, queryset, 'Adjust stock', StockAdjustmentForm, maintenance.adjust_stock)
+
+    @admin.action(description='Add categories to selected products', permissions=['change'])
+    def add_categories(self, request, queryset):
+        return self.maintenance_form(
+            request, queryset, 'Add categories', CategoriesForm, maintenance.add_categories,
+            admin_site=self.admin_site,
+        )
+
+    @admin.action(description='Remove categories from selected products', permissions=['change'])
+    def remove_categories(self, request, queryset):
+        return self.maintenance_form(
+            request, queryset, 'Remove categories', CategoriesForm, maintenance.remove_categories,
+            admin_site=self.admin_site,
+        )
 
 @admin.register(ProductCategory)
 class ProductCategoryAdmin(admin.ModelAdmin):
     list_display = ('id', 'title', 'parent', 'created_date')
+    list_select_related = ('parent',)
+    search_fields = ('title__startswith', 'slug__startswith')
+    autocomplete_fields = ('parent',)
 
 @admin.register(ProductImage)
 class ProductImageAdmin(admin.ModelAdmin):
     list_display = ('id', 'file', 'created_date')
+    search_fields = ('product__slug__startswith',)
+    autocomplete_fields = ('product',)
 
 @admin.register(WishlistProduct)
-class WishlistProductAdmin(admin.ModelAdmin):
+class WishlistProductAdmin(ExportCSVMixin, admin.ModelAdmin):
     list_display = ('id', 'user', 'product')
+    list_select_related = ('user', 'product')
+    search_fields = ('user__email__startswith', 'product__slug__startswith')
+    autocomplete_fields = ('user', 'product')
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+    export_fields = ('id', 'user_id', 'user__email', 'product_id', 'product__slug', 'product__title')
+
+
+@admin.register(CatalogSummary)
+class CatalogSummaryAdmin(admin.ModelAdmin):
+    """
+    The catalog dashboard, its figures come from the summary tables that
+    the `refresh_summaries` command maintains.
+    """
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def has_delete_permission(self, request, obj=None):
+        return False
+
+    def changelist_view(self, request, extra_context=None):
+        if not self.has_view_permission(request):
+            raise PermissionDenied
+        context = {
+            **self.admin_site.each_context(request),
+            'opts': self.model._meta,
+            'title': 'Catalog dashboard',
+            **summaries.dashboard(),
+            **(extra_context or {}),
+        }
+        return TemplateResponse(request, 'admin/shop/catalogsummary/dashboard.html', context)
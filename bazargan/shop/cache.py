@@ -0,0 +1,35 @@
+import hashlib
+from functools import partial
+
+from django.db import transaction
+
+from common.cache import get_versions, bump_version
+
+
+PRODUCTS_NAMESPACE = "shop:products"
+CATEGORIES_NAMESPACE = "shop:categories"
+
+
+def catalog_version():
+    return ".".join(str(version) for version in get_versions(PRODUCTS_NAMESPACE, CATEGORIES_NAMESPACE))
+
+
+def catalog_key(name, *parts, namespaces=(PRODUCTS_NAMESPACE, CATEGORIES_NAMESPACE)):
+    """
+    Cache key for data derived from the catalog, it changes whenever one of
+    the given namespaces is bumped.
+    """
+    versions = ".".join(str(version) for version in get_versions(*namespaces))
+    digest = hashlib.md5("|".join(str(part) for part in parts).encode()).hexdigest()
+    return f"shop:{name}:{versions}:{digest}"
+
+
+def bump_catalog_version(products=False, categories=False):
+    """
+    Invalidate the cached catalog fragments once the current transaction
+    commits.
+    """
+    if products:
+        transaction.on_commit(partial(bump_version, PRODUCTS_NAMESPACE))
+    if categories:
+        transaction.on_commit(partial(bump_version, CATEGORIES_NAMESPACE))
@@ -0,0 +1,113 @@
+import hashlib
+
+from django.contrib import messages
+from django.db.models import Count, Max, Subquery
+
+from .cache import catalog_version
+from .filters import filter_products
+from .models import Product, ProductCategory, ProductStatusType, WishlistProduct
+
+
+# There is no Last-Modified: deleting a product or taking it out of a
+# category leaves the newest `updated_date` where it was, so only the ETag,
+# which includes the catalog version, validates a cached page.
+
+STATE_ATTR = "_catalog_state"
+
+
+def _latest_updated(queryset):
+    return Subquery(queryset.order_by("-updated_date").values("updated_date")[:1])
+
+
+def _wishlist_subqueries(user):
+    """
+    Fingerprint of the user's wishlist: rows only ever get a higher id, so
+    (count, max id) changes whenever the set of wished products changes.
+    """
+    wishlists = WishlistProduct.objects.filter(user=user).order_by().values("user")
+    return {
+        "wishlist_count": Subquery(wishlists.annotate(value=Count("id")).values("value")),
+        "wishlist_last": Subquery(wishlists.annotate(value=Max("id")).values("value")),
+    }
+
+
+def _is_cacheable(request):
+    # a 304 would swallow pending flash messages, so those requests
+    # always get a fresh page.
+    return request.method in ("GET", "HEAD") and not len(messages.get_messages(request))
+
+
+def _get_state(request, compute, *args, **kwargs):
+    """
+    The state behind the ETag is computed once per request, however often
+    it is asked for.
+    """
+    if not hasattr(request, STATE_ATTR):
+        state = compute(request, *args, **kwargs) if _is_cacheable(request) else None
+        setattr(request, STATE_ATTR, state)
+    return getattr(request, STATE_ATTR)
+
+
+def _make_etag(*parts):
+    return hashlib.md5("|".join(str(part) for part in parts).encode()).hexdigest()
+
+
+def _grid_state(request):
+    queryset = filter_products(
+        Product.objects.filter(status=ProductStatusType.publish.value), request.GET
+    )
+    aggregates = {
+        "total": Count("id"),
+        "products_updated": Max("updated_date"),
+        "categories_updated": Max(_latest_updated(ProductCategory.objects.all())),
+    }
+    if request.user.is_authenticated:
+        aggregates.update({
+            name: Max(subquery)
+            for name, subquery in _wishlist_subqueries(request.user).items()
+        })
+    state = queryset.aggregate(**aggregates)
+    # an empty listing carries no timestamps to validate against
+    if not state["total"]:
+        return None
+    return state
+
+
+def _detail_state(request, slug):
+    annotations = {
+        "categories_updated": Max("category__updated_date"),
+        # the similar products strip depends on the rest of the catalog
+        "catalog_updated": _latest_updated(Product.objects.all()),
+    }
+    if request.user.is_authenticated:
+        annotations.update(_wishlist_subqueries(request.user))
+    return (
+        Product.objects.filter(slug=slug)
+        .values("id", "updated_date")
+        .annotate(**annotations)
+        .order_by()
+        .first()
+    )
+
+
+def product_grid_etag(request, *args, **kwargs):
+    state = _get_state(request, _grid_state)
+    if state is None:
+        return None
+    # the timestamps don't move when a product is deleted or leaves a
+    # category, the catalog version does
+    return _make_etag(
+        "grid",
+        request.GET.urlencode(),
+        request.user.pk,
+        catalog_version(),
+        *state.values(),
+    )
+
+
+def product_detail_etag(request, slug, *args, **kwargs):
+    state = _get_state(request, _detail_state, slug)
+    if state is None:
+        return None
+    # the catalog version also moves when a similar product is deleted
+    return _make_etag("detail", request.user.pk, catalog_version(), *state.values())
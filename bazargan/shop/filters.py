@@ -0,0 +1,33 @@
+from django.core.exceptions import FieldError
+
+
+FILTER_PARAMS = ("q", "category_id", "min_price", "max_price")
+
+
+def filter_values(params):
+    """
+    The filter part of the query string, which alone decides the result
+    count (ordering and paging don't).
+    """
+    return tuple(params.get(name, "") for name in FILTER_PARAMS)
+
+
+def filter_products(queryset, params):
+    """
+    Apply the product grid query string (search, category, price range and
+    ordering) to the given queryset.
+    """
+    if search_q := params.get("q"):
+        queryset = queryset.filter(title__icontains=search_q)
+    if category_id := params.get("category_id"):
+        queryset = queryset.filter(category__id=category_id)
+    if min_price := params.get("min_price"):
+        queryset = queryset.filter(price__gte=min_price)
+    if max_price := params.get("max_price"):
+        queryset = queryset.filter(price__lte=max_price)
+    if order_by := params.get("order_by"):
+        try:
+            queryset = queryset.order_by(order_by)
+        except FieldError:
+            pass
+    return queryset
@@ -0,0 +1,53 @@
+from pathlib import Path
+
+from django import forms
+from django.contrib.admin.widgets import AutocompleteSelectMultiple
+from django.utils.translation import gettext_lazy as _
+
+from common.bulk import READERS
+
+from .models import Product, ProductCategory
+
+
+class ProductImportForm(forms.Form):
+    file = forms.FileField(label=_("File"), help_text=_("CSV or JSON, products are matched by slug"))
+    format = forms.ChoiceField(
+        label=_("Format"),
+        choices=[("", _("From the file extension"))] + [(name, name) for name in sorted(READERS)],
+        required=False,
+    )
+    batch_size = forms.IntegerField(label=_("Batch size"), min_value=1, max_value=50000, initial=1000)
+
+    def clean(self):
+        cleaned_data = super().clean()
+        file = cleaned_data.get("file")
+        if file and not cleaned_data.get("format"):
+            file_format = Path(file.name).suffix.lstrip(".").lower()
+            if file_format not in READERS:
+                raise forms.ValidationError(_("Choose the format of the file"))
+            cleaned_data["format"] = file_format
+        return cleaned_data
+
+
+class DiscountForm(forms.Form):
+    discount_percent = forms.IntegerField(label=_("Discount percent"), min_value=0, max_value=100)
+
+
+class StockAdjustmentForm(forms.Form):
+    delta = forms.IntegerField(label=_("Change stock by"), help_text=_("Negative to decrease, stock stops at zero"))
+
+    def clean_delta(self):
+        delta = self.cleaned_data["delta"]
+        if not delta:
+            raise forms.ValidationError(_("Enter a non-zero amount"))
+        return delta
+
+
+class CategoriesForm(forms.Form):
+    categories = forms.ModelMultipleChoiceField(label=_("Categories"), queryset=ProductCategory.objects.all())
+
+    def __init__(self, *args, admin_site, **kwargs):
+        super().__init__(*args, **kwargs)
+        field = self.fields["categories"]
+        field.widget = AutocompleteSelectMultiple(Product._meta.get_field("category"), admin_site)
+        field.widget.choices = field.choices
@@ -0,0 +1,147 @@
+import time
+
+from django.core.exceptions import ValidationError
+from django.db import transaction
+
+from common.bulk import BatchResult, batched
+
+from .cache import bump_catalog_version
+from .models import Product, ProductCategory, ProductStatusType
+from .purge import purge_keys, product_keys, PRODUCT_LIST_KEY
+
+
+# columns an import file may carry besides `slug`, empty cells are skipped
+PRODUCT_FIELDS = (
+    "title",
+    "description",
+    "brief_description",
+    "stock",
+    "status",
+    "price",
+    "discount_percent",
+)
+CATEGORY_SEPARATOR = "|"
+
+
+class ProductImporter:
+    """
+    Upsert products by slug from a stream of row dicts, one batch at a time:
+    rows are validated, written with one `bulk_create(update_conflicts=True)`
+    and their categories replaced with one bulk insert into the through
+    table. Rows that don't validate are reported and skipped, the others
+    are imported. Only the columns present in a row are updated.
+
+        importer = ProductImporter(owner)
+        for result in importer.run(iter_csv(open_text(f))):  # common.bulk
+            ...
+    """
+
+    def __init__(self, owner, batch_size=1000):
+        self.owner = owner
+        self.batch_size = batch_size
+        self.fields = {name: Product._meta.get_field(name) for name in PRODUCT_FIELDS}
+        self.statuses = {label.lower(): value for value, label in ProductStatusType.choices}
+        self.statuses.update({name: member.value for name, member in ProductStatusType.__members__.items()})
+
+    def run(self, rows):
+        for number, (first, batch) in enumerate(batched(rows, self.batch_size), start=1):
+            yield self.import_batch(number, list(enumerate(batch, start=first)))
+
+    def clean_row(self, row):
+        slug = str(row.get("slug") or "").strip()
+        if not slug:
+            raise ValidationError("slug is required")
+        values = {"slug": Product._meta.get_field("slug").clean(slug, None)}
+        for name, model_field in self.fields.items():
+            value = row.get(name)
+            if value is None or value == "":
+                continue
+            if name == "status" and isinstance(value, str) and not value.isdigit():
+                if value.lower() not in self.statuses:
+                    raise ValidationError(f"unknown status {value!r}")
+                value = self.statuses[value.lower()]
+            try:
+                values[name] = model_field.clean(value, None)
+            except ValidationError as e:
+                raise ValidationError(f"{name}: {'; '.join(e.messages)}")
+
+        categories = row.get("categories")
+        if categories == "":
+            # an empty cell, like for the other columns, keeps the categories
+            categories = None
+        elif isinstance(categories, str):
+            categories = [slug.strip() for slug in categories.split(CATEGORY_SEPARATOR) if slug.strip()]
+        return values, categories
+
+    def import_batch(self, number, batch):
+        started = time.perf_counter()
+        result = BatchResult(number=number, rows=len(batch))
+
+        cleaned = {}
+        for record, row in batch:
+            try:
+                values, categories = self.clean_row(row)
+            except ValidationError as e:
+                result.errors.append((record, "; ".join(e.messages)))
+                continue
+            # the last row of a slug wins, like it would row by row
+            cleaned[values["slug"]] = (record, values, categories)
+
+        category_slugs = {slug for _, _, categories in cleaned.values() for slug in categories or ()}
+        category_ids = dict(
+            ProductCategory.objects.filter(slug__in=category_slugs).values_list("slug", "id")
+        )
+        for slug, (record, _, categories) in list(cleaned.items()):
+            missing = [category for category in categories or () if category not in category_ids]
+            if missing:
+                result.errors.append((record, f"unknown categories: {', '.join(missing)}"))
+                del cleaned[slug]
+
+        existing = set(Product.objects.filter(slug__in=cleaned).values_list("slug", flat=True))
+        for slug, (record, values, _) in list(cleaned.items()):
+            if slug not in existing and "title" not in values:
+                result.errors.append((record, "title is required for new products"))
+                del cleaned[slug]
+
+        if cleaned:
+            with transaction.atomic():
+                self.write(cleaned, existing, category_ids, result)
+
+        result.elapsed = time.perf_counter() - started
+        return result
+
+    def write(self, cleaned, existing, category_ids, result):
+        result.updated = len(existing & cleaned.keys())
+        result.created = len(cleaned) - result.updated
+
+        # one statement per set of present columns, an absent column must
+        # not overwrite what is stored
+        groups = {}
+        for slug, (_, values, _) in cleaned.items():
+            groups.setdefault(tuple(sorted(values)), []).append(values)
+        for columns, rows in groups.items():
+            Product.objects.bulk_create(
+                [Product(user=self.owner, **values) for values in rows],
+                update_conflicts=True,
+                unique_fields=["slug"],
+                update_fields=[name for name in columns if name != "slug"] + ["updated_date"],
+            )
+
+        product_ids = dict(Product.objects.filter(slug__in=cleaned).values_list("slug", "id"))
+        with_categories = {
+            product_ids[slug]: categories
+            for slug, (_, _, categories) in cleaned.items()
+            if categories is not None
+        }
+        if with_categories:
+            through = Product.category.through
+            through.objects.filter(product_id__in=with_categories).delete()
+            through.objects.bulk_create([
+                through(product_id=product_id, productcategory_id=category_ids[slug])
+                for product_id, categories in with_categories.items()
+                for slug in dict.fromkeys(categories)
+            ])
+
+        # bulk writes send no signals
+        purge_keys([PRODUCT_LIST_KEY, *product_keys(product_ids.values())])
+        bump_catalog_version(products=True)
@@ -0,0 +1,94 @@
+import logging
+import time
+from dataclasses import dataclass
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F
+from django.db.models.functions import Greatest
+from django.utils import timezone
+
+from common.bulk import batched
+
+from .cache import bump_catalog_version
+from .models import Product
+from .purge import purge_keys, product_keys, PRODUCT_LIST_KEY
+
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class MaintenanceResult:
+    rows: int = 0
+    chunks: int = 0
+    elapsed: float = 0
+
+
+def _run_in_chunks(queryset, apply, chunk_size=None, progress=None):
+    """
+    Call `apply(pks)` for the selected products a chunk at a time, each
+    chunk in its own transaction so locks are held briefly and a failure
+    keeps the chunks before it. The caches are invalidated once at the
+    end instead of per row.
+    """
+    chunk_size = chunk_size or settings.BULK_ACTION_CHUNK_SIZE
+    result = MaintenanceResult()
+    started = time.perf_counter()
+    touched = []
+    pks = queryset.order_by("pk").values_list("pk", flat=True).iterator(chunk_size=chunk_size)
+    for _, chunk in batched(pks, chunk_size):
+        with transaction.atomic():
+            result.rows += apply(chunk)
+        result.chunks += 1
+        touched.extend(chunk)
+        result.elapsed = time.perf_counter() - started
+        logger.info("%d products in %d chunks after %.1fs", result.rows, result.chunks, result.elapsed)
+        if progress is not None:
+            progress(result)
+
+    if touched:
+        purge_keys([PRODUCT_LIST_KEY, *product_keys(touched)])
+        bump_catalog_version(products=True)
+    return result
+
+
+def update_products(queryset, chunk_size=None, progress=None, **values):
+    # `update()` skips auto_now, the conditional GET validators need it
+    values.setdefault("updated_date", timezone.now())
+    return _run_in_chunks(
+        queryset,
+        lambda pks: Product.objects.filter(pk__in=pks).update(**values),
+        chunk_size,
+        progress,
+    )
+
+
+def adjust_stock(queryset, delta, chunk_size=None, progress=None):
+    # stock is unsigned, a decrease stops at zero
+    return update_products(queryset, chunk_size, progress, stock=Greatest(F("stock") + delta, 0))
+
+
+def add_categories(queryset, categories, chunk_size=None, progress=None):
+    through = Product.category.through
+    category_ids = [category.pk for category in categories]
+
+    def apply(pks):
+        through.objects.bulk_create(
+            [through(product_id=pk, productcategory_id=category_id) for pk in pks for category_id in category_ids],
+            ignore_conflicts=True,
+        )
+        return Product.objects.filter(pk__in=pks).update(updated_date=timezone.now())
+
+    return _run_in_chunks(queryset, apply, chunk_size, progress)
+
+
+def remove_categories(queryset, categories, chunk_size=None, progress=None):
+    through = Product.category.through
+    category_ids = [category.pk for category in categories]
+
+    def apply(pks):
+        through.objects.filter(product_id__in=pks, productcategory_id__in=category_ids).delete()
+        return Product.objects.filter(pk__in=pks).update(updated_date=timezone.now())
+
+    return _run_in_chunks(queryset, apply, chunk_size, progress)
@@ -0,0 +1,267 @@
+import os
+import random
+import time
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+import django
+from faker import Faker
+
+from django.contrib.auth.hashers import make_password
+from django.core.files import File
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from django.db.models import Q
+from django.utils.text import slugify
+
+from accounts.models import UserType, User, Profile
+from common.images import generate_in_background
+from common.media import retain
+
+from ...cache import bump_catalog_version
+from ...models import Product, ProductCategory, ProductStatusType, WishlistProduct
+
+
+BASE_DIR = Path(__file__).resolve().parent
+
+# per worker process, building a Faker is much slower than using one
+_fakers = {}
+
+
+def _init_worker():
+    # spawned workers start without django, forked ones must not share
+    # the parent's database connections
+    django.setup()
+    connections.close_all()
+
+
+def _get_faker(locale, seed):
+    if locale not in _fakers:
+        _fakers[locale] = Faker(locale=locale)
+    fake = _fakers[locale]
+    fake.seed_instance(seed)
+    return fake
+
+
+def _generate_products(job):
+    """
+    Create the products `job['start']` up to `job['stop']` with their
+    categories and wishlists. Everything is drawn from a generator seeded
+    by the run seed and the batch start, so a batch comes out the same
+    whichever worker runs it.
+    """
+    started = time.perf_counter()
+    seed = f"{job['seed']}:{job['start']}"
+    rng = random.Random(seed)
+    fake = _get_faker(job['locale'], seed)
+
+    products = []
+    for index in range(job['start'], job['stop']):
+        title = ' '.join(fake.words(rng.randint(1, 3)))
+        price = rng.randrange(10_000, 10_000_000, 1000)
+        products.append(Product(
+            user_id=job['owner_id'],
+            title=title,
+            slug=f"{slugify(title, allow_unicode=True)}-{job['seed']}-{index}",
+            image=rng.choice(job['images']),
+            description=fake.paragraph(nb_sentences=5),
+            brief_description=fake.sentence(),
+            stock=rng.randint(0, 100),
+            status=ProductStatusType.publish.value if rng.random() < 0.8 else ProductStatusType.draft.value,
+            price=price,
+            discount_percent=rng.choice((0, 0, 0, 5, 10, 20, 30, 50)),
+        ))
+
+    # a rerun with the same seed only fills in what is missing
+    existing = set(Product.objects.filter(slug__in=[product.slug for product in products]).values_list('slug', flat=True))
+    products = [product for product in products if product.slug not in existing]
+    Product.objects.bulk_create(products, batch_size=job['batch_size'])
+
+    through = Product.category.through
+    Product.category.through.objects.bulk_create(
+        [
+            through(product_id=product.id, productcategory_id=category_id)
+            for product in products
+            for category_id in rng.sample(job['category_ids'], min(rng.randint(1, 3), len(job['category_ids'])))
+        ],
+        batch_size=job['batch_size'],
+    )
+
+    wishlists = []
+    if job['user_ids'] and products:
+        count = round(len(products) * job['wishlists'])
+        wishlists = [
+            WishlistProduct(user_id=rng.choice(job['user_ids']), product_id=rng.choice(products).id)
+            for _ in range(count)
+        ]
+        WishlistProduct.objects.bulk_create(wishlists, batch_size=job['batch_size'])
+
+    connections.close_all()
+    return {
+        'products': len(products),
+        'wishlists': len(wishlists),
+        'images': Counter(str(product.image) for product in products),
+        'elapsed': time.perf_counter() - started,
+    }
+
+
+class Command(BaseCommand):
+    help = 'Generate a synthetic catalog of the given size for load testing'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--products', type=int, default=1000)
+        parser.add_argument('--categories', type=int, default=50)
+        parser.add_argument('--depth', type=int, default=3,
+                            help='Levels of the category tree')
+        parser.add_argument('--users', type=int, default=100,
+                            help='Customers generated to own the wishlists')
+        parser.add_argument('--wishlists', type=float, default=0.5,
+                            help='Wishlist rows per product')
+        parser.add_argument('--seed', type=int, default=0,
+                            help='The same seed generates the same catalog')
+        parser.add_argument('--workers', type=int, default=os.cpu_count(),
+                            help='Worker processes generating products')
+        parser.add_argument('--batch-size', type=int, default=2000)
+        parser.add_argument('--locale', default='fa_IR')
+
+    def handle(self, *args, **options):
+        if options['depth'] < 1:
+            raise CommandError('--depth must be at least 1')
+        owner = User.objects.filter(
+            Q(type=UserType.admin.value) | Q(is_superuser=True)
+        ).first()
+        if owner is None:
+            raise CommandError('Create an admin user first, products need an owner')
+
+        started = time.perf_counter()
+        rng = random.Random(options['seed'])
+        fake = Faker(locale=options['locale'])
+        fake.seed_instance(options['seed'])
+
+        images = self.store_sample_images()
+        category_ids = self.generate_categories(rng, fake, options)
+        user_ids = self.generate_users(rng, options)
+        self.stdout.write(f'{len(category_ids)} categories and {len(user_ids)} users ready '
+                          f'in {time.perf_counter() - started:.1f}s')
+
+        if category_ids:
+            self.generate_products(owner, images, category_ids, user_ids, options)
+        # bulk_create sends no signals, do what they would have done
+        bump_catalog_version(products=True, categories=True)
+        generate_in_background(images)
+
+        self.stdout.write(self.style.SUCCESS(f'Done in {time.perf_counter() - started:.1f}s'))
+
+    def store_sample_images(self):
+        # stored once, the content addressed storage shares them
+        field = Product._meta.get_field('image')
+        names = []
+        for path in sorted((BASE_DIR / 'images').glob('*.jpg')):
+            with path.open('rb') as f:
+                names.append(field.storage.save(field.generate_filename(None, path.name), File(f)))
+        return names
+
+    def level_sizes(self, total, depth):
+        """
+        Split `total` categories over `depth` levels so every level has
+        about the same number of children per parent.
+        """
+        branching = total ** (1 / depth)
+        sizes = [max(1, round(branching ** (level + 1))) for level in range(depth - 1)]
+        sizes.append(total - sum(sizes))
+        return [size for size in sizes if size > 0]
+
+    def generate_categories(self, rng, fake, options):
+        seed = options['seed']
+        ids = []
+        parent_ids = []
+        index = 0
+        for size in self.level_sizes(options['categories'], options['depth']):
+            categories = []
+            for _ in range(size):
+                title = fake.word()
+                categories.append(ProductCategory(
+                    title=title,
+                    slug=f'{slugify(title, allow_unicode=True)}-{seed}-{index}',
+                    parent_id=rng.choice(parent_ids) if parent_ids else None,
+                ))
+                index += 1
+            slugs = [category.slug for category in categories]
+            existing = set(ProductCategory.objects.filter(slug__in=slugs).values_list('slug', flat=True))
+            ProductCategory.objects.bulk_create(
+                [category for category in categories if category.slug not in existing],
+                batch_size=options['batch_size'],
+            )
+            parent_ids = list(ProductCategory.objects.filter(slug__in=slugs).order_by('id').values_list('id', flat=True))
+            ids.extend(parent_ids)
+        return ids
+
+    def generate_users(self, rng, options):
+        seed = options['seed']
+        # generated customers can't log in
+        password = make_password(None)
+        emails = [f'loadtest-{seed}-{index}@example.com' for index in range(options['users'])]
+        existing = set()
+        for start in range(0, len(emails), options['batch_size']):
+            existing.update(User.objects.filter(
+                email__in=emails[start:start + options['batch_size']]
+            ).values_list('email', flat=True))
+
+        users = User.objects.bulk_create(
+            [User(email=email, password=password, is_verified=True) for email in emails if email not in existing],
+            batch_size=options['batch_size'],
+        )
+        # the post_save receiver that creates profiles doesn't run for bulk_create
+        Profile.objects.bulk_create(
+            [
+                Profile(
+                    pk=user.pk,
+                    user=user,
+                    first_name='',
+                    last_name='',
+                    phone_number=f'09{rng.randrange(10 ** 9):09d}',
+                )
+                for user in users
+            ],
+            batch_size=options['batch_size'],
+        )
+        return list(User.objects.filter(email__startswith=f'loadtest-{seed}-').order_by('id').values_list('id', flat=True))
+
+    def generate_products(self, owner, images, category_ids, user_ids, options):
+        batch_size = options['batch_size']
+        jobs = [
+            {
+                'seed': options['seed'],
+                'start': start,
+                'stop': min(start + batch_size, options['products']),
+                'owner_id': owner.id,
+                'images': images,
+                'category_ids': category_ids,
+                'user_ids': user_ids,
+                'wishlists': options['wishlists'],
+                'locale': options['locale'],
+                'batch_size': batch_size,
+            }
+            for start in range(0, options['products'], batch_size)
+        ]
+
+        started = time.perf_counter()
+        products = wishlists = 0
+        image_references = Counter()
+        # workers open their own connections
+        connections.close_all()
+        with ProcessPoolExecutor(max_workers=options['workers'], initializer=_init_worker) as executor:
+            for result in executor.map(_generate_products, jobs):
+                products += result['products']
+                wishlists += result['wishlists']
+                image_references.update(result['images'])
+                elapsed = time.perf_counter() - started
+                self.stdout.write(
+                    f"{products} products, {wishlists} wishlists "
+                    f"({result['products'] / result['elapsed']:.0f} products/s in this batch, "
+                    f"{products / elapsed:.0f}/s overall)"
+                )
+
+        for name, count in image_references.items():
+            retain(name, count)
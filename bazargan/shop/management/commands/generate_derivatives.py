@@ -0,0 +1,31 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from common.images import generate_many
+
+from ...models import Product, ProductImage
+
+
+class Command(BaseCommand):
+    help = 'Generate the resized WebP/JPEG derivatives of product and gallery images'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=None,
+                            help='Size of the process pool, defaults to IMAGE_DERIVATIVE_WORKERS')
+        parser.add_argument('--force', action='store_true',
+                            help='Regenerate derivatives that are already up to date')
+
+    def handle(self, *args, **options):
+        names = set(Product.objects.values_list('image', flat=True))
+        names.update(ProductImage.objects.values_list('file', flat=True))
+
+        started = time.perf_counter()
+        written = 0
+        for name, count in generate_many(names, workers=options['workers'], force=options['force']):
+            written += count
+            if count and options['verbosity'] > 1:
+                self.stdout.write(f'{name}: {count} files')
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Wrote {written} derivatives for {len(names)} images in {time.perf_counter() - started:.2f}s'))
@@ -0,0 +1,52 @@
+from pathlib import Path
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Q
+
+from accounts.models import UserType, User
+
+from common.bulk import READERS, open_text
+
+from ...importers import ProductImporter
+
+
+class Command(BaseCommand):
+    help = 'Create or update products by slug from a CSV or JSON file'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path')
+        parser.add_argument('--format', choices=sorted(READERS),
+                            help='Defaults to the file extension')
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument('--owner', help='Email of the user new products belong to, defaults to the first admin')
+
+    def handle(self, *args, **options):
+        path = Path(options['path'])
+        file_format = options['format'] or path.suffix.lstrip('.').lower()
+        if file_format not in READERS:
+            raise CommandError(f'Unknown format {file_format!r}, use --format')
+
+        if options['owner']:
+            owner = User.objects.filter(email=options['owner']).first()
+        else:
+            owner = User.objects.filter(Q(type=UserType.admin.value) | Q(is_superuser=True)).first()
+        if owner is None:
+            raise CommandError('No owner found for the imported products')
+
+        importer = ProductImporter(owner, batch_size=options['batch_size'])
+        totals = {'rows': 0, 'created': 0, 'updated': 0, 'errors': 0, 'elapsed': 0}
+        with path.open('rb') as f:
+            for result in importer.run(READERS[file_format](open_text(f))):
+                for key in totals:
+                    totals[key] += len(result.errors) if key == 'errors' else getattr(result, key)
+                self.stdout.write(
+                    f'batch {result.number}: {result.rows} rows, {result.created} created, '
+                    f'{result.updated} updated, {len(result.errors)} errors ({result.rate:.0f} rows/s)'
+                )
+                for record, message in result.errors:
+                    self.stderr.write(f'  row {record}: {message}')
+
+        self.stdout.write(self.style.SUCCESS(
+            f"{totals['rows']} rows in {totals['elapsed']:.1f}s: {totals['created']} created, "
+            f"{totals['updated']} updated, {totals['errors']} errors"
+        ))
@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand
+
+from ...summaries import refresh_summaries
+
+
+class Command(BaseCommand):
+    help = 'Update the catalog summaries of the admin dashboard with the products changed since the last run'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--full', action='store_true',
+                            help='Rebuild the summaries from every product. The dashboard shows partial '
+                                 'figures until the rebuild finishes, run it off-peak')
+        parser.add_argument('--chunk-size', type=int,
+                            help='Products per transaction, CATALOG_SUMMARY_CHUNK_SIZE by default')
+
+    def handle(self, *args, **options):
+        def progress(refresh):
+            if options['verbosity'] > 1:
+                self.stdout.write(f'{refresh.products} products after {refresh.elapsed:.1f}s')
+
+        refresh = refresh_summaries(full=options['full'], chunk_size=options['chunk_size'], progress=progress)
+        self.stdout.write(self.style.SUCCESS(
+            f"{'Rebuilt' if refresh.full else 'Refreshed'} from {refresh.products} products in {refresh.elapsed:.1f}s"))
@@ -0,0 +1,116 @@
+import math
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from urllib.parse import urlencode
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import connections
+from django.db.models import Count, Q
+from django.test import Client
+from django.urls import reverse
+
+from common.images import generate_many
+
+from ...models import Product, ProductCategory, ProductImage, ProductStatusType
+from ...views import ProductGridView
+
+
+class Command(BaseCommand):
+    help = 'Prime the catalog caches after a deploy by rendering the busiest pages'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=4,
+                            help='Number of pages rendered in parallel')
+        parser.add_argument('--grid-pages', type=int, default=3,
+                            help='Grid pages warmed per listing')
+        parser.add_argument('--categories', type=int, default=5,
+                            help='Number of top categories whose listings are warmed')
+        parser.add_argument('--products', type=int, default=20,
+                            help='Number of popular products whose detail pages are warmed')
+        parser.add_argument('--skip-images', action='store_true',
+                            help='Do not generate missing image derivatives')
+        parser.add_argument('--host', default=None,
+                            help='Host name the pages are requested with, defaults to the first ALLOWED_HOSTS entry')
+
+    def handle(self, *args, **options):
+        host = options['host'] or self.default_host()
+        if not options['skip_images']:
+            # before the pages, so they are rendered with their srcsets
+            self.generate_derivatives(options['workers'])
+        tasks = self.get_tasks(options)
+
+        timings = defaultdict(list)
+        failures = []
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=options['workers']) as executor:
+            futures = {
+                executor.submit(self.fetch, host, url): (group, url)
+                for group, url in tasks
+            }
+            for future in as_completed(futures):
+                group, url = futures[future]
+                status, elapsed = future.result()
+                timings[group].append(elapsed)
+                if status != 200:
+                    failures.append((url, status))
+        total = time.perf_counter() - started
+
+        self.stdout.write(f"{'group':<12}{'pages':>8}{'total':>10}{'slowest':>10}")
+        for group, elapsed in timings.items():
+            self.stdout.write(f'{group:<12}{len(elapsed):>8}{sum(elapsed):>9.2f}s{max(elapsed):>9.2f}s')
+        for url, status in failures:
+            self.stderr.write(f'{url} answered {status}')
+        self.stdout.write(self.style.SUCCESS(
+            f'Warmed {len(tasks)} pages in {total:.2f}s with {options["workers"]} workers'))
+
+    def generate_derivatives(self, workers):
+        published = Product.objects.filter(status=ProductStatusType.publish.value)
+        names = set(published.values_list('image', flat=True))
+        names.update(ProductImage.objects.filter(product__in=published).values_list('file', flat=True))
+
+        started = time.perf_counter()
+        written = sum(count for _, count in generate_many(names, workers=workers))
+        self.stdout.write(
+            f'Wrote {written} missing derivatives of {len(names)} images in {time.perf_counter() - started:.2f}s'
+        )
+
+    def default_host(self):
+        hosts = [host for host in settings.ALLOWED_HOSTS if '*' not in host]
+        return hosts[0].lstrip('.') if hosts else 'testserver'
+
+    def get_tasks(self, options):
+        # the index page renders the latest products strip and the shared
+        # header/footer fragments
+        tasks = [('index', reverse('website:index'))]
+
+        grid_url = reverse('shop:product-grid')
+        published = Q(product__status=ProductStatusType.publish.value)
+        top_categories = ProductCategory.objects.annotate(
+            published_count=Count('product', filter=published)
+        ).filter(published_count__gt=0).order_by('-published_count').values_list('id', 'published_count')
+        listings = [({}, Product.objects.filter(status=ProductStatusType.publish.value).count())]
+        listings += [({'category_id': pk}, count) for pk, count in top_categories[:options['categories']]]
+        for params, count in listings:
+            pages = min(options['grid_pages'], math.ceil(count / ProductGridView.paginate_by))
+            for page in range(1, pages + 1):
+                tasks.append(('grid', f'{grid_url}?{urlencode({**params, "page": page})}'))
+
+        # there are no sales figures yet, wishlists are the best popularity signal
+        popular_products = Product.objects.filter(
+            status=ProductStatusType.publish.value
+        ).annotate(wished=Count('wishlists')).order_by('-wished', '-created_date').values_list('slug', flat=True)
+        for slug in popular_products[:options['products']]:
+            tasks.append(('detail', reverse('shop:product-detail', kwargs={'slug': slug})))
+        return tasks
+
+    def fetch(self, host, url):
+        started = time.perf_counter()
+        try:
+            # a page that raises is a 500 in the summary, not the end of the warmup
+            response = Client(SERVER_NAME=host, raise_request_exception=False).get(url)
+        finally:
+            # every worker thread opens its own database connection
+            connections.close_all()
+        return response.status_code, time.perf_counter() - started
@@ -0,0 +1,23 @@
+# Generated by Django 4.2.30 on 2026-10-18 23:03
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shop', '0002_wishlistproduct'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='product',
+            name='updated_date',
+            field=models.DateTimeField(auto_now=True, db_index=True),
+        ),
+        migrations.AlterField(
+            model_name='productcategory',
+            name='updated_date',
+            field=models.DateTimeField(auto_now=True, db_index=True),
+        ),
+    ]
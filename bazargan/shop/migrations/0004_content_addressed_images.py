@@ -0,0 +1,24 @@
+# Generated by Django 4.2.30 on 2026-10-18 23:18
+
+import common.storage
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shop', '0003_product_updated_date_index'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='product',
+            name='image',
+            field=models.ImageField(default='default/product-image.png', storage=common.storage.get_content_addressed_storage, upload_to='product/img'),
+        ),
+        migrations.AlterField(
+            model_name='productimage',
+            name='file',
+            field=models.ImageField(storage=common.storage.get_content_addressed_storage, upload_to='product/extra-img'),
+        ),
+    ]
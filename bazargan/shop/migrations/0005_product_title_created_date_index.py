@@ -0,0 +1,23 @@
+# Generated by Django 4.2.30 on 2026-10-18 23:33
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shop', '0004_content_addressed_images'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='product',
+            name='created_date',
+            field=models.DateTimeField(auto_now_add=True, db_index=True),
+        ),
+        migrations.AlterField(
+            model_name='product',
+            name='title',
+            field=models.CharField(db_index=True, max_length=255),
+        ),
+    ]
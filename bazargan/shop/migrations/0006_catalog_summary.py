@@ -0,0 +1,63 @@
+# Generated by Django 4.2.30 on 2026-10-18 23:38
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shop', '0005_product_title_created_date_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CatalogSnapshot',
+            fields=[
+                ('product_id', models.BigIntegerField(primary_key=True, serialize=False)),
+                ('status', models.IntegerField()),
+                ('stock', models.PositiveIntegerField()),
+                ('price', models.DecimalField(decimal_places=0, max_digits=10)),
+                ('discount_percent', models.IntegerField()),
+                ('categories', models.JSONField(default=list)),
+                ('wishlists', models.IntegerField(db_index=True, default=0)),
+                ('stale', models.BooleanField(default=False)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='CatalogSummary',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('dimension', models.CharField(choices=[('status', 'Status'), ('category', 'Category'), ('discount', 'Discount percent')], max_length=16)),
+                ('key', models.IntegerField()),
+                ('products', models.IntegerField(default=0)),
+                ('stock', models.BigIntegerField(default=0)),
+                ('stock_value', models.DecimalField(decimal_places=0, default=0, max_digits=24)),
+                ('wishlists', models.IntegerField(default=0)),
+            ],
+            options={
+                'verbose_name_plural': 'Catalog summary',
+            },
+        ),
+        migrations.CreateModel(
+            name='CatalogSummaryRefresh',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('started', models.DateTimeField(db_index=True)),
+                ('elapsed', models.FloatField(default=0)),
+                ('watermark', models.DateTimeField()),
+                ('products', models.IntegerField(default=0)),
+                ('full', models.BooleanField(default=False)),
+            ],
+            options={
+                'ordering': ['-started'],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='catalogsummary',
+            constraint=models.UniqueConstraint(fields=('dimension', 'key'), name='shop_catalogsummary_dimension_key'),
+        ),
+        migrations.AddIndex(
+            model_name='catalogsnapshot',
+            index=models.Index(condition=models.Q(('stale', True)), fields=['product_id'], name='shop_catalogsnapshot_stale'),
+        ),
+    ]
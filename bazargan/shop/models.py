@@ -5,6 +5,8 @@ from django.db import models
 from django.contrib.auth import get_user_model
 from django.utils.translation import gettext_lazy as _
 
+from common.storage import get_content_addressed_storage
+
 
 User = get_user_model()
 
@@ -20,7 +22,7 @@ class ProductCategory(models.Model):
     parent = models.ForeignKey('self', null=True, blank=True, on_delete=models.SET_NULL)
 
     created_date = models.DateTimeField(auto_now_add=True)
-    updated_date = models.DateTimeField(auto_now=True)
+    updated_date = models.DateTimeField(auto_now=True, db_index=True)
 
     class Meta:
         verbose_name_plural = 'Product Categories'
@@ -34,9 +36,9 @@ class ProductCategory(models.Model):
 class Product(models.Model):
     user = models.ForeignKey(User, on_delete=models.PROTECT, related_name='products')
     category = models.ManyToManyField(ProductCategory)
-    title = models.CharField(max_length=255)
+    title = models.CharField(max_length=255, db_index=True)
     slug = models.SlugField(max_length=255, unique=True, allow_unicode=True)
-    image = models.ImageField(default='default/product-image.png', upload_to='product/img')
+    image = models.ImageField(default='default/product-image.png', upload_to='product/img', storage=get_content_addressed_storage)
     description = models.TextField()
     brief_description = models.TextField(null=True, blank=True)
     stock = models.PositiveIntegerField(default=0)
@@ -44,8 +46,8 @@ class Product(models.Model):
     price = models.DecimalField(default=0, max_digits=10, decimal_places=0)
     discount_percent = models.IntegerField(default=0, validators=[MinValueValidator(0), MaxValueValidator(100)])
 
-    created_date = models.DateTimeField(auto_now_add=True)
-    updated_date = models.DateTimeField(auto_now=True)
+    created_date = models.DateTimeField(auto_now_add=True, db_index=True)
+    updated_date = models.DateTimeField(auto_now=True, db_index=True)
 
     class Meta:
         ordering = ['-created_date']
@@ -74,7 +76,7 @@ class Product(models.Model):
 
 class ProductImage(models.Model):
     product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='images')
-    file = models.ImageField(upload_to='product/extra-img')
+    file = models.ImageField(upload_to='product/extra-img', storage=get_content_addressed_storage)
 
     created_date = models.DateTimeField(auto_now_add=True)
     updated_date = models.DateTimeField(auto_now=True)
@@ -86,3 +88,62 @@ class WishlistProduct(models.Model):
 
     def __str__(self):
         return self.product.title
+
+
+class SummaryDimension(models.TextChoices):
+    status = 'status', _('Status')
+    category = 'category', _('Category')
+    discount = 'discount', _('Discount percent')
+
+
+class CatalogSummary(models.Model):
+    """
+    Aggregates of the catalog by status, category or discount, kept up to
+    date by `shop.summaries.refresh_summaries` for the admin dashboard.
+    """
+    dimension = models.CharField(max_length=16, choices=SummaryDimension.choices)
+    key = models.IntegerField()
+    products = models.IntegerField(default=0)
+    stock = models.BigIntegerField(default=0)
+    stock_value = models.DecimalField(default=0, max_digits=24, decimal_places=0)
+    wishlists = models.IntegerField(default=0)
+
+    class Meta:
+        verbose_name_plural = 'Catalog summary'
+        constraints = [
+            models.UniqueConstraint(fields=['dimension', 'key'], name='shop_catalogsummary_dimension_key'),
+        ]
+
+
+class CatalogSnapshot(models.Model):
+    """
+    What a product last contributed to the summaries, the refresh subtracts
+    it before adding the product's current values. Not a foreign key, the
+    snapshot has to outlive a deleted product until it is subtracted.
+    """
+    product_id = models.BigIntegerField(primary_key=True)
+    status = models.IntegerField()
+    stock = models.PositiveIntegerField()
+    price = models.DecimalField(max_digits=10, decimal_places=0)
+    discount_percent = models.IntegerField()
+    categories = models.JSONField(default=list)
+    wishlists = models.IntegerField(default=0, db_index=True)
+    # changed in a way `Product.updated_date` doesn't show
+    stale = models.BooleanField(default=False)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['product_id'], condition=models.Q(stale=True), name='shop_catalogsnapshot_stale'),
+        ]
+
+
+class CatalogSummaryRefresh(models.Model):
+    started = models.DateTimeField(db_index=True)
+    elapsed = models.FloatField(default=0)
+    # products updated since then are picked up by the next refresh
+    watermark = models.DateTimeField()
+    products = models.IntegerField(default=0)
+    full = models.BooleanField(default=False)
+
+    class Meta:
+        ordering = ['-started']
@@ -0,0 +1,108 @@
+import logging
+import urllib.request
+from functools import partial
+
+from django.conf import settings
+from django.db import transaction
+from django.utils.module_loading import import_string
+
+
+logger = logging.getLogger(__name__)
+
+# listing pages carry these so new and deleted objects show up in them
+PRODUCT_LIST_KEY = "product-list"
+CATEGORY_LIST_KEY = "category-list"
+
+# purged batches end up here when `LocMemPurger` is used, like `mail.outbox`
+outbox = []
+
+
+def product_key(pk):
+    return f"product-{pk}"
+
+
+def category_key(pk):
+    return f"category-{pk}"
+
+
+def product_keys(products):
+    return [product_key(getattr(product, "pk", product)) for product in products]
+
+
+def category_keys(categories):
+    return [category_key(getattr(category, "pk", category)) for category in categories]
+
+
+class BasePurger:
+    """
+    Base class for surrogate-key purgers. Subclasses implement
+    `send_batch()`, batching and error handling live here.
+    """
+
+    def __init__(self, batch_size=None, fail_silently=True):
+        self.batch_size = batch_size or settings.SURROGATE_PURGE_BATCH_SIZE
+        self.fail_silently = fail_silently
+
+    def purge(self, keys):
+        keys = sorted(set(keys))
+        for start in range(0, len(keys), self.batch_size):
+            batch = keys[start:start + self.batch_size]
+            try:
+                self.send_batch(batch)
+            except Exception:
+                if not self.fail_silently:
+                    raise
+                logger.exception("Purging %d surrogate keys failed", len(batch))
+
+    def send_batch(self, keys):
+        raise NotImplementedError("subclasses of BasePurger must override send_batch()")
+
+
+class DummyPurger(BasePurger):
+    def send_batch(self, keys):
+        pass
+
+
+class LocMemPurger(BasePurger):
+    """
+    Keeps the purged batches in `shop.purge.outbox` instead of talking to
+    a proxy, meant for tests and local development.
+    """
+
+    def send_batch(self, keys):
+        outbox.append(keys)
+
+
+class HTTPPurger(BasePurger):
+    """
+    Sends one request per batch to the proxy purge endpoint with the keys
+    space separated in the surrogate key header (Fastly / Varnish xkey style).
+    """
+
+    def __init__(self, url=None, method=None, header=None, timeout=None, **kwargs):
+        super().__init__(**kwargs)
+        self.url = url or settings.SURROGATE_PURGE_URL
+        self.method = method or settings.SURROGATE_PURGE_METHOD
+        self.header = header or settings.SURROGATE_KEY_HEADER
+        self.timeout = timeout or settings.SURROGATE_PURGE_TIMEOUT
+
+    def send_batch(self, keys):
+        request = urllib.request.Request(
+            self.url, method=self.method, headers={self.header: " ".join(keys)}
+        )
+        with urllib.request.urlopen(request, timeout=self.timeout) as response:
+            response.read()
+
+
+def get_purger(backend=None, **kwargs):
+    return import_string(backend or settings.SURROGATE_PURGE_BACKEND)(**kwargs)
+
+
+def purge_keys(keys):
+    """
+    Purge the given keys once the current transaction commits, a rolled
+    back change never reaches the proxy.
+    """
+    keys = set(keys)
+    if keys:
+        transaction.on_commit(partial(get_purger().purge, keys))
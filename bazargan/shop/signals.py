@@ -0,0 +1,99 @@
+from functools import partial
+
+from django.db import transaction
+from django.db.models.signals import post_save, post_delete, m2m_changed
+from django.dispatch import receiver
+
+from common.images import generate_in_background
+from common.media import track_references
+
+from .cache import bump_catalog_version
+from .summaries import mark_stale
+from .models import Product, ProductCategory, ProductImage, WishlistProduct
+from .purge import purge_keys, product_key, product_keys, category_key, \
+    PRODUCT_LIST_KEY, CATEGORY_LIST_KEY
+
+
+# identical uploads share one file, which is kept until its last row is gone
+track_references(Product, 'image')
+track_references(ProductImage, 'file')
+
+
+def _product_purge_keys(product):
+    keys = [product_key(product.pk)]
+    # a published product may move in or out of any listing page, a draft
+    # one is only on the pages already tagged with its own key
+    if product.is_published():
+        keys.append(PRODUCT_LIST_KEY)
+    return keys
+
+
+@receiver(post_save, sender=Product)
+@receiver(post_delete, sender=Product)
+def purge_product(sender, instance, **kwargs):
+    purge_keys(_product_purge_keys(instance))
+    bump_catalog_version(products=True)
+
+
+@receiver(m2m_changed, sender=Product.category.through)
+def purge_product_categories(sender, instance, action, reverse, pk_set, **kwargs):
+    if action not in ("post_add", "post_remove", "post_clear"):
+        return
+    keys = [PRODUCT_LIST_KEY]
+    if reverse:
+        keys.append(category_key(instance.pk))
+        keys.extend(product_keys(pk_set or []))
+    else:
+        keys.append(product_key(instance.pk))
+    purge_keys(keys)
+    bump_catalog_version(products=True)
+
+
+@receiver(post_save, sender=ProductCategory)
+@receiver(post_delete, sender=ProductCategory)
+def purge_category(sender, instance, created=False, **kwargs):
+    keys = [category_key(instance.pk)]
+    if created:
+        keys.append(CATEGORY_LIST_KEY)
+    purge_keys(keys)
+    bump_catalog_version(categories=True)
+
+
+@receiver(post_save, sender=ProductImage)
+@receiver(post_delete, sender=ProductImage)
+def purge_product_image(sender, instance, **kwargs):
+    purge_keys([product_key(instance.product_id)])
+
+
+@receiver(post_save, sender=Product)
+def generate_product_image_derivatives(sender, instance, raw=False, **kwargs):
+    if not raw:
+        transaction.on_commit(partial(generate_in_background, [instance.image.name]))
+
+
+@receiver(post_save, sender=ProductImage)
+def generate_gallery_image_derivatives(sender, instance, raw=False, **kwargs):
+    if not raw:
+        transaction.on_commit(partial(generate_in_background, [instance.file.name]))
+
+
+@receiver(post_delete, sender=Product)
+def summarize_deleted_product(sender, instance, **kwargs):
+    mark_stale([instance.pk])
+
+
+@receiver(m2m_changed, sender=Product.category.through)
+def summarize_product_categories(sender, instance, action, reverse, pk_set, **kwargs):
+    if action not in ("post_add", "post_remove", "post_clear"):
+        return
+    if not reverse:
+        mark_stale([instance.pk])
+    elif pk_set:
+        mark_stale(pk_set)
+
+
+@receiver(post_save, sender=WishlistProduct)
+@receiver(post_delete, sender=WishlistProduct)
+def summarize_wishlist(sender, instance, created=True, **kwargs):
+    if created:
+        mark_stale([instance.product_id])
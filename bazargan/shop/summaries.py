@@ -0,0 +1,197 @@
+import heapq
+import itertools
+import logging
+import time
+from collections import defaultdict
+from datetime import timedelta
+from decimal import Decimal
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, F
+from django.utils import timezone
+
+from common.bulk import batched
+
+from .models import Product, ProductCategory, ProductStatusType, WishlistProduct, \
+    CatalogSummary, CatalogSnapshot, CatalogSummaryRefresh, SummaryDimension
+
+
+logger = logging.getLogger(__name__)
+
+SNAPSHOT_FIELDS = ("status", "stock", "price", "discount_percent")
+
+
+def mark_stale(product_ids):
+    """
+    Have the next refresh recount products whose change doesn't touch
+    their `updated_date`: wishlists, categories and deletions.
+    """
+    CatalogSnapshot.objects.filter(pk__in=product_ids, stale=False).update(stale=True)
+
+
+def _summary_keys(snapshot):
+    yield SummaryDimension.status.value, snapshot.status
+    yield SummaryDimension.discount.value, snapshot.discount_percent
+    for category_id in snapshot.categories:
+        yield SummaryDimension.category.value, category_id
+
+
+def _add(deltas, snapshot, sign):
+    values = (1, snapshot.stock, snapshot.price * snapshot.stock, snapshot.wishlists)
+    for key in _summary_keys(snapshot):
+        delta = deltas[key]
+        for index, value in enumerate(values):
+            delta[index] += sign * value
+
+
+def _current_snapshots(pks):
+    snapshots = {
+        pk: CatalogSnapshot(product_id=pk, **dict(zip(SNAPSHOT_FIELDS, values)))
+        for pk, *values in Product.objects.filter(pk__in=pks).values_list("pk", *SNAPSHOT_FIELDS)
+    }
+    categories = Product.category.through.objects.filter(product_id__in=snapshots).order_by("productcategory_id")
+    for product_id, category_id in categories.values_list("product_id", "productcategory_id"):
+        snapshots[product_id].categories.append(category_id)
+    wishlists = (
+        WishlistProduct.objects.filter(product_id__in=snapshots)
+        .order_by().values("product_id").annotate(count=Count("id"))
+    )
+    for product_id, count in wishlists.values_list("product_id", "count"):
+        snapshots[product_id].wishlists = count
+    return snapshots
+
+
+def _apply(deltas):
+    deltas = {key: delta for key, delta in deltas.items() if any(delta)}
+    CatalogSummary.objects.bulk_create(
+        [CatalogSummary(dimension=dimension, key=key) for dimension, key in deltas],
+        ignore_conflicts=True,
+    )
+    for (dimension, key), (products, stock, stock_value, wishlists) in deltas.items():
+        CatalogSummary.objects.filter(dimension=dimension, key=key).update(
+            products=F("products") + products,
+            stock=F("stock") + stock,
+            stock_value=F("stock_value") + stock_value,
+            wishlists=F("wishlists") + wishlists,
+        )
+    CatalogSummary.objects.filter(products=0).delete()
+
+
+def refresh_chunk(pks):
+    """
+    Replace what the given products contributed to the summaries with
+    their current values. Overlapping refreshes of the same products are
+    serialized by the row locks: the product rows first, so a product
+    without a snapshot yet is only added once, then the snapshots.
+    """
+    with transaction.atomic():
+        list(Product.objects.select_for_update().filter(pk__in=pks).order_by("pk").values_list("pk", flat=True))
+        # locked, a concurrent `mark_stale` waits and flags the new snapshot
+        old = CatalogSnapshot.objects.select_for_update().in_bulk(pks)
+        new = _current_snapshots(pks)
+
+        deltas = defaultdict(lambda: [0, 0, Decimal(0), 0])
+        for snapshot in old.values():
+            _add(deltas, snapshot, -1)
+        for snapshot in new.values():
+            _add(deltas, snapshot, 1)
+        _apply(deltas)
+
+        CatalogSnapshot.objects.filter(pk__in=old.keys() - new.keys()).delete()
+        CatalogSnapshot.objects.bulk_create(
+            new.values(),
+            update_conflicts=True,
+            unique_fields=["product_id"],
+            update_fields=[*SNAPSHOT_FIELDS, "categories", "wishlists", "stale"],
+        )
+
+
+def refresh_summaries(full=False, chunk_size=None, progress=None):
+    """
+    Bring the summaries up to date with the products updated since the
+    last refresh, or with all of them when `full` or on the first run.
+    A full rebuild empties the summaries first and fills them chunk by
+    chunk, the dashboard shows partial figures until it finishes.
+    """
+    chunk_size = chunk_size or settings.CATALOG_SUMMARY_CHUNK_SIZE
+    started = timezone.now()
+    timer = time.perf_counter()
+    last = CatalogSummaryRefresh.objects.first()
+
+    if full or last is None:
+        full = True
+        with transaction.atomic():
+            CatalogSummary.objects.all().delete()
+            CatalogSnapshot.objects.all().delete()
+        changed = Product.objects.all()
+    else:
+        changed = Product.objects.filter(updated_date__gte=last.watermark)
+    changed = changed.order_by("pk").values_list("pk", flat=True).iterator(chunk_size=chunk_size)
+    stale = CatalogSnapshot.objects.filter(stale=True).order_by("pk").values_list("pk", flat=True).iterator(chunk_size=chunk_size)
+    # both come sorted, merge them without repeating a product in both
+    pks = (pk for pk, _ in itertools.groupby(heapq.merge(changed, stale)))
+
+    refresh = CatalogSummaryRefresh(
+        started=started,
+        watermark=started - timedelta(seconds=settings.CATALOG_SUMMARY_OVERLAP),
+        full=full,
+    )
+    for _, chunk in batched(pks, chunk_size):
+        refresh_chunk(chunk)
+        refresh.products += len(chunk)
+        refresh.elapsed = time.perf_counter() - timer
+        logger.info("%d products summarized after %.1fs", refresh.products, refresh.elapsed)
+        if progress is not None:
+            progress(refresh)
+
+    refresh.elapsed = time.perf_counter() - timer
+    refresh.save()
+    return refresh
+
+
+def dashboard(top=10):
+    """
+    The dashboard's figures, read from the summary tables only.
+    """
+    rows = defaultdict(list)
+    for row in CatalogSummary.objects.order_by("dimension", "key"):
+        rows[row.dimension].append(row)
+
+    statuses = dict(ProductStatusType.choices)
+    for row in rows[SummaryDimension.status.value]:
+        row.label = statuses.get(row.key, row.key)
+    for row in rows[SummaryDimension.discount.value]:
+        row.label = f"{row.key}%"
+    # rows of deleted categories stay until the next full refresh
+    titles = dict(
+        ProductCategory.objects.filter(pk__in=[row.key for row in rows[SummaryDimension.category.value]])
+        .values_list("pk", "title")
+    )
+    categories = []
+    for row in rows[SummaryDimension.category.value]:
+        if row.key in titles:
+            row.label = titles[row.key]
+            categories.append(row)
+    categories.sort(key=lambda row: row.products, reverse=True)
+
+    totals = CatalogSummary()
+    for row in rows[SummaryDimension.status.value]:
+        totals.products += row.products
+        totals.stock += row.stock
+        totals.stock_value += row.stock_value
+        totals.wishlists += row.wishlists
+
+    most_wished = list(CatalogSnapshot.objects.filter(wishlists__gt=0).order_by("-wishlists")[:top])
+    products = Product.objects.only("title", "slug").in_bulk([snapshot.product_id for snapshot in most_wished])
+    for snapshot in most_wished:
+        snapshot.product = products.get(snapshot.product_id)
+
+    return {
+        "totals": totals,
+        "statuses": rows[SummaryDimension.status.value],
+        "discounts": rows[SummaryDimension.discount.value],
+        "categories": categories,
+        "most_wished": [snapshot for snapshot in most_wished if snapshot.product],
+        "refresh": CatalogSummaryRefresh.objects.first(),
+    }
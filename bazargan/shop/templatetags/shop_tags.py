@@ -1,25 +1,81 @@
 from django import template
+from django.conf import settings
+from django.template.loader import render_to_string
+from django.utils.safestring import mark_safe
+
+from common.cache import get_or_compute, fragment_cache_version
+from common.surrogate import add_surrogate_keys
+
+from ..cache import catalog_key
 from ..models import Product, ProductStatusType, WishlistProduct
+from ..purge import product_keys, category_keys, PRODUCT_LIST_KEY
 
 register = template.Library()
 
-@register.inclusion_tag("includes/latest-products.html", takes_context=True)
+
+def _render_products_fragment(request, fragment_name, vary_on, template_name, context_name, get_products):
+    """
+    Render a product strip through the fragment cache. The cached fragment
+    is the same for every user, their wishlist state is applied on top of it.
+    """
+    is_authenticated = request.user.is_authenticated
+
+    def render():
+        products = list(get_products())
+        return {
+            "html": render_to_string(template_name, {context_name: products, "request": request}),
+            "product_ids": [product.id for product in products],
+            "surrogate_keys": [
+                PRODUCT_LIST_KEY,
+                *product_keys(products),
+                *category_keys({category for product in products for category in product.category.all()}),
+            ],
+        }
+
+    fragment = get_or_compute(
+        catalog_key(fragment_name, fragment_cache_version(), is_authenticated, *vary_on),
+        render,
+        settings.FRAGMENT_CACHE_TIMEOUT,
+        name=fragment_name,
+    )
+    add_surrogate_keys(request, *fragment["surrogate_keys"])
+    html = fragment["html"]
+    if is_authenticated and fragment["product_ids"]:
+        wishlist_items = WishlistProduct.objects.filter(
+            user=request.user, product__id__in=fragment["product_ids"]
+        ).values_list('product__id', flat=True)
+        html += render_to_string("includes/wishlist-state.html", {"wishlist_items": list(wishlist_items)})
+    return mark_safe(html)
+
+
+@register.simple_tag(takes_context=True)
 def show_latest_products(context):
-    request = context.get("request")
-    latest_products = Product.objects.filter(
-        status=ProductStatusType.publish.value
-    ).order_by("-created_date")[:8]
-    wishlist_items = WishlistProduct.objects.filter(user=request.user).values_list('product__id', flat=True) if request.user.is_authenticated else []
-    return {"latest_products": latest_products, "request": request, 'wishlist_items': wishlist_items}
-
-@register.inclusion_tag("includes/similar-products.html", takes_context=True )
+    return _render_products_fragment(
+        context.get("request"),
+        "latest-products",
+        [],
+        "includes/latest-products.html",
+        "latest_products",
+        lambda: Product.objects.filter(
+            status=ProductStatusType.publish.value
+        ).prefetch_related("category").order_by("-created_date")[:8],
+    )
+
+
+@register.simple_tag(takes_context=True)
 def show_similar_products(context, product):
-    request = context.get("request")
-    product_categories = product.category.all()
-    similar_products = Product.objects.filter(
-        status=ProductStatusType.publish.value,
-        category__in=product_categories,
-    ).distinct().exclude(id=product.id).order_by("-created_date")[:4]
-    wishlist_items = WishlistProduct.objects.filter(user=request.user).values_list('product__id', flat=True) if request.user.is_authenticated else []
-
-    return {"similar_products": similar_products, "request": request, 'wishlist_items': wishlist_items}
+    def get_similar_products():
+        product_categories = product.category.all()
+        return Product.objects.filter(
+            status=ProductStatusType.publish.value,
+            category__in=product_categories,
+        ).distinct().exclude(id=product.id).prefetch_related("category").order_by("-created_date")[:4]
+
+    return _render_products_fragment(
+        context.get("request"),
+        "similar-products",
+        [product.id],
+        "includes/similar-products.html",
+        "similar_products",
+        get_similar_products,
+    )
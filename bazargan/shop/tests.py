@@ -1,3 +1,608 @@
-from django.test import TestCase
+import csv
+import os
+import random
+import tempfile
+from io import BytesIO, StringIO
+from unittest import mock
 
-# Create your tests here.
+from django.contrib.auth import get_user_model
+from django.contrib.admin.helpers import ACTION_CHECKBOX_NAME
+from django.contrib.auth.models import AnonymousUser
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import connection, transaction
+from django.template import Context, Template
+from django.test import RequestFactory, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils.http import http_date
+from faker import Faker
+from PIL import Image
+
+from common.models import MediaFile
+from common.testing import TestCase
+
+from . import maintenance, purge, summaries
+from .admin import ProductAdmin
+from .importers import ProductImporter
+from .management.commands import generate_catalog, warmup
+from .models import Product, ProductCategory, ProductStatusType, WishlistProduct, \
+    CatalogSummary, CatalogSummaryRefresh, SummaryDimension
+
+
+User = get_user_model()
+
+
+class CatalogTestCase(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('seller@example.com', 'Passw0rd!')
+        cls.category = ProductCategory.objects.create(title='Phones', slug='phones')
+
+    def setUp(self):
+        super().setUp()
+        purge.outbox.clear()
+
+    def create_product(self, slug, **fields):
+        fields = {
+            'title': slug, 'description': slug, 'status': ProductStatusType.publish.value,
+            'price': 1000, 'stock': 1, **fields,
+        }
+        with self.captureOnCommitCallbacks(execute=True):
+            product = Product.objects.create(user=self.user, slug=slug, **fields)
+            product.category.add(self.category)
+        return product
+
+
+class ConditionalGetTests(CatalogTestCase):
+    def setUp(self):
+        super().setUp()
+        self.first = self.create_product('first')
+        self.second = self.create_product('second')
+
+    def test_grid_matching_etag_is_not_modified(self):
+        url = reverse('shop:product-grid')
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn('Last-Modified', response.headers)
+
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=response.headers['ETag'])
+        self.assertEqual(response.status_code, 304)
+
+    def test_grid_etag_changes_when_a_product_is_deleted(self):
+        url = reverse('shop:product-grid')
+        etag = self.client.get(url).headers['ETag']
+        with self.captureOnCommitCallbacks(execute=True):
+            self.second.delete()
+
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag, HTTP_IF_MODIFIED_SINCE=http_date())
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response.headers['ETag'], etag)
+
+    def test_grid_if_modified_since_alone_is_not_validated(self):
+        response = self.client.get(reverse('shop:product-grid'), HTTP_IF_MODIFIED_SINCE=http_date())
+        self.assertEqual(response.status_code, 200)
+
+    def test_grid_etag_changes_when_a_product_leaves_the_category(self):
+        url = reverse('shop:product-grid') + f'?category_id={self.category.pk}'
+        etag = self.client.get(url).headers['ETag']
+        with self.captureOnCommitCallbacks(execute=True):
+            self.first.category.remove(self.category)
+
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+
+    def test_detail_matching_etag_is_not_modified(self):
+        url = reverse('shop:product-detail', kwargs={'slug': self.first.slug})
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=response.headers['ETag'])
+        self.assertEqual(response.status_code, 304)
+
+    def test_detail_etag_changes_when_the_product_is_edited(self):
+        url = reverse('shop:product-detail', kwargs={'slug': self.first.slug})
+        etag = self.client.get(url).headers['ETag']
+        self.first.price = 2000
+        with self.captureOnCommitCallbacks(execute=True):
+            self.first.save()
+
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+
+
+class SurrogateKeyTests(CatalogTestCase):
+    def purged(self):
+        return {key for batch in purge.outbox for key in batch}
+
+    def test_detail_page_is_tagged_with_its_product_and_categories(self):
+        product = self.create_product('tagged')
+        response = self.client.get(reverse('shop:product-detail', kwargs={'slug': product.slug}))
+        keys = response.headers['Surrogate-Key'].split()
+        self.assertIn(purge.product_key(product.pk), keys)
+        self.assertIn(purge.category_key(self.category.pk), keys)
+
+    def test_grid_page_is_tagged_with_the_listing(self):
+        self.create_product('listed')
+        response = self.client.get(reverse('shop:product-grid'))
+        self.assertIn(purge.PRODUCT_LIST_KEY, response.headers['Surrogate-Key'].split())
+
+    def test_saving_a_published_product_purges_it_and_the_listings(self):
+        product = self.create_product('published')
+        purge.outbox.clear()
+        product.stock = 5
+        with self.captureOnCommitCallbacks(execute=True):
+            product.save()
+        self.assertEqual(self.purged(), {purge.product_key(product.pk), purge.PRODUCT_LIST_KEY})
+
+    def test_saving_a_draft_purges_only_its_own_pages(self):
+        product = self.create_product('draft', status=ProductStatusType.draft.value)
+        purge.outbox.clear()
+        with self.captureOnCommitCallbacks(execute=True):
+            product.save()
+        self.assertEqual(self.purged(), {purge.product_key(product.pk)})
+
+    def test_rolled_back_change_purges_nothing(self):
+        product = self.create_product('rolled-back')
+        purge.outbox.clear()
+        with self.captureOnCommitCallbacks(execute=True):
+            try:
+                with transaction.atomic():
+                    product.save()
+                    raise RuntimeError
+            except RuntimeError:
+                pass
+        self.assertEqual(purge.outbox, [])
+
+    def test_keys_are_purged_in_batches(self):
+        purge.LocMemPurger(batch_size=2).purge(['c', 'a', 'b', 'a', 'd', 'e'])
+        self.assertEqual(purge.outbox, [['a', 'b'], ['c', 'd'], ['e']])
+
+
+@override_settings(SHARED_CACHE_ANONYMOUS_PAGES=True, SHARED_CACHE_MAX_AGE=60)
+class AnonymousSharedCacheTests(CatalogTestCase):
+    def setUp(self):
+        super().setUp()
+        self.product = self.create_product('shared')
+
+    def test_anonymous_page_is_public_and_session_free(self):
+        response = self.client.get(reverse('shop:product-detail', kwargs={'slug': self.product.slug}))
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('public', response.headers['Cache-Control'])
+        self.assertIn('max-age=60', response.headers['Cache-Control'])
+        self.assertNotIn('Cookie', response.headers.get('Vary', ''))
+        self.assertFalse(response.cookies)
+        self.assertNotContains(response, 'name="csrfmiddlewaretoken" value=')
+
+    def test_logged_in_page_is_not_public(self):
+        self.client.force_login(self.user)
+        response = self.client.get(reverse('shop:product-grid'))
+        self.assertNotIn('public', response.headers.get('Cache-Control', ''))
+        self.assertIn('Cookie', response.headers['Vary'])
+
+    def test_session_state_carries_what_the_page_left_out(self):
+        response = self.client.get(reverse('shop:session-state'), HTTP_X_REQUESTED_WITH='XMLHttpRequest')
+        self.assertIn('no-cache', response.headers['Cache-Control'])
+        data = response.json()['data']
+        self.assertTrue(data['csrf_token'])
+        self.assertFalse(data['is_authenticated'])
+        self.assertEqual(data['wishlist'], [])
+
+
+class ProductFragmentTests(CatalogTestCase):
+    template = Template('{% load shop_tags %}{% show_latest_products %}')
+
+    def render(self):
+        request = RequestFactory().get('/')
+        request.user = AnonymousUser()
+        return self.template.render(Context({'request': request}))
+
+    def test_strip_is_served_from_the_cache(self):
+        self.create_product('cached')
+        html = self.render()
+        with self.assertNumQueries(0):
+            self.assertEqual(self.render(), html)
+
+    def test_strip_changes_with_the_catalog(self):
+        self.create_product('older')
+        self.assertNotIn('newer', self.render())
+        self.create_product('newer')
+        self.assertIn('newer', self.render())
+
+
+class WarmupTests(CatalogTestCase):
+    def test_busiest_pages_are_warmed(self):
+        products = [self.create_product(f'warm-{number}') for number in range(3)]
+        self.create_product('draft', status=ProductStatusType.draft.value)
+        out = StringIO()
+        with mock.patch(
+            'shop.management.commands.warmup.Command.fetch', return_value=(200, 0.01)
+        ) as fetch:
+            call_command('warmup', skip_images=True, workers=1, products=2, stdout=out)
+
+        urls = [call.args[1] for call in fetch.call_args_list]
+        self.assertIn(reverse('website:index'), urls)
+        self.assertIn(reverse('shop:product-grid') + '?page=1', urls)
+        self.assertIn(reverse('shop:product-grid') + f'?category_id={self.category.pk}&page=1', urls)
+        details = [url for url in urls if url.endswith('/detail/')]
+        self.assertEqual(len(details), 2)
+        self.assertNotIn(reverse('shop:product-detail', kwargs={'slug': 'draft'}), urls)
+        self.assertIn(reverse('shop:product-detail', kwargs={'slug': products[-1].slug}), urls)
+        self.assertIn(f'Warmed {len(urls)} pages', out.getvalue())
+
+    def test_failed_pages_are_reported(self):
+        self.create_product('broken')
+        err = StringIO()
+        with mock.patch('shop.management.commands.warmup.Command.fetch', return_value=(500, 0.01)):
+            call_command('warmup', skip_images=True, workers=1, stdout=StringIO(), stderr=err)
+        self.assertIn('answered 500', err.getvalue())
+
+    @mock.patch('shop.management.commands.warmup.connections.close_all')
+    def test_page_that_raises_is_a_failure(self, close_all):
+        product = self.create_product('raises')
+        url = reverse('shop:product-detail', kwargs={'slug': product.slug})
+        with mock.patch('shop.views.ProductDetailView.get', side_effect=RuntimeError), \
+                self.assertLogs('django.request', 'ERROR'):
+            status, _ = warmup.Command().fetch('testserver', url)
+        self.assertEqual(status, 500)
+
+
+class ContentAddressedUploadTests(CatalogTestCase):
+    def upload(self, color='red'):
+        buffer = BytesIO()
+        Image.new('RGB', (8, 8), color).save(buffer, format='PNG')
+        return SimpleUploadedFile('photo.png', buffer.getvalue(), content_type='image/png')
+
+    def test_identical_uploads_share_one_file(self):
+        first = self.create_product('first', image=self.upload())
+        second = self.create_product('second', image=self.upload())
+        self.assertEqual(first.image.name, second.image.name)
+        self.assertTrue(first.image.name.startswith('product/img/'))
+        self.assertEqual(MediaFile.objects.get(name=first.image.name).references, 2)
+
+    def test_file_is_deleted_with_its_last_reference(self):
+        first = self.create_product('first', image=self.upload())
+        second = self.create_product('second', image=self.upload())
+        name, storage = first.image.name, first.image.storage
+
+        with self.captureOnCommitCallbacks(execute=True):
+            first.delete()
+        self.assertTrue(storage.exists(name))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            second.delete()
+        self.assertFalse(storage.exists(name))
+        self.assertFalse(MediaFile.objects.filter(name=name).exists())
+
+    def test_replacing_the_image_releases_the_old_one(self):
+        product = self.create_product('replaced', image=self.upload())
+        old_name = product.image.name
+        product.image = self.upload('blue')
+        with self.captureOnCommitCallbacks(execute=True):
+            product.save()
+        self.assertNotEqual(product.image.name, old_name)
+        self.assertFalse(product.image.storage.exists(old_name))
+        self.assertEqual(MediaFile.objects.get(name=product.image.name).references, 1)
+
+
+@mock.patch('shop.management.commands.generate_catalog.connections.close_all')
+class GenerateCatalogTests(CatalogTestCase):
+    def job(self, **overrides):
+        customer = User.objects.create_user('customer@example.com', None)
+        return {
+            'seed': 7,
+            'start': 0,
+            'stop': 20,
+            'owner_id': self.user.pk,
+            'images': ['product/img/a.jpg', 'product/img/b.jpg'],
+            'category_ids': [self.category.pk],
+            'user_ids': [customer.pk],
+            'wishlists': 0.5,
+            'locale': 'en_US',
+            'batch_size': 100,
+            **overrides,
+        }
+
+    def generated(self):
+        return list(Product.objects.order_by('slug').values_list('slug', 'price', 'stock', 'status', 'image'))
+
+    def test_a_seed_generates_the_same_batch(self, close_all):
+        job = self.job()
+        result = generate_catalog._generate_products(job)
+        self.assertEqual(result['products'], 20)
+        self.assertEqual(result['wishlists'], 10)
+        self.assertEqual(sum(result['images'].values()), 20)
+        first = self.generated()
+        self.assertEqual(Product.category.through.objects.count(), 20)
+
+        Product.objects.all().delete()
+        generate_catalog._generate_products(job)
+        self.assertEqual(self.generated(), first)
+
+    def test_rerun_only_fills_in_missing_products(self, close_all):
+        job = self.job()
+        generate_catalog._generate_products({**job, 'stop': 10})
+        result = generate_catalog._generate_products(job)
+        self.assertEqual(result['products'], 10)
+        self.assertEqual(Product.objects.count(), 20)
+
+    def test_a_seed_generates_the_same_category_tree(self, close_all):
+        def tree():
+            command = generate_catalog.Command()
+            options = {'seed': 7, 'categories': 12, 'depth': 3, 'batch_size': 100}
+            fake = Faker(locale='en_US')
+            fake.seed_instance(7)
+            ids = command.generate_categories(random.Random(7), fake, options)
+            # drawn from in id order whatever the query plan
+            self.assertEqual(ids, sorted(ids))
+            generated = ProductCategory.objects.filter(pk__in=ids)
+            return dict(generated.values_list('slug', 'parent__slug'))
+
+        first = tree()
+        ProductCategory.objects.exclude(pk=self.category.pk).delete()
+        self.assertEqual(tree(), first)
+
+    def test_categories_are_split_over_the_levels(self, close_all):
+        sizes = generate_catalog.Command().level_sizes(50, 3)
+        self.assertEqual(len(sizes), 3)
+        self.assertEqual(sum(sizes), 50)
+        self.assertEqual(sizes, sorted(sizes))
+
+
+class ProductImportTests(CatalogTestCase):
+    def import_rows(self, rows, batch_size=100):
+        with self.captureOnCommitCallbacks(execute=True):
+            return list(ProductImporter(self.user, batch_size=batch_size).run(iter(rows)))
+
+    def test_rows_are_upserted_by_slug(self):
+        self.create_product('existing')
+        results = self.import_rows([
+            {'slug': 'existing', 'stock': '9', 'categories': ''},
+            {'slug': 'new', 'title': 'New', 'description': 'new', 'price': '5000', 'status': 'publish',
+             'categories': 'phones'},
+        ])
+        self.assertEqual((results[0].created, results[0].updated, results[0].errors), (1, 1, []))
+
+        existing = Product.objects.get(slug='existing')
+        # absent columns keep their stored values
+        self.assertEqual((existing.stock, existing.title, existing.price), (9, 'existing', 1000))
+        # so do the categories of an empty cell
+        self.assertEqual(list(existing.category.all()), [self.category])
+        new = Product.objects.get(slug='new')
+        self.assertEqual((new.price, new.status, new.user), (5000, ProductStatusType.publish.value, self.user))
+        self.assertEqual(list(new.category.all()), [self.category])
+
+    def test_invalid_rows_are_reported_and_skipped(self):
+        results = self.import_rows([
+            {'slug': '', 'title': 'No slug'},
+            {'slug': 'no-title'},
+            {'slug': 'bad-stock', 'title': 'Bad', 'stock': 'many'},
+            {'slug': 'bad-category', 'title': 'Bad', 'categories': 'missing'},
+            {'slug': 'good', 'title': 'Good', 'description': 'good'},
+        ])
+        self.assertEqual(results[0].created, 1)
+        self.assertEqual(sorted(record for record, _ in results[0].errors), [1, 2, 3, 4])
+        self.assertEqual(list(Product.objects.values_list('slug', flat=True)), ['good'])
+
+    def test_import_is_batched_and_purges_the_listings(self):
+        results = self.import_rows(
+            [{'slug': f'product-{index}', 'title': 'Product', 'description': 'x'} for index in range(5)],
+            batch_size=2,
+        )
+        self.assertEqual([result.created for result in results], [2, 2, 1])
+        self.assertIn(purge.PRODUCT_LIST_KEY, {key for batch in purge.outbox for key in batch})
+
+    def test_command_reads_csv(self):
+        with tempfile.NamedTemporaryFile('w', suffix='.csv', delete=False) as f:
+            f.write('slug,title,description,categories\nfrom-csv,From CSV,text,phones\n')
+        self.addCleanup(os.remove, f.name)
+        out = StringIO()
+        call_command('import_products', f.name, owner=self.user.email, stdout=out)
+        self.assertIn('1 created, 0 updated, 0 errors', out.getvalue())
+        self.assertTrue(Product.objects.filter(slug='from-csv', category=self.category).exists())
+
+
+class AdminTestCase(CatalogTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.admin = User.objects.create_superuser('admin@example.com', 'Passw0rd!')
+
+    def setUp(self):
+        super().setUp()
+        self.client.force_login(self.admin)
+
+
+class ProductExportTests(AdminTestCase):
+    def read_csv(self, response):
+        self.assertEqual(response['Content-Type'], 'text/csv; charset=utf-8')
+        content = b''.join(response.streaming_content).decode('utf-8-sig')
+        return list(csv.DictReader(content.splitlines()))
+
+    def test_export_follows_the_changelist_filters(self):
+        self.create_product('published')
+        self.create_product('draft', status=ProductStatusType.draft.value)
+        response = self.client.get(
+            reverse('admin:shop_product_export') + f'?status__exact={ProductStatusType.publish.value}'
+        )
+        rows = self.read_csv(response)
+        self.assertEqual([row['slug'] for row in rows], ['published'])
+        self.assertEqual(list(rows[0]), list(ProductAdmin.export_fields))
+
+    def test_export_selected_action_escapes_formulas(self):
+        product = self.create_product('formula')
+        Product.objects.filter(pk=product.pk).update(title='=HYPERLINK("x")')
+        self.create_product('not-selected')
+        response = self.client.post(reverse('admin:shop_product_changelist'), {
+            'action': 'export_csv', ACTION_CHECKBOX_NAME: [product.pk],
+        })
+        rows = self.read_csv(response)
+        self.assertEqual([row['title'] for row in rows], ['\'=HYPERLINK("x")'])
+
+    def test_export_needs_view_permission(self):
+        staff = User.objects.create_user('staff@example.com', 'Passw0rd!', is_staff=True)
+        self.client.force_login(staff)
+        response = self.client.get(reverse('admin:shop_product_export'))
+        self.assertEqual(response.status_code, 403)
+
+
+class ChangelistTests(AdminTestCase):
+    def changelist_queries(self, url):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return len(queries)
+
+    def test_wishlist_changelist_queries_do_not_grow_with_rows(self):
+        url = reverse('admin:shop_wishlistproduct_changelist')
+        WishlistProduct.objects.create(user=self.user, product=self.create_product('first'))
+        # the first request fills the content type and session caches
+        self.changelist_queries(url)
+        before = self.changelist_queries(url)
+        for slug in ('second', 'third'):
+            WishlistProduct.objects.create(user=self.user, product=self.create_product(slug))
+        self.assertEqual(self.changelist_queries(url), before)
+
+    def test_product_search_is_a_prefix_search(self):
+        self.create_product('iphone', title='iPhone 15')
+        self.create_product('case', title='Case for iPhone')
+        response = self.client.get(reverse('admin:shop_product_changelist') + '?q=iPhone')
+        self.assertEqual([product.slug for product in response.context['cl'].result_list], ['iphone'])
+
+    def test_full_result_count_is_not_run(self):
+        response = self.client.get(reverse('admin:shop_product_changelist') + '?q=x')
+        self.assertIsNone(response.context['cl'].full_result_count)
+
+
+class MaintenanceTests(CatalogTestCase):
+    def setUp(self):
+        super().setUp()
+        self.products = [self.create_product(f'product-{i}', stock=i) for i in range(5)]
+        purge.outbox.clear()
+
+    def run_in_chunks(self, operation, *args, **kwargs):
+        with self.captureOnCommitCallbacks(execute=True):
+            return operation(Product.objects.all(), *args, chunk_size=2, **kwargs)
+
+    def test_update_runs_in_chunks_and_purges_once(self):
+        progress = []
+        result = self.run_in_chunks(
+            maintenance.update_products, progress=lambda r: progress.append(r.rows), discount_percent=10,
+        )
+        self.assertEqual((result.rows, result.chunks), (5, 3))
+        self.assertEqual(progress, [2, 4, 5])
+        self.assertEqual(set(Product.objects.values_list('discount_percent', flat=True)), {10})
+        self.assertEqual(
+            {key for batch in purge.outbox for key in batch},
+            {purge.PRODUCT_LIST_KEY, *(purge.product_key(product.pk) for product in self.products)},
+        )
+
+    def test_update_moves_updated_date(self):
+        before = self.products[0].updated_date
+        self.run_in_chunks(maintenance.update_products, status=ProductStatusType.draft.value)
+        self.assertGreater(Product.objects.get(pk=self.products[0].pk).updated_date, before)
+
+    def test_stock_decrease_stops_at_zero(self):
+        self.run_in_chunks(maintenance.adjust_stock, -2)
+        self.assertEqual(list(Product.objects.order_by('pk').values_list('stock', flat=True)), [0, 0, 0, 1, 2])
+
+    def test_categories_are_added_and_removed(self):
+        laptops = ProductCategory.objects.create(title='Laptops', slug='laptops')
+        self.run_in_chunks(maintenance.add_categories, [laptops, self.category])
+        self.assertEqual(laptops.product_set.count(), 5)
+        self.assertEqual(self.category.product_set.count(), 5)
+        self.run_in_chunks(maintenance.remove_categories, [self.category])
+        self.assertEqual(self.category.product_set.count(), 0)
+        self.assertEqual(laptops.product_set.count(), 5)
+
+
+class MaintenanceActionTests(AdminTestCase):
+    def setUp(self):
+        super().setUp()
+        self.product = self.create_product('selected')
+        self.other = self.create_product('other')
+
+    def post_action(self, action, **data):
+        with self.captureOnCommitCallbacks(execute=True):
+            return self.client.post(reverse('admin:shop_product_changelist'), {
+                'action': action, ACTION_CHECKBOX_NAME: [self.product.pk], **data,
+            })
+
+    def test_unpublish_updates_only_the_selection(self):
+        response = self.post_action('unpublish')
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(
+            dict(Product.objects.values_list('slug', 'status')),
+            {'selected': ProductStatusType.draft.value, 'other': ProductStatusType.publish.value},
+        )
+
+    def test_discount_asks_for_the_percent_first(self):
+        response = self.post_action('set_discount')
+        self.assertEqual(response.status_code, 200)
+        self.assertTemplateUsed(response, 'admin/shop/product/bulk_action.html')
+        self.assertEqual(response.context['count'], 1)
+
+        response = self.post_action('set_discount', apply='1', discount_percent='150')
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.context['form'].errors)
+
+        response = self.post_action('set_discount', apply='1', discount_percent='25')
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(
+            dict(Product.objects.values_list('slug', 'discount_percent')), {'selected': 25, 'other': 0},
+        )
+
+
+class CatalogSummaryTests(CatalogTestCase):
+    def setUp(self):
+        super().setUp()
+        self.phone = self.create_product('phone', stock=2, price=100)
+        self.draft = self.create_product('draft', stock=1, price=50, status=ProductStatusType.draft.value)
+        summaries.refresh_summaries()
+
+    def summary(self, dimension, key):
+        row = CatalogSummary.objects.filter(dimension=dimension, key=key).first()
+        return row and (row.products, row.stock, row.stock_value, row.wishlists)
+
+    def by_status(self, status):
+        return self.summary(SummaryDimension.status.value, status.value)
+
+    def test_first_refresh_rebuilds_everything(self):
+        self.assertTrue(CatalogSummaryRefresh.objects.first().full)
+        self.assertEqual(self.by_status(ProductStatusType.publish), (1, 2, 200, 0))
+        self.assertEqual(self.by_status(ProductStatusType.draft), (1, 1, 50, 0))
+        self.assertEqual(self.summary(SummaryDimension.category.value, self.category.pk), (2, 3, 250, 0))
+
+    def test_edits_move_the_deltas(self):
+        self.draft.status = ProductStatusType.publish.value
+        self.draft.stock = 4
+        self.draft.save()
+        refresh = summaries.refresh_summaries()
+        self.assertFalse(refresh.full)
+        self.assertEqual(self.by_status(ProductStatusType.publish), (2, 6, 400, 0))
+        self.assertIsNone(self.by_status(ProductStatusType.draft))
+        self.assertEqual(self.summary(SummaryDimension.category.value, self.category.pk), (2, 6, 400, 0))
+
+    def test_deletes_categories_and_wishlists_are_picked_up(self):
+        WishlistProduct.objects.create(user=self.user, product=self.phone)
+        self.draft.category.clear()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.draft.delete()
+        summaries.refresh_summaries()
+        self.assertEqual(self.by_status(ProductStatusType.publish), (1, 2, 200, 1))
+        self.assertIsNone(self.by_status(ProductStatusType.draft))
+        self.assertEqual(self.summary(SummaryDimension.category.value, self.category.pk), (1, 2, 200, 1))
+
+    def test_refreshing_a_chunk_again_changes_nothing(self):
+        before = list(CatalogSummary.objects.order_by('pk').values())
+        summaries.refresh_chunk([self.phone.pk, self.draft.pk])
+        summaries.refresh_chunk([self.phone.pk, self.draft.pk])
+        self.assertEqual(list(CatalogSummary.objects.order_by('pk').values()), before)
+
+    def test_full_rebuild_matches_the_incremental_figures(self):
+        self.phone.stock = 7
+        self.phone.save()
+        summaries.refresh_summaries()
+        incremental = sorted(CatalogSummary.objects.values_list('dimension', 'key', 'products', 'stock'))
+        summaries.refresh_summaries(full=True, chunk_size=1)
+        self.assertEqual(sorted(CatalogSummary.objects.values_list('dimension', 'key', 'products', 'stock')), incremental)
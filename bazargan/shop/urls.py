@@ -8,4 +8,5 @@ urlpatterns = [
     path('product/grid/', views.ProductGridView.as_view(), name='product-grid'),
     re_path(r'product/(?P<slug>[-\w]+)/detail/', views.ProductDetailView.as_view(), name='product-detail'),
     path('add-or-remove-wishlist/', views.AddOrRemoveWishlistView.as_view(), name='add-or-remove-wishlist'),
+    path('session-state/', views.SessionStateView.as_view(), name='session-state'),
 ]
\ No newline at end of file
@@ -1,9 +1,27 @@
-from django.core.exceptions import FieldError
+from django.conf import settings
+from django.contrib import messages
 from django.http.response import JsonResponse
+from django.middleware.csrf import get_token
+from django.utils.decorators import method_decorator
+from django.views.decorators.cache import never_cache
+from django.views.decorators.http import condition
 from django.views.generic import ListView, DetailView
 from django.views import View
+
+from common.cache import get_or_compute
+from common.decorators import shared_cacheable
+from common.mixins import AjaxRequestMixin
+from common.surrogate import add_surrogate_keys
+
+from .cache import catalog_key, CATEGORIES_NAMESPACE
+from .conditional import product_grid_etag, product_detail_etag
+from .filters import filter_products, filter_values
 from .models import Product, ProductCategory, ProductStatusType, WishlistProduct
+from .purge import product_keys, category_keys, PRODUCT_LIST_KEY, CATEGORY_LIST_KEY
 
+
+@shared_cacheable
+@method_decorator(condition(etag_func=product_grid_etag), name='dispatch')
 class ProductGridView(ListView):
     template_name = 'shop/product-grid.html'
     paginate_by = 9
@@ -13,38 +31,69 @@ class ProductGridView(ListView):
         return self.request.GET.get('page_size', self.paginate_by)
 
     def get_queryset(self):
-        queryset = self.queryset
-        if search_q := self.request.GET.get("q"):
-            queryset = queryset.filter(title__icontains=search_q)
-        if category_id := self.request.GET.get("category_id"):
-            queryset = queryset.filter(category__id=category_id)
-        if min_price := self.request.GET.get("min_price"):
-            queryset = queryset.filter(price__gte=min_price)
-        if max_price := self.request.GET.get("max_price"):
-            queryset = queryset.filter(price__lte=max_price)
-        if order_by := self.request.GET.get("order_by"):
-            try:
-                queryset = queryset.order_by(order_by)
-            except FieldError:
-                pass
-        return queryset
+        return filter_products(self.queryset, self.request.GET)
 
+    def get_paginator(self, queryset, *args, **kwargs):
+        paginator = super().get_paginator(queryset, *args, **kwargs)
+        # every page and ordering of a listing shares the same count
+        paginator.count = get_or_compute(
+            catalog_key('grid-count', *filter_values(self.request.GET)),
+            queryset.count,
+            settings.CATALOG_CACHE_TIMEOUT,
+            name='grid-count',
+        )
+        return paginator
+
+    def paginate_queryset(self, queryset, page_size):
+        paginator, page, object_list, is_paginated = super().paginate_queryset(queryset, page_size)
+        page.object_list = get_or_compute(
+            catalog_key(
+                'grid-page',
+                *filter_values(self.request.GET),
+                self.request.GET.get('order_by', ''),
+                page_size,
+                page.number,
+            ),
+            lambda: list(object_list.prefetch_related('category')),
+            settings.CATALOG_CACHE_TIMEOUT,
+            name='grid-page',
+        )
+        return paginator, page, page.object_list, is_paginated
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        context['total_items'] = self.get_queryset().count()
+        context['total_items'] = context['paginator'].count
         context['wishlist_items'] = WishlistProduct.objects.filter(user=self.request.user).values_list('product__id', flat=True) if self.request.user.is_authenticated else []
-        context['categories'] = ProductCategory.objects.all()
+        context['categories'] = get_or_compute(
+            catalog_key('categories', namespaces=(CATEGORIES_NAMESPACE,)),
+            lambda: list(ProductCategory.objects.all()),
+            settings.CATALOG_CACHE_TIMEOUT,
+            name='categories',
+        )
+        add_surrogate_keys(
+            self.request,
+            PRODUCT_LIST_KEY,
+            CATEGORY_LIST_KEY,
+            *product_keys(context['object_list']),
+            *category_keys(context['categories']),
+        )
         return context
 
 
+@shared_cacheable
+@method_decorator(condition(etag_func=product_detail_etag), name='dispatch')
 class ProductDetailView(DetailView):
     template_name = 'shop/product-detail.html'
-    model = Product
+    queryset = Product.objects.prefetch_related('category')
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        context['is_wished'] = WishlistProduct.objects.filter(user=self.request.user, product__id=self.get_object().id).exists() if self.request.user.is_authenticated else False
+        add_surrogate_keys(
+            self.request,
+            *product_keys([self.object]),
+            *category_keys(self.object.category.all()),
+        )
+        context['is_wished'] = WishlistProduct.objects.filter(user=self.request.user, product__id=self.object.id).exists() if self.request.user.is_authenticated else False
         return context
 
 
@@ -62,3 +111,21 @@ class AddOrRemoveWishlistView(View):
                 message = "محصول به لیست علایق اضافه شد"
 
         return JsonResponse({'message': message})
+
+
+@method_decorator(never_cache, name='dispatch')
+class SessionStateView(AjaxRequestMixin, View):
+    """
+    The per-session state left out of pages rendered for the shared cache.
+    """
+    def get(self, request, *args, **kwargs):
+        wishlist = WishlistProduct.objects.filter(user=request.user).values_list('product__id', flat=True) if request.user.is_authenticated else []
+        return self.ajax_success_response(data={
+            'csrf_token': get_token(request),
+            'is_authenticated': request.user.is_authenticated,
+            'messages': [
+                {'message': str(message), 'tags': message.tags}
+                for message in messages.get_messages(request)
+            ],
+            'wishlist': list(wishlist),
+        })
@@ -1,7 +1,10 @@
 from django.shortcuts import render
 from django.views.generic import TemplateView
 
+from common.decorators import shared_cacheable
 
+
+@shared_cacheable
 class IndexView(TemplateView):
     template_name = 'website/index.html'
 